@@ -1,79 +1,120 @@
-import math
-from typing import List
+from typing import List, Optional
 
 
-# noinspection PyMethodMayBeStatic
 class BinaryTree:
-    class TreeNode:
-        def __init__(self, index: int, data: List[str], parent=None):
-            self.id = index
-            self.data = data
-            self.parent = parent
-            self.left = None
-            self.right = None
-
-        def get_left_index(self) -> int:
-            if self.left:
-                return self.left.id
-
-        def get_right_index(self) -> int:
-            if self.right:
-                return self.right.id
-
-        def is_leaf(self) -> bool:
-            return (not self.left) and (not self.right)
-
-        def __repr__(self):
-            return f"TreeNode(id={self.id}, data={self.data})"
-
-    def __init__(self):
-        self.root = None
-        self.nodes = {}
-
-    def add_node(self, id, data):
-        if id == 0:
-            if self.root is not None:
-                raise ValueError("Root already exists.")
-            self.root = self.TreeNode(id, data)
-            self.nodes[id] = self.root
-        else:
-            parent_id = (id - 1) // 2
-            if parent_id not in self.nodes:
-                raise ValueError(f"Parent with ID {parent_id} does not exist.")
-            parent = self.nodes[parent_id]
-            new_node = self.TreeNode(id, data, parent)
-            self.nodes[id] = new_node
-            if id % 2 == 1:
-                if parent.left is not None:
-                    raise ValueError(
-                        f"Node with ID {id} already has a left child.")
-                parent.left = new_node
-            else:
-                if parent.right is not None:
-                    raise ValueError(
-                        f"Node with ID {id} already has a right child.")
-                parent.right = new_node
-
-    def find_node(self, id):
-        return self.nodes.get(id, None)
-
-    def initialize_tree(self, n):
-        for id in range(n):
-            self.add_node(id, None)
-
-    def path_to_leaf(self, leaf_id):
-        path = []
-        current = self.find_node(leaf_id)
-        while current is not None:
-            path.append(current.id)
-            current = current.parent
-        return path[::-1]
+    """
+    Implicit-heap binary tree of fixed-size buckets.
+    Node i has its parent at (i - 1) // 2 and its children at 2i + 1 and 2i + 2, so no per-node objects are needed.
+    All buckets live in one contiguous buffer: bucket i starts at offset i * bucket_size * block_size and holds
+    bucket_size slots of block_size bytes each.
+    """
+
+    def __init__(self, tree_size: int, bucket_size: int, block_size: int, buffer: Optional[memoryview] = None):
+        """
+        :param tree_size: Number of buckets (nodes) in the tree.
+        :param bucket_size: Number of block slots in every bucket.
+        :param block_size: Size in bytes of every block slot.
+        :param buffer: Writable buffer to keep the buckets in (e.g. a memory mapped file). Allocated in memory if None.
+        """
+        self.tree_size = tree_size
+        self.bucket_size = bucket_size
+        self.block_size = block_size
+        self.bucket_bytes = bucket_size * block_size
+        if buffer is None:
+            buffer = bytearray(tree_size * self.bucket_bytes)
+        elif len(buffer) != tree_size * self.bucket_bytes:
+            raise ValueError(f"Buffer must be exactly {tree_size * self.bucket_bytes} bytes.")
+        self.buffer = buffer
+
+    def read_bucket(self, index: int) -> List[bytes]:
+        """
+        Copy the blocks of the bucket at the given index out of the buffer.
+        :param index: Index of the bucket to read.
+        :return: List of the blocks stored in the bucket.
+        """
+        if not 0 <= index < self.tree_size:
+            raise IndexError(f"Bucket index {index} out of range.")
+        start = index * self.bucket_bytes
+        block_size = self.block_size
+        buffer = self.buffer
+        return [bytes(buffer[offset:offset + block_size])
+                for offset in range(start, start + self.bucket_bytes, block_size)]
+
+    def read_bucket_view(self, index: int) -> List[memoryview]:
+        """
+        Return zero-copy views of the blocks of the bucket at the given index.
+        The views reflect later writes to the bucket, so they must be consumed before the bucket is overwritten.
+        :param index: Index of the bucket to read.
+        :return: List of views of the blocks stored in the bucket.
+        """
+        if not 0 <= index < self.tree_size:
+            raise IndexError(f"Bucket index {index} out of range.")
+        start = index * self.bucket_bytes
+        block_size = self.block_size
+        view = memoryview(self.buffer)
+        return [view[offset:offset + block_size] for offset in range(start, start + self.bucket_bytes, block_size)]
+
+    def read_block(self, index: int, slot: int) -> bytes:
+        """
+        Copy a single block out of the buffer.
+        :param index: Index of the bucket holding the block.
+        :param slot: Slot of the block in the bucket.
+        :return: The block stored in the slot.
+        """
+        if not 0 <= index < self.tree_size or not 0 <= slot < self.bucket_size:
+            raise IndexError(f"Block {slot} of bucket {index} out of range.")
+        start = index * self.bucket_bytes + slot * self.block_size
+        return bytes(self.buffer[start:start + self.block_size])
 
-    def get_node_ids_of_level(self, level_index):
+    def read_block_view(self, index: int, slot: int) -> memoryview:
+        """
+        Return a zero-copy view of a single block, valid until its bucket is overwritten.
+        :param index: Index of the bucket holding the block.
+        :param slot: Slot of the block in the bucket.
+        :return: View of the block stored in the slot.
+        """
+        if not 0 <= index < self.tree_size or not 0 <= slot < self.bucket_size:
+            raise IndexError(f"Block {slot} of bucket {index} out of range.")
+        start = index * self.bucket_bytes + slot * self.block_size
+        return memoryview(self.buffer)[start:start + self.block_size]
+
+    def write_bucket(self, index: int, bucket: List[bytes]) -> None:
+        """
+        Copy the given blocks into the slots of the bucket at the given index.
+        :param index: Index of the bucket to write.
+        :param bucket: Blocks to write, exactly bucket_size blocks of block_size bytes each.
+        """
+        if not 0 <= index < self.tree_size:
+            raise IndexError(f"Bucket index {index} out of range.")
+        if len(bucket) != self.bucket_size:
+            raise ValueError(f"Bucket must hold exactly {self.bucket_size} blocks.")
+        data = b''.join(bucket)
+        if len(data) != self.bucket_bytes:
+            raise ValueError(f"Every block must be exactly {self.block_size} bytes.")
+        start = index * self.bucket_bytes
+        self.buffer[start:start + self.bucket_bytes] = data
+
+    ############ Index arithmetic ##############
+
+    @staticmethod
+    def get_parent_index(index: int) -> int:
+        return (index - 1) // 2
+
+    @staticmethod
+    def get_left_index(index: int) -> int:
+        return 2 * index + 1
+
+    @staticmethod
+    def get_right_index(index: int) -> int:
+        return 2 * index + 2
+
+    @staticmethod
+    def get_node_ids_of_level(level_index: int) -> List[int]:
         first_index_in_level = (2 ** level_index) - 1
         return list(range(first_index_in_level, (2 * first_index_in_level) + 1))
 
-    def get_path_to_leaf(self, leaf_index: int, tree_height: int) -> List[int]:
+    @staticmethod
+    def get_path_to_leaf(leaf_index: int, tree_height: int) -> List[int]:
         """
         get list of indices of nodes from root to given leaf
         """
@@ -81,23 +122,9 @@ class BinaryTree:
         curr_node = leaf_index
         for i in range(tree_height + 1):
             path.append(curr_node)
-            curr_node = math.floor((curr_node - 1) / 2)
+            curr_node = (curr_node - 1) // 2
 
         return path[::-1]
 
     def __repr__(self):
-        return f"BinaryTree(root={self.root})"
-
-    def print_tree(self):
-        if not self.root:
-            print("Tree is empty.")
-            return
-
-        self._print_tree_recursive(self.root, 0, "Root")
-
-    def _print_tree_recursive(self, node, level, position):
-        if node:
-            indent = "    " * level
-            print(f"{indent}|- {position}: {node.data}")
-            self._print_tree_recursive(node.left, level + 1, "Left")
-            self._print_tree_recursive(node.right, level + 1, "Right")
+        return f"BinaryTree(tree_size={self.tree_size}, bucket_size={self.bucket_size}, block_size={self.block_size})"
@@ -0,0 +1,221 @@
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+NONCE_SIZE = 8
+TAG_SIZE = 32
+AES_BLOCK_SIZE = 16
+
+
+class BucketCipher:
+    """
+    Encrypts and authenticates many blocks in one call.
+    Every block keeps its own format: nonce || AES-CTR ciphertext || HMAC-SHA256(nonce || ciphertext), where the
+    counter block is the 8 byte nonce followed by a 64 bit counter starting at 1.
+    The keys, the AES object and the keyed HMAC state are created once, and the key stream of a whole batch is produced
+    by a single AES call over all counter blocks.
+    """
+
+    def __init__(self, secret_key: bytes):
+        """
+        :param secret_key: AES key. The HMAC key is derived from it as SHA256(secret_key).
+        """
+        self.aes = AES.new(secret_key, AES.MODE_ECB)
+        self.mac = hmac.new(hashlib.sha256(secret_key).digest(), digestmod=hashlib.sha256)
+
+    def key_stream(self, nonces: List[bytes], length: int) -> bytes:
+        """
+        Compute the CTR key stream of every nonce, truncated to length bytes, concatenated in order.
+        """
+        num_of_counters = -(-length // AES_BLOCK_SIZE)
+        suffixes = [counter.to_bytes(8, 'big') for counter in range(1, num_of_counters + 1)]
+        counter_blocks = b''.join(nonce + suffix for nonce in nonces for suffix in suffixes)
+        stream = self.aes.encrypt(counter_blocks)
+        if length == num_of_counters * AES_BLOCK_SIZE:
+            return stream
+        step = num_of_counters * AES_BLOCK_SIZE
+        return b''.join(stream[offset:offset + length] for offset in range(0, len(stream), step))
+
+    def encrypt_blocks(self, plaintexts: List[bytes]) -> List[bytes]:
+        """
+        Encrypt and authenticate a list of plaintexts of equal length, each with a fresh random nonce.
+        :param plaintexts: Plaintexts to encrypt, all of the same length.
+        :return: List of encrypted blocks, in the same order.
+        """
+        if not plaintexts:
+            return []
+        length = len(plaintexts[0])
+        random_bytes = get_random_bytes(NONCE_SIZE * len(plaintexts))
+        nonces = [random_bytes[offset:offset + NONCE_SIZE] for offset in range(0, len(random_bytes), NONCE_SIZE)]
+        joined = b''.join(plaintexts)
+        stream = self.key_stream(nonces, length)
+        ciphertext = (int.from_bytes(joined, 'big') ^ int.from_bytes(stream, 'big')).to_bytes(len(joined), 'big')
+
+        blocks = []
+        mac = self.mac
+        for index, nonce in enumerate(nonces):
+            block = nonce + ciphertext[index * length:(index + 1) * length]
+            tag = mac.copy()
+            tag.update(block)
+            blocks.append(block + tag.digest())
+        return blocks
+
+    def decrypt_blocks(self, blocks: List[bytes]) -> List[memoryview]:
+        """
+        Verify and decrypt a list of encrypted blocks of equal length.
+        :param blocks: Encrypted blocks (bytes or memoryviews), all of the same length.
+        :return: List of plaintexts, in the same order, as views of one buffer so that no plaintext is copied.
+        """
+        if not blocks:
+            return []
+        mac = self.mac
+        nonces = []
+        ciphertexts = []
+        for block in blocks:
+            tag = mac.copy()
+            tag.update(block[:-TAG_SIZE])
+            # The server won't be able to trick the client into accepting corrupt data
+            if not hmac.compare_digest(tag.digest(), block[-TAG_SIZE:]):
+                raise ValueError("Decryption failed: authentication failed")
+            nonces.append(bytes(block[:NONCE_SIZE]))
+            ciphertexts.append(block[NONCE_SIZE:-TAG_SIZE])
+        length = len(ciphertexts[0])
+        joined = b''.join(ciphertexts)
+        stream = self.key_stream(nonces, length)
+        plaintext = (int.from_bytes(joined, 'big') ^ int.from_bytes(stream, 'big')).to_bytes(len(joined), 'big')
+        plaintext = memoryview(plaintext)
+        return [plaintext[offset:offset + length] for offset in range(0, len(plaintext), length)]
+
+    def rerandomize_blocks(self, blocks: List[bytes]) -> List[bytes]:
+        """
+        Verify a list of encrypted blocks of equal length and re-encrypt them under fresh random nonces, without
+        producing their plaintexts: the new ciphertext is the old one XOR the old and the new key streams, all computed
+        by a single AES call. The result is distributed exactly like encrypt_blocks() of the same plaintexts.
+        :param blocks: Encrypted blocks (bytes or memoryviews), all of the same length.
+        :return: List of encrypted blocks, in the same order.
+        """
+        if not blocks:
+            return []
+        mac = self.mac
+        old_nonces = []
+        ciphertexts = []
+        for block in blocks:
+            tag = mac.copy()
+            tag.update(block[:-TAG_SIZE])
+            # Re-encrypting a forged block would give it a valid tag, so it must be verified like in decrypt_blocks()
+            if not hmac.compare_digest(tag.digest(), block[-TAG_SIZE:]):
+                raise ValueError("Decryption failed: authentication failed")
+            old_nonces.append(bytes(block[:NONCE_SIZE]))
+            ciphertexts.append(block[NONCE_SIZE:-TAG_SIZE])
+        length = len(ciphertexts[0])
+        random_bytes = get_random_bytes(NONCE_SIZE * len(blocks))
+        new_nonces = [random_bytes[offset:offset + NONCE_SIZE] for offset in range(0, len(random_bytes), NONCE_SIZE)]
+        joined = b''.join(ciphertexts)
+        stream = self.key_stream(old_nonces + new_nonces, length)
+        split = len(joined)
+        ciphertext = (int.from_bytes(joined, 'big') ^ int.from_bytes(stream[:split], 'big') ^
+                      int.from_bytes(stream[split:], 'big')).to_bytes(split, 'big')
+
+        new_blocks = []
+        for index, nonce in enumerate(new_nonces):
+            block = nonce + ciphertext[index * length:(index + 1) * length]
+            tag = mac.copy()
+            tag.update(block)
+            new_blocks.append(block + tag.digest())
+        return new_blocks
+
+
+THREAD_POOL = 'thread'
+PROCESS_POOL = 'process'
+MIN_BLOCKS_PER_TASK = 4  # smaller batches are not worth a round trip to a worker
+pool_cipher = None  # BucketCipher of a process pool worker, created by init_pool_worker()
+
+
+def init_pool_worker(secret_key: bytes) -> None:
+    global pool_cipher
+    pool_cipher = BucketCipher(secret_key)
+
+
+def pool_encrypt_blocks(plaintexts: List[bytes]) -> List[bytes]:
+    return pool_cipher.encrypt_blocks(plaintexts)
+
+
+def pool_decrypt_blocks(blocks: List[bytes]) -> List[bytes]:
+    return [bytes(plaintext) for plaintext in pool_cipher.decrypt_blocks(blocks)]
+
+
+def pool_rerandomize_blocks(blocks: List[bytes]) -> List[bytes]:
+    return pool_cipher.rerandomize_blocks(blocks)
+
+
+class ParallelBucketCipher:
+    """
+    BucketCipher that splits every batch into contiguous chunks and encrypts or decrypts them concurrently on a pool of
+    workers. The chunk results are concatenated in the order of the batch, so the output (and the order the client
+    merges blocks into its stash) is the same as with a single BucketCipher.
+    Threads share the cipher and overlap where pycryptodome and hashlib release the GIL (AES and HMAC of large blocks);
+    processes also parallelize the Python parts, at the cost of copying the blocks to the workers.
+    """
+
+    def __init__(self, secret_key: bytes, workers: int, pool: str = THREAD_POOL):
+        """
+        :param secret_key: AES key, see BucketCipher.
+        :param workers: Number of workers of the pool.
+        :param pool: THREAD_POOL or PROCESS_POOL.
+        """
+        if pool not in (THREAD_POOL, PROCESS_POOL):
+            raise ValueError(f"Unknown pool kind: {pool}")
+        self.cipher = BucketCipher(secret_key)
+        self.workers = workers
+        self.pool = pool
+        if pool == THREAD_POOL:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+            self.encrypt_chunk = self.cipher.encrypt_blocks
+            self.decrypt_chunk = self.cipher.decrypt_blocks
+            self.rerandomize_chunk = self.cipher.rerandomize_blocks
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker,
+                                                initargs=(secret_key,))
+            self.encrypt_chunk = pool_encrypt_blocks
+            self.decrypt_chunk = pool_decrypt_blocks
+            self.rerandomize_chunk = pool_rerandomize_blocks
+
+    def split(self, blocks: list) -> List[list]:
+        num_of_chunks = max(1, min(self.workers, len(blocks) // MIN_BLOCKS_PER_TASK))
+        chunk_size = -(-len(blocks) // num_of_chunks)
+        return [blocks[offset:offset + chunk_size] for offset in range(0, len(blocks), chunk_size)]
+
+    def run(self, function, serial, blocks: list) -> list:
+        """
+        Apply function to the chunks of the batch on the pool, or serial to the whole batch if it is too small to split.
+        """
+        chunks = self.split(blocks)
+        if len(chunks) <= 1:
+            return serial(blocks)
+        if self.pool == PROCESS_POOL:
+            chunks = [[bytes(block) for block in chunk] for chunk in chunks]  # memoryviews can't be pickled
+        return [result for chunk_result in self.executor.map(function, chunks) for result in chunk_result]
+
+    def encrypt_blocks(self, plaintexts: List[bytes]) -> List[bytes]:
+        """
+        See BucketCipher.encrypt_blocks().
+        """
+        return self.run(self.encrypt_chunk, self.cipher.encrypt_blocks, plaintexts)
+
+    def decrypt_blocks(self, blocks: List[bytes]) -> List[bytes]:
+        """
+        See BucketCipher.decrypt_blocks().
+        """
+        return self.run(self.decrypt_chunk, self.cipher.decrypt_blocks, blocks)
+
+    def rerandomize_blocks(self, blocks: List[bytes]) -> List[bytes]:
+        """
+        See BucketCipher.rerandomize_blocks().
+        """
+        return self.run(self.rerandomize_chunk, self.cipher.rerandomize_blocks, blocks)
+
+    def close(self) -> None:
+        self.executor.shutdown()
@@ -1,20 +1,77 @@
-import hashlib
+from bisect import bisect_left
 from math import ceil, log2
 import random
-from typing import Tuple, List
-from Crypto import Random
-from Crypto.Hash import HMAC, SHA256
-from Crypto.Cipher import AES
+import struct
+from typing import Callable, Tuple, List
 from Crypto.Random import get_random_bytes
-from Crypto.Util import Counter
+from BinaryTree import BinaryTree
+from BucketCipher import BucketCipher, ParallelBucketCipher, NONCE_SIZE, TAG_SIZE, THREAD_POOL
+from MerkleTree import MerkleTree, CHILD_HASHES_SIZE
+from PositionMap import PositionMap, RecursivePositionMap, LABEL_SIZE, LABELS_PER_BLOCK
 from Server import Server
+from Stats import Stats
 
-DATA_SIZE = 4
+DATA_SIZE = 4  # default number of payload bytes of every block
 KEY_SIZE = 32
-NONCE_SIZE = 8
-DUMMY_DATA = '0000'
+BUCKET_SIZE = 4  # stated in the paper, should be enough to prevent overflow
+# Every plaintext block is this header followed by the data, zero padded to the data size, so all ciphertexts have the
+# same length. An all-zero plaintext is a dummy block.
+BLOCK_HEADER = struct.Struct('>BQQI')  # flags, data id, leaf + 1 (0 if not tracked), data length
+REAL_BLOCK = 1  # flag of blocks holding data
+MAX_ID = 2 ** 64 - 1
+DUMMY_DATA = b''
 DUMMY_ID = 'x'
 ROOT_ID = 0
+INIT_CHUNK = 1024  # buckets encrypted and written per call by the eager init_tree()
+OVERFLOW_EVICTION = 'overflow'  # insert into the root and push blocks down with prevent_overflow()
+PATH_EVICTION = 'path'  # read the whole path into the stash and write it back greedily (Stefanov et al.)
+STORE = 'store'
+RETRIEVE = 'retrieve'
+DELETE = 'delete'
+
+
+def get_tree_size(num_of_files: int) -> int:
+    """
+    Number of buckets in the tree of an ORAM supporting the given number of files.
+    """
+    tree_height = max(0, ceil(log2(num_of_files)) - 1)
+    return (2 * 2 ** tree_height) - 1
+
+
+def get_sealed_size(data_size: int = DATA_SIZE, bucket_size: int = BUCKET_SIZE) -> int:
+    """
+    Size in bytes of a sealed bucket: one nonce, the ciphertext of all its plaintext blocks and one tag.
+    """
+    return NONCE_SIZE + bucket_size * (BLOCK_HEADER.size + data_size) + TAG_SIZE
+
+
+def get_block_size(data_size: int = DATA_SIZE, bucket_sealing: bool = False, bucket_size: int = BUCKET_SIZE,
+                   merkle: bool = False) -> int:
+    """
+    Size in bytes of an encrypted block holding data of the given size.
+    With bucket_sealing, size of every server block of a sealed bucket of bucket_size blocks, see Client: the server
+    still stores bucket_size blocks per bucket, but they are equal slices of the sealed bucket (preceded, with merkle,
+    by the hashes of its children).
+    """
+    if not bucket_sealing:
+        return NONCE_SIZE + BLOCK_HEADER.size + data_size + TAG_SIZE
+    stored_size = get_sealed_size(data_size, bucket_size) + (CHILD_HASHES_SIZE if merkle else 0)
+    return -(-stored_size // bucket_size)
+
+
+BLOCK_SIZE = get_block_size()
+
+
+def as_payload(data: bytes | bytearray | memoryview | str) -> bytes:
+    """
+    Data as immutable bytes: str is encoded as UTF-8 and other buffers are copied, so the stash never aliases a buffer
+    the caller may still change.
+    """
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode()
+    return bytes(data)
 
 
 class Client:
@@ -23,57 +80,279 @@ class Client:
     of the data content and access pattern. The client also supports encryption, decryption, and authentication of data.
     """
 
-    def __init__(self, num_of_files: int, server: Server):
+    def __init__(self, num_of_files: int, server: Server, secret_key: bytes = None, eviction: str = OVERFLOW_EVICTION,
+                 data_size: int = DATA_SIZE, position_map_budget: int = None, server_factory=Server,
+                 bucket_size: int = BUCKET_SIZE, stats: Stats = None, tree_top_budget: int = None,
+                 crypto_workers: int = 0, crypto_pool: str = THREAD_POOL, lazy_init: bool = False,
+                 bucket_sealing: bool = False, merkle: bool = False, merkle_root: bytes = None,
+                 written_buckets: bytes = None):
         """
         :param num_of_files: Number of files that the server needs to support
         :param server: Server object
+        :param secret_key: Key the server tree was encrypted with, when reopening an already initialized tree
+        :param eviction: OVERFLOW_EVICTION or PATH_EVICTION
+        :param data_size: Maximal number of bytes of every data item, the server blocks must be
+        get_block_size(data_size, bucket_sealing, bucket_size, merkle)
+        :param position_map_budget: Maximal number of position map entries kept in client memory. If num_of_files is
+        larger, the position map is stored in a smaller ORAM, recursively, and data ids must be in range(num_of_files).
+        Requires PATH_EVICTION, whose accesses make exactly one position map access each.
+        :param server_factory: Called with (tree_size, bucket_size, block_size) to create the servers of the position
+        map ORAMs
+        :param bucket_size: Number of blocks in every bucket, must match the server
+        :param stats: Where to record counters and phase timers, see stats_snapshot(). Disabled if not given.
+        :param tree_top_budget: Bytes of client memory for keeping the top levels of the tree decrypted, see
+        get_tree_top_levels(). Only the rest of every path is read from and written to the server. Requires
+        PATH_EVICTION.
+        :param crypto_workers: If more than 1, the blocks of every path are encrypted and decrypted in chunks on a
+        pool of this many workers, see ParallelBucketCipher. Call close() to stop the pool.
+        :param crypto_pool: THREAD_POOL or PROCESS_POOL, the kind of pool of crypto_workers.
+        :param lazy_init: Skip writing the initial dummy buckets: a new server holds all-zero blocks, and the client
+        reads every all-zero block as a dummy, so a bucket is only encrypted when it is first written. The server must
+        be new (all zeros), and reopening the tree needs lazy_init again. The client keeps a bitmap of the buckets it
+        wrote, see mark_written(), and rejects all-zero content read from any of them.
+        :param bucket_sealing: Encrypt and authenticate every bucket as a whole, with a single nonce and tag, instead of
+        every block, which cuts the storage and bandwidth overhead by bucket_size times. The plaintext blocks of a
+        bucket are concatenated and encrypted by BucketCipher as a single unit.
+        :param merkle: Keep a Merkle tree over the buckets, see MerkleTree, so that the server cannot replay an older
+        bucket. Only the root hash is kept by the client, and every access verifies and updates the hashes of its
+        paths. Requires bucket_sealing, PATH_EVICTION and no tree-top cache.
+        :param merkle_root: Root hash of the Merkle tree (merkle.root_hash), when reopening an already initialized tree.
+        :param written_buckets: Bitmap of the written buckets (written_buckets), when reopening an already initialized
+        tree with lazy_init.
         """
+        if eviction not in (OVERFLOW_EVICTION, PATH_EVICTION):
+            raise ValueError(f"Unknown eviction mode: {eviction}")
+        if tree_top_budget and eviction != PATH_EVICTION:
+            raise ValueError("A tree-top cache requires PATH_EVICTION")
+        if position_map_budget is not None and eviction != PATH_EVICTION:
+            raise ValueError("A position map budget requires PATH_EVICTION")
+        if merkle and not bucket_sealing:
+            raise ValueError("A Merkle tree requires bucket_sealing")
+        if merkle and (eviction != PATH_EVICTION or tree_top_budget):
+            raise ValueError("A Merkle tree requires PATH_EVICTION and no tree-top cache")
+        self.eviction = eviction
         self.max_files = num_of_files
         self.tree_height = max(0, ceil(log2(num_of_files)) - 1)
         num_of_leaves = 2 ** self.tree_height
         self.tree_size = (2 * num_of_leaves) - 1
-        self.bucket_size = 4  # stated in the paper, should be enough to prevent overflow
-        self.leaves_ids = list(range(num_of_leaves - 1, self.tree_size))
+        self.bucket_size = bucket_size
+        self.leaves_ids = range(num_of_leaves - 1, self.tree_size)
+        self.data_size = data_size
+        self.stats = stats or Stats(enabled=False)
+        self.dummy_block = (DUMMY_ID, DUMMY_DATA, None)
+        self.dummy_plaintext = bytes(BLOCK_HEADER.size + data_size)
+        self.lazy_init = lazy_init
+        self.bucket_sealing = bucket_sealing
+        self.sealed_size = get_sealed_size(data_size, bucket_size)
+        self.block_size = get_block_size(data_size, bucket_sealing, bucket_size, merkle)
+        self.unwritten_block = bytes(self.block_size)  # content of every slot of a never written bucket
+        # With lazy_init, bit i of the bitmap is set once bucket i was written: only the other buckets may read as zeros
+        self.written_buckets = None
+        if lazy_init:
+            self.written_buckets = bytearray(written_buckets or (self.tree_size + 7) // 8)
+        self.new_written_buckets = None  # buckets marked since the last state log record, while tracked
+        self.merkle = MerkleTree(merkle_root) if merkle else None
+        # Sealed buckets start with the hashes of their children, filled in by the Merkle tree when they are written
+        self.hashes_offset = CHILD_HASHES_SIZE if merkle else 0
         self.stash = dict()
-        self.position_map = dict()
-        self.secret_key = get_random_bytes(KEY_SIZE)
-        self.init_tree(server)
+        self.stash_leaves = dict()  # leaf assigned to every block in the stash, used by PATH_EVICTION
+        self.tree_top_levels = self.get_tree_top_levels(tree_top_budget)
+        self.tree_top_size = 2 ** self.tree_top_levels - 1  # the cached buckets are the ids below it
+        self.tree_top = [[] for _ in range(self.tree_top_size)]  # real (data ID, data, leaf) blocks of every bucket
+        self.position_map = self.create_position_map(position_map_budget, server_factory, bucket_sealing, merkle)
+        self.state_log = None  # StateLog recording the client state at the end of every access, see StateLog.attach()
+        self.last_write = None  # (bucket index, tag of its first block) of the last bucket written by an access
+        self.max_stash_size = 0
+        self.stash_size_sum = 0
+        self.num_of_accesses = 0
+        if server.initialized:
+            if secret_key is None:
+                raise ValueError("The server tree is already initialized, its secret key must be given")
+            if merkle and merkle_root is None:
+                raise ValueError("The server tree is already initialized, its Merkle root hash must be given")
+            if lazy_init and written_buckets is None:
+                raise ValueError("The server tree is already initialized, the bitmap of its written buckets must be "
+                                 "given")
+            self.secret_key = secret_key
+            self.cipher = self.create_cipher(crypto_workers, crypto_pool)
+            self.load_tree_top(server)
+        else:
+            self.secret_key = secret_key or get_random_bytes(KEY_SIZE)
+            self.cipher = self.create_cipher(crypto_workers, crypto_pool)
+            self.init_tree(server)
+
+    def create_cipher(self, workers: int, pool: str) -> BucketCipher | ParallelBucketCipher:
+        if workers > 1:
+            return ParallelBucketCipher(self.secret_key, workers, pool)
+        return BucketCipher(self.secret_key)
+
+    def close(self) -> None:
+        """
+        Stop the crypto worker pool, if any.
+        """
+        if isinstance(self.cipher, ParallelBucketCipher):
+            self.cipher.close()
+
+    def create_position_map(self, budget: int | None, server_factory, bucket_sealing: bool = False,
+                            merkle: bool = False) -> PositionMap | RecursivePositionMap:
+        """
+        Create a flat position map if it fits the budget, otherwise a position map stored in a smaller Path ORAM
+        (whose own position map is created the same way).
+        :param budget: Maximal number of position map entries kept in client memory, None for no limit.
+        :param server_factory: Called with (tree_size, bucket_size, block_size) to create the position map server.
+        :param bucket_sealing: Whether the position map ORAM seals whole buckets, see Client.
+        :param merkle: Whether the position map ORAM keeps a Merkle tree, see Client.
+        """
+        if budget is None or self.max_files <= budget:
+            return PositionMap()
+        num_of_blocks = ceil(self.max_files / LABELS_PER_BLOCK)
+        data_size = LABEL_SIZE * LABELS_PER_BLOCK
+        server = server_factory(get_tree_size(num_of_blocks), BUCKET_SIZE,
+                                get_block_size(data_size, bucket_sealing, BUCKET_SIZE, merkle))
+        client = Client(num_of_blocks, server, eviction=PATH_EVICTION, data_size=data_size,
+                        position_map_budget=budget, server_factory=server_factory, bucket_sealing=bucket_sealing,
+                        merkle=merkle)
+        return RecursivePositionMap(client, server, self.max_files)
+
+    def get_tree_top_levels(self, budget: int | None) -> int:
+        """
+        Number of top levels of the tree whose decrypted buckets fit in the budget, at most all levels but the leaves.
+        A bucket is counted at its full plaintext size, bucket_size blocks of BLOCK_HEADER.size + data_size bytes.
+        :param budget: Bytes of client memory, None or 0 for no tree-top cache.
+        """
+        if not budget:
+            return 0
+        bucket_bytes = self.bucket_size * (BLOCK_HEADER.size + self.data_size)
+        return min((budget // bucket_bytes + 1).bit_length() - 1, self.tree_height)
+
+    def load_tree_top(self, server: Server) -> None:
+        """
+        Read the buckets of the tree-top cache from an already initialized server, see write_back_tree_top().
+        """
+        if not self.tree_top_size:
+            return
+        bucket_ids = range(self.tree_top_size)
+        buckets = server.get_buckets_by_ids(bucket_ids)
+        self.check_written(bucket_ids, buckets)
+        for bucket_id, bucket in zip(bucket_ids, self.decrypt_buckets(buckets)):
+            self.tree_top[bucket_id] = [block for block in bucket if block[0] != DUMMY_ID]
+
+    def write_back_tree_top(self, server: Server) -> None:
+        """
+        Write the cached top of the tree to the server, so that a client reopening it (or one without a tree-top
+        cache) finds all the blocks. Call before dropping the client.
+        """
+        if not self.tree_top_size:
+            return
+        buckets = [bucket + [self.dummy_block] * (self.bucket_size - len(bucket)) for bucket in self.tree_top]
+        server.write_buckets_by_ids(list(range(self.tree_top_size)), self.encrypt_buckets(buckets))
+        self.mark_written(range(self.tree_top_size))
+        server.flush()
 
     def init_tree(self, server: Server) -> None:
         """
-        Initialize the tree structure by writing encrypted dummy data to the server.
+        Initialize the tree structure by writing encrypted dummy data to the server, INIT_CHUNK buckets per encryption
+        and write call. With lazy_init nothing is written, the never written buckets already read as dummies.
+        With a Merkle tree the chunks are written from the last one, so that every bucket is hashed after its children.
         :param server: Instance of the Server class where data will be written.
         """
-        for bucket_id in range(self.tree_size):
-            encrypted_bucket = [self.encrypt_data(DUMMY_ID, DUMMY_DATA) for _ in range(self.bucket_size)]
-            server.write_bucket_by_index(bucket_id, encrypted_bucket)
+        if not self.lazy_init:
+            firsts = range(0, self.tree_size, INIT_CHUNK)
+            for first in reversed(firsts) if self.merkle else firsts:
+                bucket_ids = range(first, min(first + INIT_CHUNK, self.tree_size))
+                buckets = [[self.dummy_block] * self.bucket_size] * len(bucket_ids)
+                self.write_buckets(bucket_ids, self.encrypt_buckets(buckets), server)
+        server.mark_initialized()
+
+    def mark_written(self, bucket_ids) -> None:
+        """
+        With lazy_init, record that the given buckets were written to the server, see check_written().
+        """
+        written_buckets = self.written_buckets
+        if written_buckets is None:
+            return
+        for bucket_id in bucket_ids:
+            if not written_buckets[bucket_id >> 3] & 1 << (bucket_id & 7):
+                written_buckets[bucket_id >> 3] |= 1 << (bucket_id & 7)
+                if self.new_written_buckets is not None:
+                    self.new_written_buckets.append(bucket_id)
+
+    def check_written(self, bucket_ids, buckets) -> None:
+        """
+        With lazy_init, reject buckets read from the server that hold never written (all-zero) content although the
+        client wrote them: the decryption would take that content for dummies, so the server could erase data.
+        :param bucket_ids: Indices of the buckets.
+        :param buckets: The encrypted buckets (or some of their blocks), in the same order.
+        """
+        written_buckets = self.written_buckets
+        if written_buckets is None:
+            return
+        unwritten_sealed = bytes(self.sealed_size)
+        for bucket_id, bucket in zip(bucket_ids, buckets):
+            if not written_buckets[bucket_id >> 3] & 1 << (bucket_id & 7):
+                continue
+            if self.sealed_part(bucket) == unwritten_sealed if self.bucket_sealing else self.unwritten_block in bucket:
+                # The server won't be able to trick the client into accepting erased data
+                raise ValueError("Decryption failed: authentication failed")
+
+    def verify_buckets(self, bucket_ids: List[int], buckets) -> None:
+        """
+        Check buckets read from the server with check_written() and against the Merkle tree, if any.
+        :param bucket_ids: Indices of the buckets, a union of root-to-leaf paths, increasing.
+        :param buckets: The encrypted buckets, in the same order.
+        """
+        self.check_written(bucket_ids, buckets)
+        if self.merkle:
+            with self.stats.timer('merkle'):
+                self.merkle.verify(bucket_ids, buckets)
+
+    def write_buckets(self, bucket_ids, encrypted_buckets, server: Server) -> List[List[bytes]]:
+        """
+        Write encrypted buckets to the server in one call, after updating their hashes in the Merkle tree, if any.
+        :param bucket_ids: Indices of the buckets, increasing.
+        :param encrypted_buckets: The encrypted buckets, in the same order.
+        :return: The buckets as written, with their children hashes.
+        """
+        if self.merkle:
+            with self.stats.timer('merkle'):
+                encrypted_buckets = self.merkle.update(bucket_ids, encrypted_buckets)
+        server.write_buckets_by_ids(bucket_ids, encrypted_buckets)
+        self.mark_written(bucket_ids)
+        return encrypted_buckets
 
-    def read_path(self, leaf_index: int, server: Server) -> Tuple[List[List[str]], List[int]]:
+    def read_path(self, leaf_index: int, server: Server) -> Tuple[List[List[bytes]], List[int]]:
         """
         Read the path from the root to a specified leaf index from the server.
         :param leaf_index: Index of the leaf node whose path to read.
         :param server: Instance of the Server class containing the tree structure.
         :return: Tuple containing the data (buckets) along the path and their corresponding ids.
         """
-        path_ids = server.tree.get_path_to_leaf(leaf_index, self.tree_height)
-        path_buckets = server.get_buckets_by_ids(path_ids)
+        path_ids = BinaryTree.get_path_to_leaf(leaf_index, self.tree_height)
+        with self.stats.timer('read_path'):
+            path_buckets = server.read_path(leaf_index)
+        self.check_written(path_ids, path_buckets)
         return path_buckets, path_ids
 
-    def get_next_id_in_path_to_leaf(self, data_id: int, curr_bucket_id: int, server) -> int:
+    def is_leaf(self, bucket_id: int) -> bool:
+        """
+        Check if the bucket with the given index is a leaf of the tree.
+        :param bucket_id: Index of the bucket to check.
+        :return: True if the bucket has no children, False otherwise.
+        """
+        return BinaryTree.get_left_index(bucket_id) >= self.tree_size
+
+    def get_next_id_in_path_to_leaf(self, data_id: int, curr_bucket_id: int) -> int:
         """
         Determine the next node index on the path to a leaf node in the tree structure.
 
         :param data_id: ID of the data for which the path to a leaf node is being determined.
         :param curr_bucket_id: Current index of the bucket in the tree traversal path.
-        :param server: Instance of the Server class containing the tree structure.
         :return: Index of the next node in the path to the leaf node.
         """
-        bucket = server.tree.find_node(curr_bucket_id)
-
         if data_id == DUMMY_ID:
             # If the data ID is a dummy ID, return one of the bucket's children
-            left_child_index = bucket.get_left_index()
-            right_child_index = bucket.get_right_index()
+            left_child_index = BinaryTree.get_left_index(curr_bucket_id)
+            right_child_index = BinaryTree.get_right_index(curr_bucket_id)
             return random.choice([left_child_index, right_child_index])
 
         # If the data ID is not a dummy ID, return its leaf index
@@ -84,7 +363,7 @@ class Client:
             return leaf_id
 
         # Get the path ids from the current bucket index to the leaf index
-        path_ids = server.tree.get_path_to_leaf(leaf_id, self.tree_height)
+        path_ids = BinaryTree.get_path_to_leaf(leaf_id, self.tree_height)
 
         # Find the current index in the path list
         curr_index_in_path_list = path_ids.index(curr_bucket_id)
@@ -92,61 +371,54 @@ class Client:
         # Return the index of the next node in the path to the leaf node
         return path_ids[curr_index_in_path_list + 1]
 
-    def insert_data_to_bucket(self, encrypted_data, bucket, bucket_id: int, server: Server) -> None:
+    def insert_data_to_bucket(self, data_id: int, data: bytes, bucket, bucket_id: int, server: Server) -> bool:
         """
-        Replace the first dummy data in the bucket with the provided encrypted data.
-        Decrypt and re-encrypt all data blocks in the bucket and write them back to the server.
-        :param encrypted_data: Encrypted data to insert into the bucket.
+        Replace the first dummy data in the bucket with the provided data.
+        Decrypt the bucket once and, if it has a free slot, re-encrypt it with the data and write it back to the server.
+        :param data_id: ID of the data to insert into the bucket.
+        :param data: Data to insert into the bucket.
         :param bucket: Current encrypted data blocks in the bucket.
         :param bucket_id: Index of the bucket in the server storage.
         :param server: Instance of the Server class containing the storage.
+        :return: True if the data was inserted, False if the bucket is full of real data.
         """
-        new_bucket = []
-        replaced_with_dummy = False
-        for encrypted_block in bucket:
-            curr_data_id, curr_data = self.decrypt_data(encrypted_block)
-
-            if (not replaced_with_dummy) and (curr_data_id == DUMMY_ID):
-                # Replace the first dummy data found with the encrypted data
-                new_bucket.append(encrypted_data)
-                replaced_with_dummy = True
-            else:
-                # Re-encrypt the existing data and add it to the new_bucket
-                re_encrypted_data = self.encrypt_data(curr_data_id, curr_data)
-                new_bucket.append(re_encrypted_data)
-
-        # Write the re-encrypted bucket with added data back to the server
-        server.write_bucket_by_index(bucket_id, new_bucket)
+        self.check_written([bucket_id], [bucket])
+        decrypted_bucket = self.decrypt_bucket(bucket)
+        for index, (curr_data_id, _, _) in enumerate(decrypted_bucket):
+            if curr_data_id == DUMMY_ID:
+                # Replace the first dummy data found with the data
+                decrypted_bucket[index] = (data_id, data, None)
+                # Write the re-encrypted bucket with added data back to the server
+                server.write_bucket_by_index(bucket_id, self.encrypt_bucket(decrypted_bucket))
+                self.mark_written([bucket_id])
+                return True
+        return False
 
-    def remove_data_from_bucket(self, target_data_id: int, bucket, bucket_index: int, server: Server,
-                                should_remove: bool):
+    def remove_data_from_path(self, target_data_id: int, path_buckets, path_ids: List[int], server: Server):
         """
-        Remove data associated with the specified data ID from the bucket.
-        Decrypt and re-encrypt all data blocks in the bucket, replacing the removed data with dummy data.
-        Write the modified bucket back to the server.
+        Remove data associated with the specified data ID from the path.
+        Decrypt and re-encrypt the whole path in one call each, replacing the removed data with dummy data.
+        Write the modified buckets back to the server.
 
-        :param target_data_id: ID of the data to be removed from the bucket.
-        :param bucket: List of encrypted data blocks representing the current contents of the bucket.
-        :param bucket_index: Index of the bucket in the server storage.
+        :param target_data_id: ID of the data to be removed from the path.
+        :param path_buckets: Encrypted buckets along the path, from the root to the leaf.
+        :param path_ids: Indices of the buckets along the path.
         :param server: Instance of the Server class containing the storage.
-        :param should_remove: Boolean indicating whether to continue removing data (used internally).
         :return: The removed data (if found) associated with the specified data ID.
         """
-        removed_data = None
-        updated_bucket = []
-        for encrypted_block in bucket:
-            data_id, data = self.decrypt_data(encrypted_block)
-            if should_remove and (data_id == target_data_id):
-                # Found the data to remove, replace it with dummy data
-                removed_data = data
-                re_encrypted_block = self.encrypt_data(DUMMY_ID, DUMMY_DATA)
-            else:
-                # Re-encrypt the existing data and add it to the updated bucket
-                re_encrypted_block = self.encrypt_data(data_id, data)
-            updated_bucket.append(re_encrypted_block)  # Add encrypted block to the updated bucket
-        # Write the fully re-encrypted bucket back to the server
-        server.write_bucket_by_index(bucket_index, updated_bucket)
-        return removed_data
+        with self.stats.timer('remove_data_from_path'):
+            removed_data = None
+            decrypted_path = self.decrypt_buckets(path_buckets)
+            for bucket in decrypted_path:
+                for index, (data_id, data, _) in enumerate(bucket):
+                    if removed_data is None and data_id == target_data_id:
+                        # Found the data to remove, replace it with dummy data
+                        removed_data = data
+                        bucket[index] = self.dummy_block
+            # Write the fully re-encrypted path back to the server
+            server.write_buckets_by_ids(path_ids, self.encrypt_buckets(decrypted_path))
+            self.mark_written(path_ids)
+            return removed_data
 
     def is_bucket_full(self, bucket_id: int, server: Server) -> bool:
         """
@@ -156,13 +428,9 @@ class Client:
         :return: True if the bucket is full of real data, False otherwise.
         """
         bucket = server.get_bucket_by_index(bucket_id)
-        for encrypted_block in bucket:
-            curr_data_id, curr_data = self.decrypt_data(encrypted_block)
-            if curr_data_id == DUMMY_ID:
-                # If any block in the bucket contains dummy data, the bucket is not full
-                return False
-        # If no blocks contain dummy data, the bucket is considered full
-        return True
+        self.check_written([bucket_id], [bucket])
+        # If any block in the bucket contains dummy data, the bucket is not full
+        return all(data_id != DUMMY_ID for data_id, _, _ in self.decrypt_bucket(bucket))
 
     def prevent_overflow(self, server: Server):
         """
@@ -175,71 +443,58 @@ class Client:
             if level == ROOT_ID:  # Root level only has one bucket
                 chosen_bucket_ids = [ROOT_ID]
             else:  # Other levels have at least two buckets
-                level_ids = server.tree.get_node_ids_of_level(level)
+                level_ids = BinaryTree.get_node_ids_of_level(level)
                 chosen_bucket_ids = random.sample(level_ids, 2)  # Randomly choose two buckets from the current level
 
             chosen_buckets = server.get_buckets_by_ids(chosen_bucket_ids)
+            self.check_written(chosen_bucket_ids, chosen_buckets)
+            chosen_buckets = self.decrypt_buckets(chosen_buckets)
 
+            pushed_down = []
             for bucket_id, bucket in zip(chosen_bucket_ids, chosen_buckets):  # For each chosen bucket
                 index_to_push_down = random.randint(0, self.bucket_size - 1)  # Choose one data block to push down
-                new_bucket = []
-                data_to_push_down = None
-                data_id_to_push_down = None
+                data_id, data, _ = bucket[index_to_push_down]
+                bucket[index_to_push_down] = self.dummy_block  # The data block to push down, replace with dummy
+                pushed_down.append((bucket_id, data_id, data))
 
-                for index, encrypted_block in enumerate(bucket):  # Iterate through each data block in the bucket
-                    data_id, data = self.decrypt_data(encrypted_block)
+            # Write the re-encrypted buckets back to the server
+            server.write_buckets_by_ids(chosen_bucket_ids, self.encrypt_buckets(chosen_buckets))
+            self.mark_written(chosen_bucket_ids)
 
-                    if index == index_to_push_down:  # The data block to push down, replace with dummy
-                        data_to_push_down = data
-                        data_id_to_push_down = data_id
-                        re_encrypted_block = self.encrypt_data(DUMMY_ID, DUMMY_DATA)
-                    else:  # Not the data block to push down
-                        re_encrypted_block = self.encrypt_data(data_id, data)
-
-                    new_bucket.append(re_encrypted_block)
-
-                # Write the re-encrypted bucket back to the server
-                server.write_bucket_by_index(bucket_id, new_bucket)
-
-                if data_to_push_down is not None:
-                    # Push the data down as deep as possible in the tree
-                    self.push_data_down_as_deep_as_possible(server, bucket_id, data_id_to_push_down, data_to_push_down)
+            for bucket_id, data_id, data in pushed_down:
+                # Push the data down as deep as possible in the tree
+                with self.stats.timer('push_down'):
+                    self.push_data_down_as_deep_as_possible(server, bucket_id, data_id, data)
 
     def push_data_down_as_deep_as_possible(self, server: Server, current_index: int, data_id: int, data) -> None:
         """
         Pushes data down the tree as deep as possible without causing overflow.
 
-        This function encrypts the given data and attempts to move it from the current node
-        down to the deepest node in the tree. If a non-full bucket is found during the process,
-        the data is inserted into that bucket.
+        This function attempts to move the given data from the current node down to the deepest
+        node in the tree. If a non-full bucket is found during the process, the data is inserted into that bucket.
 
         :param server: Instance of the Server class that manages the storage.
         :param current_index: Index of the current node in the tree where the push starts.
         :param data_id: ID of the data to be pushed down.
         :param data: The data to be pushed down.
         """
-        # Encrypt the data to be pushed down
-        encrypted_push_down = self.encrypt_data(data_id, data)
-
         # Initialize path to keep track of nodes visited during traversal
         path = []
         current_node_index = current_index
 
         # Traverse down the tree until a leaf node is reached
         while True:
-            current_node = server.get_node_by_index(current_node_index)
-            left_child_index = current_node.get_left_index()
-            right_child_index = current_node.get_right_index()
-
             # If at a leaf node, break the loop
-            if left_child_index is None or right_child_index is None:
+            if self.is_leaf(current_node_index):
                 break
+            left_child_index = BinaryTree.get_left_index(current_node_index)
+            right_child_index = BinaryTree.get_right_index(current_node_index)
 
             # Record the current node in the path
             path.append(current_node_index)
 
             # Determine the next node to visit in the path to the leaf
-            next_node_index_to_leaf = self.get_next_id_in_path_to_leaf(data_id, current_node_index, server)
+            next_node_index_to_leaf = self.get_next_id_in_path_to_leaf(data_id, current_node_index)
 
             # Move to the left or right child based on the next node index
             if next_node_index_to_leaf == left_child_index:
@@ -254,85 +509,643 @@ class Client:
         while path:
             node_to_write = path.pop()
 
-            # Check if the bucket at the current node is not full
-            if not self.is_bucket_full(node_to_write, server):
-                # Retrieve the bucket to write the data to
-                bucket_to_write = server.get_bucket_by_index(node_to_write)
-
-                # Insert the encrypted data into the bucket
-                self.insert_data_to_bucket(encrypted_push_down, bucket_to_write, node_to_write, server)
+            # Insert the data into the bucket at the current node, unless it is full
+            bucket_to_write = server.get_bucket_by_index(node_to_write)
+            if self.insert_data_to_bucket(data_id, data, bucket_to_write, node_to_write, server):
                 return
 
+    ############ Path ORAM eviction ##############
+
+    def random_leaf(self) -> int:
+        return random.choice(self.leaves_ids)
+
+    def read_path_to_stash(self, leaf_index: int, server: Server) -> List[int]:
+        """
+        Read the path to the given leaf, decrypting it in one call, and move all of its real blocks into the stash.
+        :param leaf_index: Index of the leaf whose path to read.
+        :param server: Instance of the Server class containing the storage.
+        :return: Indices of the buckets along the path, from the root to the leaf.
+        """
+        path_ids = BinaryTree.get_path_to_leaf(leaf_index, self.tree_height)
+        self.add_buckets_to_stash(self.read_server_path(leaf_index, server))
+        self.move_tree_top_to_stash(path_ids[:self.tree_top_levels])
+        return path_ids
+
+    def read_server_path(self, leaf_index: int, server: Server):
+        """
+        Read the encrypted buckets of the path to the given leaf that are not in the tree-top cache, from the root.
+        """
+        path_ids = BinaryTree.get_path_to_leaf(leaf_index, self.tree_height)
+        if not self.tree_top_levels:
+            path_buckets = server.read_path(leaf_index)
+        else:
+            path_buckets = server.get_buckets_by_ids(path_ids[self.tree_top_levels:])
+        self.verify_buckets(path_ids[self.tree_top_levels:], path_buckets)
+        return path_buckets
+
+    def write_server_path(self, leaf_index: int, encrypted_path, server: Server) -> List[List[bytes]]:
+        """
+        Write the encrypted buckets of the path to the given leaf that are not in the tree-top cache, from the root.
+        :return: The buckets as written, see write_buckets().
+        """
+        self.last_write = (leaf_index, self.bucket_tag(encrypted_path[-1]))
+        if self.merkle:
+            return self.write_buckets(BinaryTree.get_path_to_leaf(leaf_index, self.tree_height), encrypted_path, server)
+        path_ids = BinaryTree.get_path_to_leaf(leaf_index, self.tree_height)
+        if not self.tree_top_levels:
+            server.write_path(leaf_index, encrypted_path)
+        else:
+            server.write_buckets_by_ids(path_ids[self.tree_top_levels:], encrypted_path)
+        self.mark_written(path_ids[self.tree_top_levels:])
+        return encrypted_path
+
+    def move_tree_top_to_stash(self, bucket_ids) -> None:
+        """
+        Move all the blocks of the given buckets of the tree-top cache into the stash.
+        """
+        for bucket_id in bucket_ids:
+            for data_id, data, leaf in self.tree_top[bucket_id]:
+                self.stash[data_id] = data
+                self.stash_leaves[data_id] = leaf
+            self.tree_top[bucket_id] = []
+
+    def add_buckets_to_stash(self, buckets) -> None:
+        """
+        Decrypt the given buckets in one call and move all of their real blocks into the stash.
+        :param buckets: Encrypted buckets, e.g. a path read from the server.
+        """
+        for bucket in self.decrypt_buckets(buckets):
+            for data_id, data, leaf in bucket:
+                if data_id != DUMMY_ID:
+                    self.stash[data_id] = data
+                    self.stash_leaves[data_id] = leaf
+
+    def take_path_blocks(self, leaf_index: int, capacity: int) -> List[List[Tuple[int, bytes, int]]]:
+        """
+        Greedily choose, from the leaf to the root, the stash blocks to place in every bucket of the path to the given
+        leaf: the blocks whose own path passes through the bucket and that did not fit deeper. The chosen blocks are
+        removed from the stash.
+        :param leaf_index: Index of the leaf of the path.
+        :param capacity: Maximal number of blocks per bucket.
+        :return: For every bucket on the path, from the root to the leaf, its (data ID, data, leaf) blocks.
+        """
+        first_leaf = self.leaves_ids[0]
+        leaf_position = leaf_index - first_leaf
+        # Group the stash blocks by the deepest level they share with the path
+        blocks_by_level = [[] for _ in range(self.tree_height + 1)]
+        for data_id, leaf in self.stash_leaves.items():
+            deepest_level = self.tree_height - ((leaf - first_leaf) ^ leaf_position).bit_length()
+            blocks_by_level[deepest_level].append(data_id)
+
+        path_blocks = []
+        candidates = []
+        for level in range(self.tree_height, -1, -1):
+            # Blocks that can go at this level or deeper and did not fit deeper
+            candidates.extend(blocks_by_level[level])
+            chosen = candidates[-capacity:] if capacity else []
+            del candidates[len(candidates) - len(chosen):]
+            path_blocks.append([(data_id, self.stash.pop(data_id), self.stash_leaves.pop(data_id))
+                                for data_id in chosen])
+        path_blocks.reverse()
+        return path_blocks
+
+    def evict_path(self, leaf_index: int, path_ids: List[int], server: Server) -> None:
+        """
+        Write the path to the given leaf back from the leaf to the root, greedily filling every bucket with the stash
+        blocks that may reside in it (their own path passes through it). Every bucket is encrypted once, in one call,
+        and the path is written back in one call. Buckets of the tree-top cache stay decrypted in client memory.
+        :param leaf_index: Index of the leaf whose path was read.
+        :param path_ids: Indices of the buckets along the path, from the root to the leaf.
+        :param server: Instance of the Server class containing the storage.
+        :return: The encrypted buckets written to the server, from the root (or the first level below the tree-top
+        cache) to the leaf.
+        """
+        path_buckets = []
+        for level, bucket in enumerate(self.take_path_blocks(leaf_index, self.bucket_size)):
+            if level < self.tree_top_levels:
+                self.tree_top[path_ids[level]] = bucket
+                continue
+            bucket.extend([self.dummy_block] * (self.bucket_size - len(bucket)))
+            path_buckets.append(bucket)
+        return self.write_server_path(leaf_index, self.encrypt_buckets(path_buckets), server)
+
+    def access(self, server: Server, operation: str, data_id: int, data: bytes = None,
+               update: Callable[[bytes | None], bytes] = None) -> bytes | None:
+        """
+        A single Path ORAM access: remap the block to a new random leaf, read its whole old path into the stash, apply
+        the operation in the stash and write the path back with evict_path().
+        Ids that are not stored get a random path read, so the server cannot tell them apart.
+        :param server: Server object
+        :param operation: STORE, RETRIEVE or DELETE
+        :param data_id: ID of the data to access
+        :param data: New data, for STORE
+        :param update: For STORE instead of data, called with the current data (or None) to compute the new data
+        :return: The data stored under data_id before the access, or None.
+        """
+        leaf, new_leaf = self.begin_access(operation, data_id)
+        with self.stats.timer('read_path'):
+            path_buckets = self.read_server_path(leaf, server)
+        result, _ = self.finish_access(server, operation, data_id, leaf, new_leaf, path_buckets, data, update)
+        return result
+
+    def begin_access(self, operation: str, data_id: int) -> Tuple[int, int | None]:
+        """
+        First phase of access(): remap the block in the position map, without any server I/O.
+        :param operation: STORE, RETRIEVE or DELETE
+        :param data_id: ID of the data to access
+        :return: The leaf whose path must be read, and the new leaf of the block (None for DELETE).
+        """
+        self.stats.count(f'accesses.{operation}')
+        new_leaf = None if operation == DELETE else self.random_leaf()
+        # A single position map access, which matters when the position map is itself an ORAM
+        with self.stats.timer('position_map'):
+            leaf = self.position_map.remap(data_id, new_leaf, create=operation == STORE)
+        if leaf is None:
+            leaf = self.random_leaf()
+        return leaf, new_leaf
+
+    def finish_access(self, server: Server, operation: str, data_id: int, leaf: int, new_leaf: int | None,
+                      path_buckets, data: bytes = None, update: Callable[[bytes | None], bytes] = None):
+        """
+        Second phase of access(): given the path read for begin_access(), apply the operation in the stash and write
+        the path back.
+        :param server: Server object
+        :param operation: STORE, RETRIEVE or DELETE
+        :param data_id: ID of the data to access
+        :param leaf: Leaf returned by begin_access()
+        :param new_leaf: New leaf returned by begin_access()
+        :param path_buckets: Encrypted buckets on the path to leaf, from the root, see read_server_path()
+        :param data: New data, for STORE
+        :param update: For STORE instead of data, called with the current data (or None) to compute the new data
+        :return: The data stored under data_id before the access (or None), and the encrypted buckets written back.
+        """
+        path_ids = BinaryTree.get_path_to_leaf(leaf, self.tree_height)
+        self.add_buckets_to_stash(path_buckets)
+        self.move_tree_top_to_stash(path_ids[:self.tree_top_levels])
+
+        result = self.apply_to_stash(operation, data_id, new_leaf, data, update)
+
+        with self.stats.timer('evict'):
+            written_path = self.evict_path(leaf, path_ids, server)
+        self.commit(server)
+        self.record_stash_size()
+        return result, written_path
+
+    def apply_to_stash(self, operation: str, data_id: int, new_leaf: int | None, data: bytes = None,
+                       update: Callable[[bytes | None], bytes] = None) -> bytes | None:
+        """
+        Apply an operation to the stash, once the block of the data id (if stored) has been read into it.
+        :param operation: STORE, RETRIEVE or DELETE
+        :param data_id: ID of the data to access
+        :param new_leaf: New leaf of the block, from begin_access()
+        :param data: New data, for STORE
+        :param update: For STORE instead of data, called with the current data (or None) to compute the new data
+        :return: The data stored under data_id before the operation, or None.
+        """
+        result = self.stash.get(data_id)
+        if operation == STORE:
+            self.stash[data_id] = as_payload(data if update is None else update(result))
+        if operation == DELETE:
+            self.stash.pop(data_id, None)
+            self.stash_leaves.pop(data_id, None)
+        elif data_id in self.stash:
+            self.stash_leaves[data_id] = new_leaf
+        return result
+
+    def dummy_access(self, server: Server) -> None:
+        """
+        An access indistinguishable from a real one for the server, to pad timing channels: read a uniformly random
+        path and write it back re-encrypted, leaving the position map and the stash as they are. The blocks are
+        re-randomized without being decrypted, see rerandomize_buckets(), so it costs less client CPU than access().
+        A recursive position map (PATH_EVICTION only) gets one dummy access too, as it gets one access on every real
+        access. With OVERFLOW_EVICTION the position map is flat, so its lookups are not seen by the server, and the
+        access is shaped like retrieve_data(): the random path and the root bucket are rewritten, then
+        prevent_overflow() runs, as after an insertion into the root.
+        :param server: Server object
+        """
+        self.stats.count('accesses.dummy')
+        if self.eviction == PATH_EVICTION:
+            with self.stats.timer('position_map'):
+                self.position_map.dummy_access()
+        leaf = self.random_leaf()
+        with self.stats.timer('read_path'):
+            path_buckets = self.read_server_path(leaf, server)
+        self.write_server_path(leaf, self.rerandomize_buckets(path_buckets), server)
+        if self.eviction == OVERFLOW_EVICTION:
+            self.rerandomize_root(server)
+            with self.stats.timer('position_map'):
+                self.position_map.dummy_access()
+            with self.stats.timer('prevent_overflow'):
+                self.prevent_overflow(server)
+        self.commit(server)
+
+    def background_access(self, server: Server) -> int:
+        """
+        A dummy access doing deferred work, for the idle slots of a client padding its timing channel. The server
+        sees the same I/O as in dummy_access(), but the stash is drained: with PATH_EVICTION the random path is read
+        into the stash and written back with evict_path(), and with OVERFLOW_EVICTION one stash block is inserted into
+        the root if it has room. The path is chosen at random whatever the stash holds, so the work done leaks nothing.
+        A recursive position map (PATH_EVICTION only) gets exactly one dummy access, as in dummy_access().
+        Falls back to the cheaper dummy_access() while the stash is empty.
+        :param server: Server object
+        :return: Number of stash blocks moved to the tree.
+        """
+        if not self.stash:
+            self.dummy_access(server)
+            return 0
+        self.stats.count('accesses.background')
+        stash_size = len(self.stash)
+        leaf = self.random_leaf()
+        if self.eviction == PATH_EVICTION:
+            with self.stats.timer('position_map'):
+                self.position_map.dummy_access()
+            path_ids = BinaryTree.get_path_to_leaf(leaf, self.tree_height)
+            with self.stats.timer('read_path'):
+                path_buckets = self.read_server_path(leaf, server)
+            self.add_buckets_to_stash(path_buckets)
+            self.move_tree_top_to_stash(path_ids[:self.tree_top_levels])
+            with self.stats.timer('evict'):
+                self.evict_path(leaf, path_ids, server)
+        else:
+            with self.stats.timer('read_path'):
+                path_buckets = self.read_server_path(leaf, server)
+            self.write_server_path(leaf, self.rerandomize_buckets(path_buckets), server)
+            data_id = next(iter(self.stash))
+            root_bucket = server.get_bucket_by_index(ROOT_ID)
+            inserted = self.insert_data_to_bucket(data_id, self.stash[data_id], root_bucket, ROOT_ID, server)
+            if not inserted:
+                server.write_bucket_by_index(ROOT_ID, self.rerandomize_buckets([root_bucket])[0])
+                self.mark_written([ROOT_ID])
+            with self.stats.timer('position_map'):
+                if inserted:
+                    self.stash.pop(data_id)
+                    self.position_map[data_id] = self.random_leaf()
+                else:
+                    self.position_map.dummy_access()
+            with self.stats.timer('prevent_overflow'):
+                self.prevent_overflow(server)
+        self.commit(server)
+        self.record_stash_size()
+        evicted = stash_size - len(self.stash)
+        self.stats.count('background_blocks_evicted', evicted)
+        return evicted
+
+    def rerandomize_root(self, server: Server) -> None:
+        """
+        Read the root bucket and write it back re-encrypted, as an insertion into the root would.
+        """
+        root_bucket = server.get_bucket_by_index(ROOT_ID)
+        self.check_written([ROOT_ID], [root_bucket])
+        server.write_bucket_by_index(ROOT_ID, self.rerandomize_buckets([root_bucket])[0])
+        self.mark_written([ROOT_ID])
+
+    def commit(self, server: Server) -> None:
+        """
+        End of every access, in either eviction mode, including those that only change the stash: record the new
+        client state in the state log, if any, then make the server writes durable. A crash in between rolls the
+        server back, and the state log drops its last record on restore. The state log is only compacted once the
+        server writes are durable.
+        """
+        with self.stats.timer('flush'):
+            if self.state_log is not None:
+                self.state_log.record(self)
+            server.flush()
+            if self.state_log is not None:
+                self.state_log.flushed(self)
+
+    def evict_buckets(self, bucket_ids: List[int], server: Server) -> None:
+        """
+        Write back a set of buckets forming a union of paths, deepest level first, greedily filling every bucket with
+        the stash blocks whose path passes through it. Every bucket is encrypted once and written once, and all
+        buckets are encrypted and written back in one call each. Buckets of the tree-top cache stay in client memory.
+        :param bucket_ids: Indices of the buckets to write, a union of root-to-leaf paths.
+        :param server: Instance of the Server class containing the storage.
+        """
+        bucket_ids = sorted(bucket_ids)
+        buckets_by_level = [[] for _ in range(self.tree_height + 1)]
+        for bucket_id in bucket_ids:
+            buckets_by_level[(bucket_id + 1).bit_length() - 1].append(bucket_id)
+
+        buckets = {}
+        for level in range(self.tree_height, -1, -1):
+            shift = self.tree_height - level
+            level_buckets = set(buckets_by_level[level])
+            # Stash blocks whose path passes through a written bucket of this level
+            candidates = {}
+            for data_id, leaf in self.stash_leaves.items():
+                ancestor = ((leaf + 1) >> shift) - 1
+                if ancestor in level_buckets:
+                    candidates.setdefault(ancestor, []).append(data_id)
+            for bucket_id in buckets_by_level[level]:
+                chosen = candidates.get(bucket_id, [])[:self.bucket_size]
+                bucket = [(data_id, self.stash.pop(data_id), self.stash_leaves.pop(data_id)) for data_id in chosen]
+                if bucket_id < self.tree_top_size:
+                    self.tree_top[bucket_id] = bucket
+                    continue
+                bucket.extend([self.dummy_block] * (self.bucket_size - len(bucket)))
+                buckets[bucket_id] = bucket
+        bucket_ids = bucket_ids[bisect_left(bucket_ids, self.tree_top_size):]
+        encrypted_buckets = self.encrypt_buckets([buckets[bucket_id] for bucket_id in bucket_ids])
+        self.last_write = (bucket_ids[-1], self.bucket_tag(encrypted_buckets[-1]))
+        self.write_buckets(bucket_ids, encrypted_buckets, server)
+
+    def access_many(self, server: Server, requests: List[Tuple[str, int, bytes | None]]) -> List[bytes | None]:
+        """
+        Serve several requests with one read of the de-duplicated union of their paths and one write back of every
+        bucket in it. Each request still reads exactly one random path, so the server only learns the number of
+        requests: ids that are not stored, and repeated ids after their first occurrence, read a random path.
+        :param server: Server object
+        :param requests: List of (operation, data_id, data) with operation STORE, RETRIEVE or DELETE.
+        :return: For every request, the data stored under its id before it was served, or None.
+        """
+        path_ids = set()
+        seen = set()
+        new_leaves = []
+        self.stats.count('batches')
+        for operation, data_id, _ in requests:
+            self.stats.count(f'accesses.{operation}')
+            new_leaf = None if operation == DELETE else self.random_leaf()
+            with self.stats.timer('position_map'):
+                leaf = self.position_map.remap(data_id, new_leaf, create=operation == STORE)
+            if leaf is None or data_id in seen:  # a repeated id is already in the stash after its first path
+                leaf = self.random_leaf()
+            seen.add(data_id)
+            new_leaves.append(new_leaf)
+            path_ids.update(BinaryTree.get_path_to_leaf(leaf, self.tree_height))
+
+        path_ids = sorted(path_ids)
+        num_of_cached = bisect_left(path_ids, self.tree_top_size)
+        with self.stats.timer('read_path'):
+            path_buckets = server.get_buckets_by_ids(path_ids[num_of_cached:])
+        self.verify_buckets(path_ids[num_of_cached:], path_buckets)
+        self.add_buckets_to_stash(path_buckets)
+        self.move_tree_top_to_stash(path_ids[:num_of_cached])
+
+        results = [self.apply_to_stash(operation, data_id, new_leaf, data)
+                   for (operation, data_id, data), new_leaf in zip(requests, new_leaves)]
+
+        with self.stats.timer('evict'):
+            self.evict_buckets(path_ids, server)
+        self.commit(server)
+        self.record_stash_size()
+        return results
+
+    def record_stash_size(self) -> None:
+        self.num_of_accesses += 1
+        self.stash_size_sum += len(self.stash)
+        self.max_stash_size = max(self.max_stash_size, len(self.stash))
+        self.stats.high_water('stash_size', len(self.stash))
+
+    def stash_stats(self) -> dict:
+        """
+        :return: Current, maximal and average stash size after an access, and the number of accesses measured.
+        """
+        return {
+            'current': len(self.stash),
+            'max': self.max_stash_size,
+            'average': self.stash_size_sum / self.num_of_accesses if self.num_of_accesses else 0.0,
+            'accesses': self.num_of_accesses,
+        }
+
+    def stats_snapshot(self) -> dict:
+        """
+        :return: Snapshot of the recorded counters, phase timers and high-water marks (see Stats.snapshot()), with the
+        stash statistics under 'stash'.
+        """
+        snapshot = self.stats.snapshot()
+        snapshot['stash'] = self.stash_stats()
+        return snapshot
+
+    def is_valid_block(self, data_id: int, data: bytes | str) -> bool:
+        if data is None or not 0 < len(as_payload(data)) <= self.data_size:
+            print(f'Error: data must be 1 to {self.data_size} bytes')
+            return False
+        if not isinstance(data_id, int) or not 0 <= data_id <= MAX_ID or not self.position_map.accepts(data_id):
+            print('Error: data_id must be a non-negative 64 bit integer supported by the position map')
+            return False
+        return True
+
     ############ Encryption & Decryption ##############
 
-    def encrypt_data(self, data_id: int | str, data: str) -> str | bytes:
+    def encode_block(self, data_id: int | str, data: bytes, leaf: int = None) -> bytes:
         """
-        Encrypts the given data with the specified data ID. Using AES with CTR mode.
-        :param data_id: The identifier for the data to be encrypted.
-        :param data: The actual data to be encrypted.
-        :return: The encrypted data as a combination of nonce and ciphertext, or plain concatenation if encryption is not used.
+        Serialize a block to its plaintext: BLOCK_HEADER followed by the data, zero padded to data_size bytes.
+        Dummy blocks are all zeros.
+        """
+        if data_id == DUMMY_ID:
+            return self.dummy_plaintext
+        header = BLOCK_HEADER.pack(REAL_BLOCK, data_id, 0 if leaf is None else leaf + 1, len(data))
+        return b''.join((header, data, bytes(self.data_size - len(data))))
+
+    def decode_block(self, plaintext: bytes | memoryview) -> Tuple[int | str, bytes, int | None]:
         """
-        # Generate a random nonce
-        nonce = Random.get_random_bytes(8)
-        counter = Counter.new(64, nonce)
-        cipher = AES.new(self.secret_key, AES.MODE_CTR, counter=counter)
+        Parse a plaintext produced by encode_block back to the data ID, the data and the leaf.
+        """
+        flags, data_id, leaf, length = BLOCK_HEADER.unpack_from(plaintext)
+        if not flags & REAL_BLOCK:
+            return self.dummy_block
+        # The server won't be able to trick the client into accepting corrupt data
+        if length > self.data_size:
+            raise ValueError("decryption failed. there was a problem.")
+        return data_id, bytes(plaintext[BLOCK_HEADER.size:BLOCK_HEADER.size + length]), leaf - 1 if leaf else None
 
-        # Convert the data (str) to bytes
-        data_in_bytes = str(str(data_id) + data).encode()
+    def encrypt_bucket(self, bucket: List[Tuple[int | str, bytes, int | None]]) -> List[bytes]:
+        """
+        Encrypt all the blocks of a bucket in one call.
+        :param bucket: List of (data ID, data, leaf) blocks.
+        :return: List of encrypted blocks.
+        """
+        if self.bucket_sealing:
+            return self.encrypt_buckets([bucket])[0]
+        stats = self.stats
+        if not stats.enabled:
+            return self.cipher.encrypt_blocks([self.encode_block(*block) for block in bucket])
+        stats.count('encrypt_calls')
+        stats.count('blocks_encrypted', len(bucket))
+        with stats.timer('encrypt'):
+            return self.cipher.encrypt_blocks([self.encode_block(*block) for block in bucket])
+
+    def decrypt_bucket(self, bucket) -> List[Tuple[int | str, bytes, int | None]]:
+        """
+        Verify and decrypt all the blocks of a bucket in one call.
+        :param bucket: List of encrypted blocks.
+        :return: List of (data ID, data, leaf) blocks.
+        """
+        if self.bucket_sealing:
+            return self.decrypt_buckets([bucket])[0]
+        stats = self.stats
+        if not stats.enabled:
+            return self.decrypt_blocks(bucket)
+        stats.count('decrypt_calls')
+        stats.count('blocks_decrypted', len(bucket))
+        with stats.timer('decrypt'):
+            return self.decrypt_blocks(bucket)
 
-        # Encrypt the data
-        cipher_in_bytes = cipher.encrypt(data_in_bytes)
-        # Calculate HMAC of the ciphertext
-        hmac_key = hashlib.sha256(self.secret_key).digest()
-        hmac = HMAC.new(hmac_key, digestmod=SHA256)
-        hmac.update(nonce + cipher_in_bytes)
-        tag = hmac.digest()
+    def decrypt_blocks(self, blocks) -> List[Tuple[int | str, bytes, int | None]]:
+        """
+        Verify, decrypt and decode blocks in one cipher call. With lazy_init, never written blocks are dummies.
+        """
+        if not self.lazy_init:
+            return [self.decode_block(plaintext) for plaintext in self.cipher.decrypt_blocks(blocks)]
+        written = [block != self.unwritten_block for block in blocks]
+        plaintexts = iter(self.cipher.decrypt_blocks([block for block, is_written in zip(blocks, written) if is_written]))
+        return [self.decode_block(next(plaintexts)) if is_written else self.dummy_block for is_written in written]
 
-        # Return the combination of nonce and ciphertext
-        return nonce + cipher_in_bytes + tag
+    def encrypt_buckets(self, buckets: List[List[Tuple[int | str, bytes, int | None]]]) -> List[List[bytes]]:
+        """
+        Encrypt several buckets (e.g. a whole path) in one call.
+        :param buckets: List of buckets, each a list of (data ID, data, leaf) blocks.
+        :return: List of encrypted buckets.
+        """
+        if self.bucket_sealing:
+            return self.seal_buckets(buckets)
+        encrypted_blocks = self.encrypt_bucket([block for bucket in buckets for block in bucket])
+        return [encrypted_blocks[offset:offset + self.bucket_size]
+                for offset in range(0, len(encrypted_blocks), self.bucket_size)]
 
-    def decrypt_data(self, data: str | bytes) -> Tuple[int | str, str]:
+    def decrypt_buckets(self, buckets) -> List[List[Tuple[int | str, bytes, int | None]]]:
+        """
+        Verify and decrypt several buckets (e.g. a whole path) in one call.
+        :param buckets: List of encrypted buckets.
+        :return: List of buckets, each a list of (data ID, data, leaf) blocks.
+        """
+        if self.bucket_sealing:
+            return self.unseal_buckets(buckets)
+        blocks = self.decrypt_bucket([block for bucket in buckets for block in bucket])
+        return [blocks[offset:offset + self.bucket_size] for offset in range(0, len(blocks), self.bucket_size)]
+
+    def rerandomize_buckets(self, buckets) -> List[List[bytes]]:
+        """
+        Verify several encrypted buckets and re-encrypt them under fresh nonces in one call, without decrypting them,
+        see BucketCipher.rerandomize_blocks().
+        :param buckets: List of encrypted buckets.
+        :return: List of encrypted buckets, holding the same plaintexts.
+        """
+        if self.bucket_sealing:
+            return self.rerandomize_sealed_buckets(buckets)
+        blocks = [block for bucket in buckets for block in bucket]
+        self.stats.count('blocks_rerandomized', len(blocks))
+        with self.stats.timer('rerandomize'):
+            if self.lazy_init and self.unwritten_block in blocks:
+                # Never written blocks get their first encryption, as fresh dummies
+                written = [index for index, block in enumerate(blocks) if block != self.unwritten_block]
+                unwritten = [index for index, block in enumerate(blocks) if block == self.unwritten_block]
+                rerandomized = self.cipher.rerandomize_blocks([blocks[index] for index in written])
+                fresh = self.cipher.encrypt_blocks([self.dummy_plaintext] * len(unwritten))
+                for index, block in zip(written + unwritten, rerandomized + fresh):
+                    blocks[index] = block
+            else:
+                blocks = self.cipher.rerandomize_blocks(blocks)
+        return [blocks[offset:offset + self.bucket_size] for offset in range(0, len(blocks), self.bucket_size)]
+
+    def seal_buckets(self, buckets: List[List[Tuple[int | str, bytes, int | None]]]) -> List[List[bytes]]:
+        """
+        Encrypt several buckets in one call, every bucket as a single unit: the plaintexts of its blocks are concatenated
+        and encrypted and authenticated with one nonce and one tag, see split_bucket() for the stored form.
+        :param buckets: List of buckets, each a list of (data ID, data, leaf) blocks.
+        :return: List of encrypted buckets.
+        """
+        plaintexts = [b''.join([self.encode_block(*block) for block in bucket]) for bucket in buckets]
+        stats = self.stats
+        stats.count('encrypt_calls')
+        stats.count('blocks_encrypted', len(buckets) * self.bucket_size)
+        with stats.timer('encrypt'):
+            return [self.split_bucket(sealed) for sealed in self.cipher.encrypt_blocks(plaintexts)]
+
+    def unseal_buckets(self, buckets) -> List[List[Tuple[int | str, bytes, int | None]]]:
+        """
+        Verify and decrypt several buckets sealed by seal_buckets() in one call. With lazy_init, never written buckets
+        hold dummies.
+        :param buckets: List of encrypted buckets.
+        :return: List of buckets, each a list of (data ID, data, leaf) blocks.
+        """
+        sealed_buckets = [self.sealed_part(bucket) for bucket in buckets]
+        unwritten = bytes(self.sealed_size)
+        written = [not self.lazy_init or sealed != unwritten for sealed in sealed_buckets]
+        stats = self.stats
+        stats.count('decrypt_calls')
+        stats.count('blocks_decrypted', len(buckets) * self.bucket_size)
+        with stats.timer('decrypt'):
+            plaintexts = iter(self.cipher.decrypt_blocks([sealed for sealed, is_written in zip(sealed_buckets, written)
+                                                          if is_written]))
+            plaintext_size = BLOCK_HEADER.size + self.data_size
+            decrypted = []
+            for is_written in written:
+                if not is_written:
+                    decrypted.append([self.dummy_block] * self.bucket_size)
+                    continue
+                plaintext = next(plaintexts)
+                decrypted.append([self.decode_block(plaintext[offset:offset + plaintext_size])
+                                  for offset in range(0, len(plaintext), plaintext_size)])
+            return decrypted
+
+    def rerandomize_sealed_buckets(self, buckets) -> List[List[bytes]]:
+        """
+        rerandomize_buckets() of buckets sealed by seal_buckets(). With lazy_init, never written buckets are sealed for
+        the first time, as buckets of dummies.
+        """
+        sealed_buckets = [self.sealed_part(bucket) for bucket in buckets]
+        self.stats.count('blocks_rerandomized', len(buckets) * self.bucket_size)
+        with self.stats.timer('rerandomize'):
+            unwritten = bytes(self.sealed_size)
+            if self.lazy_init and unwritten in sealed_buckets:
+                written = [index for index, sealed in enumerate(sealed_buckets) if sealed != unwritten]
+                fresh = self.seal_buckets([[self.dummy_block] * self.bucket_size] *
+                                          (len(buckets) - len(written)))
+                rerandomized = self.cipher.rerandomize_blocks([sealed_buckets[index] for index in written])
+                rerandomized = iter([self.split_bucket(sealed) for sealed in rerandomized])
+                fresh = iter(fresh)
+                written = set(written)
+                return [next(rerandomized) if index in written else next(fresh) for index in range(len(buckets))]
+            return [self.split_bucket(sealed) for sealed in self.cipher.rerandomize_blocks(sealed_buckets)]
+
+    def split_bucket(self, sealed: bytes) -> List[bytes]:
+        """
+        Stored form of a sealed bucket: room for the children hashes of the Merkle tree (if any, filled in when the
+        bucket is written), the sealed bucket and zero padding, split into bucket_size server blocks.
+        """
+        block_size = self.block_size
+        padding = self.bucket_size * block_size - self.hashes_offset - len(sealed)
+        stored = b''.join((bytes(self.hashes_offset), sealed, bytes(padding)))
+        return [stored[offset:offset + block_size] for offset in range(0, len(stored), block_size)]
+
+    def sealed_part(self, bucket) -> bytes:
+        """
+        The sealed bucket out of its stored form, see split_bucket().
+        """
+        return b''.join(bucket)[self.hashes_offset:self.hashes_offset + self.sealed_size]
+
+    def bucket_tag(self, bucket) -> bytes:
+        """
+        Authentication tag of an encrypted bucket, which changes on every write: the tag of its first block, or of the
+        whole bucket if it is sealed.
+        """
+        if not self.bucket_sealing:
+            return bytes(bucket[0][-TAG_SIZE:])
+        return self.sealed_part(bucket)[-TAG_SIZE:]
+
+    def encrypt_data(self, data_id: int | str, data: bytes) -> bytes:
+        """
+        Encrypts the given data with the specified data ID. Using AES with CTR mode.
+        :param data_id: The identifier for the data to be encrypted.
+        :param data: The actual data to be encrypted.
+        :return: The encrypted data as a combination of nonce, ciphertext and HMAC tag.
+        """
+        return self.encrypt_bucket([(data_id, data, None)])[0]
+
+    def decrypt_data(self, data: bytes) -> Tuple[int | str, bytes]:
         """
         Decrypts the given encrypted data.
 
-        :param data: The encrypted data to be decrypted. This can be a string or bytes.
+        :param data: The encrypted data to be decrypted. This can be bytes or a memoryview.
         :return: A tuple containing the data ID (or identifier) and the actual data.
         """
-        # Decryption logic when encryption is used
-        nonce_in_bytes, ciphertext_in_bytes, tag = data[:NONCE_SIZE], data[NONCE_SIZE:-KEY_SIZE], data[-KEY_SIZE:]
-        # Verify HMAC of the ciphertext
-        hmac_key = hashlib.sha256(self.secret_key).digest()
-        hmac = HMAC.new(hmac_key, digestmod=SHA256)
-        hmac.update(nonce_in_bytes + ciphertext_in_bytes)
-        # The server won't be unable to trick the client into accepting outdated data
-        try:
-            hmac.verify(tag)
-        except ValueError:
-            raise ValueError("Decryption failed: authentication failed")
-
-        counter = Counter.new(64, nonce_in_bytes)
-        cipher = AES.new(self.secret_key, AES.MODE_CTR, counter=counter)
-
-        try:
-            # Decrypt the ciphertext
-            plaintext = bytes.decode(cipher.decrypt(ciphertext_in_bytes))
-
-            # Extract the ID and actual data
-            if plaintext[:-DATA_SIZE].isnumeric():  # If ID is a number, it's not dummy data
-                data_id = int(plaintext[:-DATA_SIZE])
-                data = plaintext[-DATA_SIZE:]
-            else:  # If ID is not a number, it's dummy data
-                data_id = plaintext[:-DATA_SIZE]
-                data = plaintext[-DATA_SIZE:]
-            return data_id, data
-        # The server won't be unable to trick the client into accepting corrupt data
-        except (ValueError, KeyError) as e:
-            print("Incorrect decryption:", e)
-            raise "decryption failed. there was a problem."
+        data_id, data, _ = self.decrypt_bucket([data])[0]
+        return data_id, data
 
     ################ API  ##############
 
-    def store_data(self, server: Server, data_id: int, data: str) -> bool:
+    def store_data(self, server: Server, data_id: int, data: bytes | str) -> bool:
         """
         Store the data in the root bucket. Decrypt the root bucket and locate a dummy entry to substitute with the given data.
         Assign a new random leaf to the data and update the position map.
@@ -343,28 +1156,35 @@ class Client:
         :return: requested data.
         """
 
+        if not self.is_valid_block(data_id, data):
+            return False
+        data = as_payload(data)
+        if self.eviction == PATH_EVICTION:
+            self.access(server, STORE, data_id, data)
+            return True
         if data_id in self.position_map:
             self.retrieve_data(server, data_id, data)
             return True
-        if not data or len(data) != DATA_SIZE:
-            print(f'Error: data must be string of {DATA_SIZE} characters')
-            return False
-        if self.is_bucket_full(ROOT_ID, server):
+        root_bucket = server.get_bucket_by_index(ROOT_ID)
+        if not self.insert_data_to_bucket(data_id, data, root_bucket, ROOT_ID, server):
             print("Root is full, probably because tree is overflowing. Storing data in stash")
+            self.stats.count('root_full_fallbacks')
             self.stash[data_id] = data
+            self.stats.high_water('stash_size', len(self.stash))
+            self.commit(server)
             return True
 
-        encrypted_data = self.encrypt_data(data_id, data)
-        root_bucket = server.get_bucket_by_index(ROOT_ID)
-        self.insert_data_to_bucket(encrypted_data, root_bucket, ROOT_ID, server)
-
         # Allocate a new random leaf for the data and store it in the position map.
-        self.position_map[data_id] = random.choice(self.leaves_ids)
+        self.position_map[data_id] = self.random_leaf()
+        self.stats.count('root_insertions')
         # Shift data blocks downwards in the tree structure to prevent overflows.
-        self.prevent_overflow(server)
+        with self.stats.timer('prevent_overflow'):
+            self.prevent_overflow(server)
+        # The access is complete, make it durable on persistent servers
+        self.commit(server)
         return True
 
-    def retrieve_data(self, server: Server, data_id: int, data=None) -> str | None:
+    def retrieve_data(self, server: Server, data_id: int, data=None) -> bytes | None:
         """
         Retrieve the data by its ID. Search for the correct path from the root to the leaf for the given data using its ID.
         Call store_data() to write the retrieved data back to the root.
@@ -373,6 +1193,10 @@ class Client:
         :param data: None if called as API call, new data if called from store_data API call
         :return: Requested data.
         """
+        if self.eviction == PATH_EVICTION:
+            if data:  # in case we want to replace the data
+                return data if self.store_data(server, data_id, data) else None
+            return self.access(server, RETRIEVE, data_id)
         # first search in stash
         if data_id in self.stash:
             searched_data = self.stash[data_id]
@@ -382,21 +1206,76 @@ class Client:
             # the data is in the path from root to leaf_of_data
             leaf_of_data = self.position_map[data_id]
             path_buckets, path_ids = self.read_path(leaf_of_data, server)
-            # Traverse the path from the root to the leaf, searching for the desired data along the way.
-            searched_data = None
-            for bucket_index, bucket in zip(path_ids, path_buckets):
-                still_searching = searched_data is None
-                removed_data = self.remove_data_from_bucket(data_id, bucket, bucket_index, server, still_searching)
-                if still_searching:
-                    searched_data = removed_data
+            # Search the path from the root to the leaf for the desired data.
+            searched_data = self.remove_data_from_path(data_id, path_buckets, path_ids, server)
             # Since the data is no longer in storage, remove its ID from the position map.
             self.position_map.pop(data_id)
             if data:  # in case we want to replace the data
-                searched_data = data
+                searched_data = as_payload(data)
         # store the data after it has been read, in order to shuffle the tree
         self.store_data(server, data_id, searched_data)
         return searched_data
 
+    def update_data(self, server: Server, data_id: int, update: Callable[[bytes | None], bytes]) -> None:
+        """
+        Replace the data of the given ID by update(current data), where the current data is None if the ID is not
+        stored, in a single access. Requires PATH_EVICTION.
+        :param server: Server object
+        :param data_id: ID of the data to update
+        :param update: Function computing the new data from the current data
+        """
+        if self.eviction != PATH_EVICTION:
+            raise ValueError("update_data requires PATH_EVICTION")
+        self.access(server, STORE, data_id, update=update)
+
+    def store_many(self, server: Server, items: List[Tuple[int, bytes | str]]) -> List[bool]:
+        """
+        Store several data items. With PATH_EVICTION all of them are served by one read and one write of the union of
+        their paths, see access_many().
+        :param server: Server object
+        :param items: List of (data_id, data) pairs
+        :return: For every item, whether it was stored.
+        """
+        if self.eviction != PATH_EVICTION:
+            return [self.store_data(server, data_id, data) for data_id, data in items]
+        valid = [self.is_valid_block(data_id, data) for data_id, data in items]
+        requests = [(STORE, data_id, data) for (data_id, data), is_valid in zip(items, valid) if is_valid]
+        if requests:
+            self.access_many(server, requests)
+        return valid
+
+    def retrieve_many(self, server: Server, data_ids: List[int]) -> List[bytes | None]:
+        """
+        Retrieve several data items. With PATH_EVICTION all of them are served by one read and one write of the union
+        of their paths, see access_many().
+        :param server: Server object
+        :param data_ids: IDs to find in the server
+        :return: The requested data, None for IDs that are not stored.
+        """
+        if self.eviction != PATH_EVICTION:
+            return [self.retrieve_data(server, data_id) for data_id in data_ids]
+        if not data_ids:
+            return []
+        return self.access_many(server, [(RETRIEVE, data_id, None) for data_id in data_ids])
+
+    def delete_many(self, server: Server, data_ids: List[int]) -> None:
+        """
+        Delete several data items. With PATH_EVICTION all of them are served by one read and one write of the union
+        of their paths, see access_many().
+        :param server: Server object
+        :param data_ids: IDs to delete from the server
+        """
+        if self.eviction != PATH_EVICTION:
+            for data_id in data_ids:
+                self.delete_data(server, data_id)
+            return
+        if not data_ids:
+            return
+        results = self.access_many(server, [(DELETE, data_id, None) for data_id in data_ids])
+        for data_id, result in zip(data_ids, results):
+            if result is None:
+                print(f'Error: given data_id {data_id} does not exist in server')
+
     def delete_data(self, server: Server, data_id: int, data=None) -> None:
         """
         Remove the data corresponding to the given ID and delete the ID from the position_map.
@@ -405,21 +1284,21 @@ class Client:
         :param data: unused
         :return: None
         """
+        if self.eviction == PATH_EVICTION:
+            if self.access(server, DELETE, data_id) is None:
+                print('Error: given data_id does not exist in server')
+            return
         if data_id in self.stash:  # delete file from stash
             self.stash.pop(data_id)
+            self.commit(server)
             return
         if data_id not in self.position_map:
             print('Error: given data_id does not exist in server')
             return
         leaf_of_data = self.position_map[data_id]
         path_buckets, path_ids = self.read_path(leaf_of_data, server)
-        # Traverse the path from the root to the leaf, searching for the desired data along the way.
-        searched_data = None
-        for bucket_index, bucket in zip(path_ids, path_buckets):
-            still_searching = searched_data is None
-            removed_data = self.remove_data_from_bucket(data_id, bucket, bucket_index, server,
-                                                        still_searching)
-            if still_searching:
-                searched_data = removed_data
+        # Search the path from the root to the leaf for the desired data and remove it.
+        self.remove_data_from_path(data_id, path_buckets, path_ids, server)
         # Since the data is no longer in storage, remove its ID from the position map.
         self.position_map.pop(data_id)
+        self.commit(server)
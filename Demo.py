@@ -1,7 +1,7 @@
 import queue
 import threading
 from math import ceil, log2
-from Client import Client
+from Client import Client, BUCKET_SIZE, BLOCK_SIZE, DATA_SIZE
 from Server import Server
 from WrapperClasses.DefaultClient import DefaultClient
 from WrapperClasses.AscendClient import AscendClient
@@ -38,7 +38,7 @@ class Demo:
         tree_height = max(0, ceil(log2(N)) - 1)
         num_of_leaves = 2 ** tree_height
         tree_size = (2 * num_of_leaves) - 1
-        server = Server(tree_size)
+        server = Server(tree_size, BUCKET_SIZE, BLOCK_SIZE)
         client = Client(N, server)
         self.request_queue = queue.Queue()
         self.result_queue = queue.Queue()
@@ -52,6 +52,7 @@ class Demo:
             if not rate.isnumeric():
                 print('Rate must be a positive number. Exiting.')
                 exit(1)
+            input('Press Enter to start client')
             self.client = AscendClient(N=N, client=client, server=server, request_queue=self.request_queue,
                                        result_queue=self.result_queue, rate=1 / int(rate),
                                        gui_update_callback=gui_update)
@@ -61,6 +62,7 @@ class Demo:
             if mode not in ['power', 'performance']:
                 print('Invalid mode. Exiting.')
                 exit(1)
+            input('Press Enter to start client')
             self.client = LearningAscendClient(N=N, client=client, server=server, request_queue=self.request_queue,
                                                result_queue=self.result_queue, mode=mode,
                                                gui_update_callback=gui_update)
@@ -101,9 +103,9 @@ class Demo:
     def handle_store(self):
         print('\n--- STORE ---')
         data_id = self.get_data_id_from_user()
-        data = input('Insert data (string of 4 characters): ')
-        if len(data) != 4:
-            print('Data must be a string of 4 characters. Please try again.')
+        data = input(f'Insert data (string of up to {DATA_SIZE} bytes): ')
+        if not 0 < len(data.encode()) <= DATA_SIZE:
+            print(f'Data must be a string of 1 to {DATA_SIZE} bytes. Please try again.')
             return
         self.request_queue.put(('store', data_id, data))
         print('Store operation completed.')
@@ -113,7 +115,7 @@ class Demo:
         data_id = self.get_data_id_from_user()
         self.request_queue.put(('retrieve', data_id, None))
         data = self.result_queue.get()
-        print(f'Data retrieved: {data}')
+        print(f'Data retrieved: {data if data is None else data.decode(errors="replace")}')
 
     def handle_delete(self):
         print('\n--- DELETE ---')
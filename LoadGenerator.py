@@ -0,0 +1,231 @@
+import argparse
+import queue
+import random
+import threading
+import time
+from bisect import bisect_left
+from itertools import accumulate
+from typing import List, Tuple
+from Client import Client, OVERFLOW_EVICTION, PATH_EVICTION, STORE, RETRIEVE, DELETE, BUCKET_SIZE, DATA_SIZE, \
+    get_block_size, get_tree_size
+from RingClient import RingClient, get_ring_bucket_size
+from Server import Server
+from Trace import TraceRecorder, TracedQueue, read_trace
+from WrapperClasses.AscendClient import AscendClient
+from WrapperClasses.DefaultClient import DefaultClient
+from WrapperClasses.LearningAscendClient import LearningAscendClient, MODES, percentile
+
+DEFAULT = '1'
+ASCEND = '2'
+LEARNING_ASCEND = '3'
+PRELOAD_BATCH = 256  # items per store_many() call when preloading the ORAM
+PATH_ENGINE = 'path'
+RING_ENGINE = 'ring'
+RECORDED_TIMING = 'recorded'
+FAST_TIMING = 'fast'
+
+
+def zipf_cum_weights(num_of_files: int, exponent: float) -> List[float]:
+    """
+    Cumulative weights of a Zipf distribution over range(num_of_files): id i has weight 1 / (i + 1) ** exponent.
+    """
+    return list(accumulate(1 / rank ** exponent for rank in range(1, num_of_files + 1)))
+
+
+def make_requests(num_of_files: int, num_of_requests: int, zipf: float, read_ratio: float, delete_ratio: float,
+                  data_size: int, rng: random.Random) -> List[Tuple[str, int, bytes | None]]:
+    """
+    Synthetic workload: requests on ids drawn uniformly (zipf == 0) or from a Zipf distribution, retrieves with
+    probability read_ratio, deletes with probability delete_ratio and stores otherwise.
+    """
+    if zipf:
+        cum_weights = zipf_cum_weights(num_of_files, zipf)
+        total = cum_weights[-1]
+        data_ids = [min(bisect_left(cum_weights, rng.random() * total), num_of_files - 1)
+                    for _ in range(num_of_requests)]
+    else:
+        data_ids = [rng.randrange(num_of_files) for _ in range(num_of_requests)]
+    requests = []
+    for data_id in data_ids:
+        draw = rng.random()
+        if draw < read_ratio:
+            requests.append((RETRIEVE, data_id, None))
+        elif draw < read_ratio + delete_ratio:
+            requests.append((DELETE, data_id, None))
+        else:
+            requests.append((STORE, data_id, rng.randbytes(data_size)))
+    return requests
+
+
+def poisson_arrivals(num_of_requests: int, rate: float, rng: random.Random) -> List[float]:
+    """
+    Arrival times in seconds of a Poisson process of rate requests per second.
+    """
+    return list(accumulate(rng.expovariate(rate) for _ in range(num_of_requests)))
+
+
+def run_workload(wrapper: DefaultClient, requests: List[Tuple[str, int, bytes | None]],
+                 arrivals: List[float] | None) -> Tuple[List[float], float]:
+    """
+    Submit the requests to the wrapper client and wait for all of them.
+    Open loop with arrivals: every request is submitted at its arrival time in seconds after the start, whatever the
+    progress of the earlier requests, and a latency runs from the arrival to the completion. Closed loop without
+    arrivals: every request is submitted when the previous one completes.
+    :return: The latency of every request in seconds, in the order of the requests, and the elapsed time.
+    """
+    latencies = [0.0] * len(requests)
+    lock = threading.Lock()
+    all_done = threading.Event()
+    remaining = [len(requests)]
+
+    def record(position: int, arrival: float):
+        def done(_):
+            latencies[position] = time.perf_counter() - arrival
+            with lock:
+                remaining[0] -= 1
+                if not remaining[0]:
+                    all_done.set()
+        return done
+
+    start = time.perf_counter()
+    for position, (operation, data_id, data) in enumerate(requests):
+        if arrivals:
+            arrival = start + arrivals[position]
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            arrival = time.perf_counter()
+        future = wrapper.submit(operation, data_id, data)
+        future.add_done_callback(record(position, arrival))
+        if not arrivals:
+            future.result()
+    if requests:
+        all_done.wait()
+    return latencies, time.perf_counter() - start
+
+
+def replay_requests(path: str, data_size: int, rng: random.Random) -> Tuple[List[Tuple[str, int, bytes | None]],
+                                                                            List[float]]:
+    """
+    Read a trace for replay. Stores of a trace recorded without data write random data of the recorded length.
+    :return: The requests and their arrival times in seconds.
+    """
+    requests, arrivals, lengths = read_trace(path)
+    for position, (operation, data_id, data) in enumerate(requests):
+        if operation == STORE and data is None:
+            requests[position] = (operation, data_id, rng.randbytes(min(lengths[position], data_size)))
+    return requests, arrivals
+
+
+def create_client(args) -> Tuple[Client, Server]:
+    tree_size = get_tree_size(args.num_of_files)
+    if args.engine == RING_ENGINE:
+        server = Server(tree_size, get_ring_bucket_size(), get_block_size(args.data_size))
+        return RingClient(args.num_of_files, server, data_size=args.data_size), server
+    block_size = get_block_size(args.data_size, args.bucket_sealing, BUCKET_SIZE, args.merkle)
+    server = Server(tree_size, BUCKET_SIZE, block_size)
+    return Client(args.num_of_files, server, eviction=args.eviction, data_size=args.data_size,
+                  bucket_sealing=args.bucket_sealing, merkle=args.merkle), server
+
+
+def create_wrapper(mode: str, args, client: Client, server: Server, request_queue: queue.Queue) -> DefaultClient:
+    result_queue = queue.Queue()
+    if mode == DEFAULT:
+        return DefaultClient(args.num_of_files, client, server, request_queue, result_queue, None)
+    if mode == ASCEND:
+        return AscendClient(args.num_of_files, client, server, request_queue, result_queue, 1 / args.ascend_rate, None)
+    return LearningAscendClient(args.num_of_files, client, server, request_queue, result_queue, args.learning_mode,
+                                None)
+
+
+def latency_line(latencies: List[float]) -> str:
+    milliseconds = [latency * 1000 for latency in latencies]
+    return (f'p50 {percentile(milliseconds, 50):.3f}  p95 {percentile(milliseconds, 95):.3f}  '
+            f'p99 {percentile(milliseconds, 99):.3f}  max {max(milliseconds):.3f}')
+
+
+def print_report(wrapper: DefaultClient, requests: List[Tuple[str, int, bytes | None]], latencies: List[float],
+                 elapsed: float) -> None:
+    print(f'requests:   {len(latencies)}')
+    print(f'elapsed:    {elapsed:.3f} s')
+    print(f'throughput: {len(latencies) / elapsed:.1f} requests/s')
+    if latencies:
+        print(f'latency ms: {latency_line(latencies)}')
+    for operation in (STORE, RETRIEVE, DELETE):
+        operation_latencies = [latency for request, latency in zip(requests, latencies) if request[0] == operation]
+        if operation_latencies:
+            print(f'  {operation:<8} {len(operation_latencies):>6}: {latency_line(operation_latencies)}')
+    print(f'coalesced:  {wrapper.coalesced_requests}')
+    if isinstance(wrapper, AscendClient):
+        print(f'slots:      {wrapper.slot_report()}')
+        print(f'background: {wrapper.background_work_report()}')
+    if isinstance(wrapper, LearningAscendClient):
+        print(f'learning:   {wrapper.latency_report()}')
+
+
+def main(argv: List[str] | None = None) -> None:
+    """
+    Headless load generator: drive a DefaultClient (mode 1), AscendClient (mode 2) or LearningAscendClient (mode 3)
+    with a synthetic workload or a recorded trace, and print throughput and latency percentiles, overall and per
+    operation. The requests can themselves be recorded to a trace, to replay them on other engines or settings.
+    """
+    parser = argparse.ArgumentParser(description='Headless ORAM load generator')
+    parser.add_argument('mode', choices=[DEFAULT, ASCEND, LEARNING_ASCEND],
+                        help='1: default client, 2: Ascend client, 3: learning Ascend client')
+    parser.add_argument('--num-of-files', type=int, default=2 ** 10)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--zipf', type=float, default=0.0, help='Zipf exponent of the ids, 0 for uniform ids')
+    parser.add_argument('--read-ratio', type=float, default=0.9)
+    parser.add_argument('--delete-ratio', type=float, default=0.0)
+    parser.add_argument('--rate', type=float, default=None,
+                        help='open-loop arrival rate in requests/s; closed loop if not given')
+    parser.add_argument('--engine', choices=[PATH_ENGINE, RING_ENGINE], default=PATH_ENGINE)
+    parser.add_argument('--eviction', choices=[PATH_EVICTION, OVERFLOW_EVICTION], default=PATH_EVICTION)
+    parser.add_argument('--data-size', type=int, default=DATA_SIZE)
+    parser.add_argument('--bucket-sealing', action='store_true', help='one nonce and tag per bucket (path engine)')
+    parser.add_argument('--merkle', action='store_true', help='Merkle freshness tree, implies --bucket-sealing')
+    parser.add_argument('--preload', type=float, default=1.0, help='fraction of the ids stored before the run')
+    parser.add_argument('--ascend-rate', type=float, default=100.0, help='ORAM accesses per second of mode 2')
+    parser.add_argument('--learning-mode', choices=list(MODES), default='performance')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', metavar='PATH', help='record the requests to a trace file')
+    parser.add_argument('--record-data', action='store_true', help='keep the stored data in the trace')
+    parser.add_argument('--replay', metavar='PATH', help='replay a trace instead of a synthetic workload')
+    parser.add_argument('--timing', choices=[RECORDED_TIMING, FAST_TIMING], default=RECORDED_TIMING,
+                        help='replay at the recorded arrival times, or as fast as possible in closed loop')
+    args = parser.parse_args(argv)
+    if not 0 <= args.read_ratio + args.delete_ratio <= 1:
+        parser.error('read ratio and delete ratio must add up to at most 1')
+    args.bucket_sealing = args.bucket_sealing or args.merkle
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    if args.replay:
+        requests, arrivals = replay_requests(args.replay, args.data_size, rng)
+        args.num_of_files = max([args.num_of_files] + [data_id + 1 for _, data_id, _ in requests])
+        if args.timing == FAST_TIMING:
+            arrivals = None
+    else:
+        requests = make_requests(args.num_of_files, args.requests, args.zipf, args.read_ratio, args.delete_ratio,
+                                 args.data_size, rng)
+        arrivals = poisson_arrivals(len(requests), args.rate, rng) if args.rate else None
+    client, server = create_client(args)
+    items = [(data_id, rng.randbytes(args.data_size)) for data_id in range(int(args.num_of_files * args.preload))]
+    for offset in range(0, len(items), PRELOAD_BATCH):
+        client.store_many(server, items[offset:offset + PRELOAD_BATCH])
+
+    recorder = TraceRecorder(args.record, args.record_data) if args.record else None
+    request_queue = TracedQueue(recorder) if recorder else queue.Queue()
+    wrapper = create_wrapper(args.mode, args, client, server, request_queue)
+    try:
+        latencies, elapsed = run_workload(wrapper, requests, arrivals)
+    finally:
+        wrapper.stop()
+        if recorder:
+            recorder.close()
+    print_report(wrapper, requests, latencies, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import hashlib
+import hmac
+from typing import Dict, List
+
+HASH_SIZE = 32
+CHILD_HASHES_SIZE = 2 * HASH_SIZE  # every stored bucket starts with the hashes of its left and right children
+UNWRITTEN_HASH = bytes(HASH_SIZE)  # hash of a never written, all-zero bucket
+
+
+class MerkleTree:
+    """
+    Freshness check of the buckets of a tree on an untrusted server, so that it cannot replay an older (authentic)
+    bucket or swap two buckets.
+    The hash of a bucket is SHA256 of its stored bytes, which start with the hashes of its two children (zeros below
+    the leaves). Only the hash of the root is kept by the client, so verifying a set of buckets closed under parent
+    (a path or a union of paths) and updating it after they are written both cost O(set) hashes: the hashes of the
+    siblings off the set are taken from the buckets on it.
+    """
+
+    def __init__(self, root_hash: bytes = None):
+        """
+        :param root_hash: Hash of the root bucket, when reopening an already written tree. None for a new tree.
+        """
+        self.root_hash = root_hash or UNWRITTEN_HASH
+        # Children hashes of the buckets read or written by the current access whose own write is still pending
+        self.child_hashes: Dict[int, List[bytes]] = dict()
+
+    @staticmethod
+    def bucket_hash(stored: bytes) -> bytes:
+        if not any(stored):
+            return UNWRITTEN_HASH
+        return hashlib.sha256(stored).digest()
+
+    def verify(self, bucket_ids: List[int], buckets) -> None:
+        """
+        Check read buckets against the root hash, from the root down, and remember the hashes of their children for
+        the following update().
+        :param bucket_ids: Indices of the buckets, increasing, every one with its parent in the list before it.
+        :param buckets: The stored buckets, as lists of blocks.
+        """
+        expected = {0: self.root_hash}
+        for bucket_id, bucket in zip(bucket_ids, buckets):
+            stored = b''.join(bucket)
+            if bucket_id not in expected:
+                raise ValueError(f"Bucket {bucket_id} is read without its parent")
+            # The server won't be able to trick the client into accepting stale data
+            if not hmac.compare_digest(self.bucket_hash(stored), expected[bucket_id]):
+                raise ValueError("Freshness check failed: the bucket is not the one last written")
+            left, right = stored[:HASH_SIZE], stored[HASH_SIZE:CHILD_HASHES_SIZE]
+            expected[2 * bucket_id + 1] = left
+            expected[2 * bucket_id + 2] = right
+            self.child_hashes[bucket_id] = [left, right]
+
+    def update(self, bucket_ids: List[int], buckets) -> List[List[bytes]]:
+        """
+        Fill in the children hashes of buckets about to be written, from the deepest one up, and update the root hash.
+        A bucket takes the new hash of a child written with it, and otherwise the hash it held when it was read.
+        :param bucket_ids: Indices of the buckets, increasing, every one with its parent in the list unless it is
+        written before its parent (e.g. when initializing the tree from the leaves up).
+        :param buckets: The buckets to write, as lists of blocks whose first CHILD_HASHES_SIZE bytes are a placeholder.
+        :return: The buckets to write, in the same order.
+        """
+        updated = [None] * len(buckets)
+        for position in range(len(buckets) - 1, -1, -1):
+            bucket_id, bucket = bucket_ids[position], buckets[position]
+            block_size = len(bucket[0])
+            left, right = self.child_hashes.pop(bucket_id, (UNWRITTEN_HASH, UNWRITTEN_HASH))
+            stored = b''.join((left, right, b''.join(bucket)[CHILD_HASHES_SIZE:]))
+            stored_hash = self.bucket_hash(stored)
+            if bucket_id:
+                parent = self.child_hashes.setdefault((bucket_id - 1) // 2, [UNWRITTEN_HASH, UNWRITTEN_HASH])
+                parent[1 - bucket_id % 2] = stored_hash
+            else:
+                self.root_hash = stored_hash
+            updated[position] = [stored[offset:offset + block_size] for offset in range(0, len(stored), block_size)]
+        return updated
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import struct
+import threading
+from typing import List, Tuple
+from Client import BUCKET_SIZE, DATA_SIZE, get_block_size, get_tree_size
+from Server import Server, FileServer
+
+# Request: opcode, request id, argument (leaf or bucket index), payload length, followed by the payload
+REQUEST_HEADER = struct.Struct('>BIQI')
+# Response: status, request id, payload length, followed by the payload
+RESPONSE_HEADER = struct.Struct('>BII')
+INFO = struct.Struct('>QIIB')  # tree_size, bucket_size, block_size, initialized
+BUCKET_ID = struct.Struct('>Q')
+BLOCK_POSITION = struct.Struct('>QI')  # bucket index, slot
+
+OP_INFO = 0
+OP_READ_PATH = 1
+OP_WRITE_PATH = 2
+OP_GET_BUCKETS = 3
+OP_WRITE_BUCKETS = 4
+OP_MARK_INITIALIZED = 5
+OP_FLUSH = 6
+OP_GET_BLOCKS = 7
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class OramServer:
+    """
+    Serves a Server (in memory or file backed) to a remote client over TCP with asyncio.
+    Requests of a connection are executed in the order they arrive, so a client may pipeline them without waiting for
+    the responses. Buckets travel as the concatenation of their fixed-size blocks.
+    """
+
+    def __init__(self, server: Server, latency: float = 0.0):
+        """
+        :param server: Server whose tree is served.
+        :param latency: Extra delay in seconds before every response is sent, to emulate a remote storage host.
+        Requests are still executed as soon as they arrive, so pipelined requests overlap their delays.
+        """
+        self.server = server
+        self.latency = latency
+
+    def join_buckets(self, buckets) -> bytes:
+        return b''.join(block for bucket in buckets for block in bucket)
+
+    def split_buckets(self, payload: bytes, num_of_buckets: int) -> List[List[bytes]]:
+        tree = self.server.tree
+        if len(payload) != num_of_buckets * tree.bucket_size * tree.block_size:
+            raise ValueError(f"Payload of {len(payload)} bytes does not hold {num_of_buckets} buckets.")
+        blocks = [payload[offset:offset + tree.block_size] for offset in range(0, len(payload), tree.block_size)]
+        return [blocks[offset:offset + tree.bucket_size] for offset in range(0, len(blocks), tree.bucket_size)]
+
+    @staticmethod
+    def unpack_entries(entry: struct.Struct, payload: bytes) -> List[tuple]:
+        if len(payload) % entry.size:
+            raise ValueError(f"Payload of {len(payload)} bytes is not a whole number of {entry.size} byte entries.")
+        return list(entry.iter_unpack(payload))
+
+    def check_bucket_ids(self, ids_list: List[int]) -> List[int]:
+        tree_size = self.server.tree.tree_size
+        for bucket_id in ids_list:
+            if not 0 <= bucket_id < tree_size:
+                raise ValueError(f"Bucket index {bucket_id} out of range.")
+        return ids_list
+
+    def check_leaf(self, leaf_index: int) -> int:
+        tree_size = self.server.tree.tree_size
+        if not tree_size // 2 <= leaf_index < tree_size:
+            raise ValueError(f"Leaf index {leaf_index} out of range.")
+        return leaf_index
+
+    def dispatch(self, opcode: int, argument: int, payload: bytes) -> bytes:
+        """
+        Execute a single request on the server.
+        :return: The response payload.
+        """
+        if opcode == OP_READ_PATH:
+            return self.join_buckets(self.server.read_path(self.check_leaf(argument)))
+        if opcode == OP_WRITE_PATH:
+            self.server.write_path(self.check_leaf(argument), self.split_buckets(payload, self.server.tree_height + 1))
+            return b''
+        if opcode == OP_GET_BUCKETS:
+            ids_list = self.check_bucket_ids([bucket_id for bucket_id, in self.unpack_entries(BUCKET_ID, payload)])
+            return self.join_buckets(self.server.get_buckets_by_ids(ids_list))
+        if opcode == OP_WRITE_BUCKETS:
+            ids_length = argument * BUCKET_ID.size
+            if len(payload) < ids_length:
+                raise ValueError(f"Payload of {len(payload)} bytes does not hold {argument} bucket indices.")
+            ids_list = self.check_bucket_ids([bucket_id for bucket_id, in BUCKET_ID.iter_unpack(payload[:ids_length])])
+            self.server.write_buckets_by_ids(ids_list, self.split_buckets(payload[ids_length:], len(ids_list)))
+            return b''
+        if opcode == OP_GET_BLOCKS:
+            return b''.join(self.server.get_blocks(self.unpack_entries(BLOCK_POSITION, payload)))
+        if opcode == OP_INFO:
+            tree = self.server.tree
+            return INFO.pack(tree.tree_size, tree.bucket_size, tree.block_size, self.server.initialized)
+        if opcode == OP_MARK_INITIALIZED:
+            self.server.mark_initialized()
+            return b''
+        if opcode == OP_FLUSH:
+            self.server.flush()
+            return b''
+        raise ValueError(f"Unknown opcode {opcode}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                opcode, request_id, argument, length = REQUEST_HEADER.unpack(
+                    await reader.readexactly(REQUEST_HEADER.size))
+                payload = await reader.readexactly(length) if length else b''
+                try:
+                    response, status = self.dispatch(opcode, argument, payload), STATUS_OK
+                except (ValueError, IndexError, struct.error) as e:
+                    response, status = str(e).encode(), STATUS_ERROR
+                message = RESPONSE_HEADER.pack(status, request_id, len(response)) + response
+                if self.latency:
+                    loop.call_later(self.latency, writer.write, message)
+                else:
+                    writer.write(message)
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        async with await self.start(host, port) as tcp_server:
+            await tcp_server.serve_forever()
+
+
+class RemoteServer:
+    """
+    Client-side stand-in for Server that forwards every call to an OramServer.
+    read_path() and write_path() are a single request each. Writes are pipelined: they are sent without waiting for
+    the response, so a Path ORAM access costs one round trip (the path read). A failed write is reported by the next
+    call that waits for a response.
+    An asyncio event loop in a background thread owns the connection; the *_async methods can be awaited from any
+    other event loop.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.next_request_id = 0
+        self.pending = {}
+        self.error = None
+        self.round_trips = 0  # requests whose response was waited for
+        self.requests_sent = 0
+        asyncio.run_coroutine_threadsafe(self.connect(host, port), self.loop).result()
+        tree_size, self.bucket_size, self.block_size, initialized = INFO.unpack(self.call(OP_INFO))
+        self.tree_size = tree_size
+        self.tree_height = (tree_size + 1).bit_length() - 2
+        self.initialized = bool(initialized)
+
+    async def connect(self, host: str, port: int) -> None:
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.reader_task = asyncio.ensure_future(self.read_responses())
+
+    async def read_responses(self) -> None:
+        try:
+            while True:
+                status, request_id, length = RESPONSE_HEADER.unpack(
+                    await self.reader.readexactly(RESPONSE_HEADER.size))
+                payload = await self.reader.readexactly(length) if length else b''
+                future = self.pending.pop(request_id, None)
+                if status != STATUS_OK:
+                    error = RuntimeError(f"Server error: {payload.decode()}")
+                    if future is None:
+                        self.error = error
+                    else:
+                        future.set_exception(error)
+                elif future is not None:
+                    future.set_result(payload)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self.error = ConnectionError(f"Connection to the server was lost: {e}")
+            for future in self.pending.values():
+                future.set_exception(self.error)
+            self.pending.clear()
+
+    def send(self, opcode: int, argument: int, payload: bytes, wait: bool) -> asyncio.Future | None:
+        """
+        Send a request; runs in the event loop thread. Requests are sent in the order send() is scheduled.
+        :return: Future of the response payload if wait is set, otherwise None.
+        """
+        request_id = self.next_request_id
+        self.next_request_id = (self.next_request_id + 1) % 2 ** 32
+        future = None
+        if wait:
+            future = self.loop.create_future()
+            self.pending[request_id] = future
+        self.writer.write(REQUEST_HEADER.pack(opcode, request_id, argument, len(payload)) + payload)
+        self.requests_sent += 1
+        return future
+
+    def check_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    async def request(self, opcode: int, argument: int = 0, payload: bytes = b'') -> bytes:
+        future = self.send(opcode, argument, payload, wait=True)
+        await self.writer.drain()
+        return await future
+
+    def call(self, opcode: int, argument: int = 0, payload: bytes = b'') -> bytes:
+        """
+        Send a request and block until its response arrives (one round trip).
+        """
+        self.check_error()
+        self.round_trips += 1
+        return asyncio.run_coroutine_threadsafe(self.request(opcode, argument, payload), self.loop).result()
+
+    def post(self, opcode: int, argument: int = 0, payload: bytes = b'') -> None:
+        """
+        Send a request without waiting for its response.
+        """
+        self.check_error()
+        self.loop.call_soon_threadsafe(self.send, opcode, argument, payload, False)
+
+    async def call_async(self, opcode: int, argument: int = 0, payload: bytes = b'') -> bytes:
+        """
+        Like call(), but awaitable from another event loop.
+        """
+        self.check_error()
+        self.round_trips += 1
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self.request(opcode, argument, payload), self.loop))
+
+    def split_buckets(self, payload: bytes) -> List[List[bytes]]:
+        block_size = self.block_size
+        blocks = [payload[offset:offset + block_size] for offset in range(0, len(payload), block_size)]
+        return [blocks[offset:offset + self.bucket_size] for offset in range(0, len(blocks), self.bucket_size)]
+
+    def join_buckets(self, buckets: List[List[bytes]]) -> bytes:
+        return b''.join(block for bucket in buckets for block in bucket)
+
+    ################ Server interface ##############
+
+    def get_bucket_by_index(self, index: int) -> List[bytes]:
+        return self.get_buckets_by_ids([index])[0]
+
+    def get_buckets_by_ids(self, ids_list: List[int]) -> List[List[bytes]]:
+        payload = b''.join(BUCKET_ID.pack(index) for index in ids_list)
+        return self.split_buckets(self.call(OP_GET_BUCKETS, 0, payload))
+
+    def get_blocks(self, positions: List[Tuple[int, int]]) -> List[bytes]:
+        payload = b''.join(BLOCK_POSITION.pack(index, slot) for index, slot in positions)
+        blocks = self.call(OP_GET_BLOCKS, 0, payload)
+        return [blocks[offset:offset + self.block_size] for offset in range(0, len(blocks), self.block_size)]
+
+    def write_bucket_by_index(self, index: int, bucket: List[bytes]) -> None:
+        self.write_buckets_by_ids([index], [bucket])
+
+    def write_buckets_by_ids(self, ids_list: List[int], buckets: List[List[bytes]]) -> None:
+        payload = b''.join(BUCKET_ID.pack(index) for index in ids_list) + self.join_buckets(buckets)
+        self.post(OP_WRITE_BUCKETS, len(ids_list), payload)
+
+    def read_path(self, leaf_index: int) -> List[List[bytes]]:
+        return self.split_buckets(self.call(OP_READ_PATH, leaf_index))
+
+    def write_path(self, leaf_index: int, buckets: List[List[bytes]]) -> None:
+        self.post(OP_WRITE_PATH, leaf_index, self.join_buckets(buckets))
+
+    async def read_path_async(self, leaf_index: int) -> List[List[bytes]]:
+        return self.split_buckets(await self.call_async(OP_READ_PATH, leaf_index))
+
+    def mark_initialized(self) -> None:
+        self.call(OP_MARK_INITIALIZED)
+        self.initialized = True
+
+    def flush(self) -> None:
+        self.post(OP_FLUSH)
+
+    def close(self) -> None:
+        """
+        Wait for all pipelined requests to be served, then close the connection.
+        """
+        self.call(OP_FLUSH)
+        asyncio.run_coroutine_threadsafe(self.disconnect(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def disconnect(self) -> None:
+        self.reader_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a Path ORAM tree over TCP.')
+    parser.add_argument('num_of_files', type=int, help='number of files the tree must support')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7070)
+    parser.add_argument('--data-size', type=int, default=DATA_SIZE)
+    parser.add_argument('--path', help='keep the tree in this memory mapped file instead of in memory')
+    parser.add_argument('--bucket-sealing', action='store_true', help='size the blocks for clients sealing buckets')
+    parser.add_argument('--merkle', action='store_true', help='size the blocks for clients with a Merkle tree')
+    args = parser.parse_args()
+
+    block_size = get_block_size(args.data_size, args.bucket_sealing or args.merkle, BUCKET_SIZE, args.merkle)
+    geometry = (get_tree_size(args.num_of_files), BUCKET_SIZE, block_size)
+    server = FileServer(args.path, *geometry) if args.path else Server(*geometry)
+    print(f'Serving a tree of {geometry[0]} buckets on {args.host}:{args.port}')
+    asyncio.run(OramServer(server).serve_forever(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+from typing import Callable
+
+LABEL_SIZE = 4  # bytes per packed big-endian leaf label
+LABELS_PER_BLOCK = 16  # leaf labels packed into every block of a recursive position map ORAM
+ABSENT_LABEL = bytes(LABEL_SIZE)  # labels are stored as leaf + 1, so 0 marks an id with no leaf
+
+
+class PositionMap(dict):
+    """
+    Flat position map: a plain dict from data id to leaf, held entirely in client memory.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.changes = None  # leaf (None if removed) of every id remapped since the last reset, while tracked
+
+    def track_changes(self) -> dict:
+        """
+        Start a new set of changes to track, and return the previous one (None if changes were not tracked).
+        """
+        changes, self.changes = self.changes, dict()
+        return changes
+
+    def accepts(self, data_id: int) -> bool:
+        return True
+
+    def remap(self, data_id: int, new_leaf: int | None, create: bool) -> int | None:
+        """
+        Assign a new leaf to the data id and return the previous one, in a single lookup.
+        :param data_id: ID of the data.
+        :param new_leaf: Leaf to assign, or None to remove the id.
+        :param create: Whether to add the id if it has no leaf yet.
+        :return: The previous leaf of the id, or None if it had none.
+        """
+        old_leaf = self.get(data_id)
+        if new_leaf is None:
+            self.pop(data_id, None)
+        elif old_leaf is not None or create:
+            self[data_id] = new_leaf
+        if self.changes is not None:
+            self.changes[data_id] = self.get(data_id)
+        return old_leaf
+
+    def dummy_access(self) -> None:
+        """
+        Nothing to do: lookups in client memory are not visible to the server.
+        """
+
+
+class RecursivePositionMap:
+    """
+    Position map stored in a smaller Path ORAM, so the client only keeps that ORAM's (smaller) position map.
+    Data id i is kept in block i // LABELS_PER_BLOCK of the inner ORAM, which packs LABELS_PER_BLOCK fixed-width binary
+    leaf labels. Every lookup or update is one access to the inner ORAM.
+    """
+
+    def __init__(self, client, server, num_of_files: int):
+        """
+        :param client: Client of the inner ORAM, with data of LABEL_SIZE * LABELS_PER_BLOCK bytes.
+        :param server: Server holding the inner ORAM.
+        :param num_of_files: Number of data ids to support, ids must be in range(num_of_files).
+        """
+        self.client = client
+        self.server = server
+        self.num_of_files = num_of_files
+
+    def accepts(self, data_id: int) -> bool:
+        return isinstance(data_id, int) and 0 <= data_id < self.num_of_files
+
+    def access(self, data_id: int, update: Callable[[int | None], int | None]) -> int | None:
+        """
+        Read the leaf of the data id and replace it with update(leaf), in one access to the inner ORAM.
+        :return: The leaf before the update, or None if the id had none.
+        """
+        if not self.accepts(data_id):
+            raise KeyError(data_id)
+        block_id, slot = divmod(data_id, LABELS_PER_BLOCK)
+        start = slot * LABEL_SIZE
+        old_leaf = []
+
+        def update_block(block: bytes | None) -> bytes:
+            block = block or ABSENT_LABEL * LABELS_PER_BLOCK
+            label = int.from_bytes(block[start:start + LABEL_SIZE], 'big')
+            old_leaf.append(label - 1 if label else None)
+            new_leaf = update(old_leaf[0])
+            new_label = ABSENT_LABEL if new_leaf is None else (new_leaf + 1).to_bytes(LABEL_SIZE, 'big')
+            return block[:start] + new_label + block[start + LABEL_SIZE:]
+
+        self.client.update_data(self.server, block_id, update_block)
+        return old_leaf[0]
+
+    def dummy_access(self) -> None:
+        """
+        An inner ORAM access that changes no leaf, matching the one made by every real lookup or update.
+        """
+        self.client.dummy_access(self.server)
+
+    def remap(self, data_id: int, new_leaf: int | None, create: bool) -> int | None:
+        """
+        Assign a new leaf to the data id and return the previous one, in a single inner ORAM access.
+        :param data_id: ID of the data.
+        :param new_leaf: Leaf to assign, or None to remove the id.
+        :param create: Whether to add the id if it has no leaf yet.
+        :return: The previous leaf of the id, or None if it had none.
+        """
+        return self.access(data_id, lambda old_leaf: new_leaf if old_leaf is not None or create else None)
+
+    def get(self, data_id: int, default=None) -> int | None:
+        if not self.accepts(data_id):
+            return default
+        leaf = self.access(data_id, lambda old_leaf: old_leaf)
+        return default if leaf is None else leaf
+
+    def pop(self, data_id: int, *default) -> int | None:
+        leaf = self.access(data_id, lambda old_leaf: None) if self.accepts(data_id) else None
+        if leaf is None:
+            if default:
+                return default[0]
+            raise KeyError(data_id)
+        return leaf
+
+    def __contains__(self, data_id: int) -> bool:
+        return self.get(data_id) is not None
+
+    def __getitem__(self, data_id: int) -> int:
+        leaf = self.get(data_id)
+        if leaf is None:
+            raise KeyError(data_id)
+        return leaf
+
+    def __setitem__(self, data_id: int, leaf: int) -> None:
+        self.access(data_id, lambda old_leaf: leaf)
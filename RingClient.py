@@ -0,0 +1,346 @@
+import random
+import struct
+from typing import Callable, Dict, List, Tuple
+from BinaryTree import BinaryTree
+from BucketCipher import NONCE_SIZE, TAG_SIZE, THREAD_POOL
+from Client import Client, PATH_EVICTION, DATA_SIZE, INIT_CHUNK, get_tree_size
+from Server import Server
+from Stats import Stats
+
+REAL_SLOTS = 4  # Z, real blocks a bucket can hold
+DUMMY_SLOTS = 6  # S, reads a bucket supports before it has to be reshuffled
+EVICTION_RATE = 3  # A, accesses between two evictions
+MAX_SLOTS = 64  # the read slots of a bucket are tracked in a 64 bit bitmap
+METADATA_HEADER = struct.Struct('>HQ')  # reads since the bucket was written, bitmap of the slots not read since
+METADATA_ENTRY = struct.Struct('>BQ')  # slot + 1 (0 for an empty entry), data id
+
+
+def get_ring_bucket_size(real_slots: int = REAL_SLOTS, dummy_slots: int = DUMMY_SLOTS) -> int:
+    """
+    Number of blocks in every bucket of a Ring ORAM tree.
+    """
+    return real_slots + dummy_slots
+
+
+def get_metadata_block_size(real_slots: int = REAL_SLOTS) -> int:
+    """
+    Size in bytes of the encrypted metadata block of a bucket.
+    """
+    return NONCE_SIZE + METADATA_HEADER.size + real_slots * METADATA_ENTRY.size + TAG_SIZE
+
+
+class BucketMetadata:
+    """
+    Decrypted metadata of a bucket: where its real blocks are and which slots were not read since it was written.
+    """
+    __slots__ = ('count', 'valid', 'blocks')
+
+    def __init__(self, count: int, valid: int, blocks: Dict[int, int]):
+        """
+        :param count: Number of reads since the bucket was written.
+        :param valid: Bitmap of the slots not read since the bucket was written.
+        :param blocks: Slot of every real block not read since the bucket was written, by data ID.
+        """
+        self.count = count
+        self.valid = valid
+        self.blocks = blocks
+
+    def dummy_slots(self) -> List[int]:
+        """
+        :return: The slots holding dummy blocks that were not read yet.
+        """
+        occupied = set(self.blocks.values())
+        return [slot for slot in range(self.valid.bit_length()) if self.valid >> slot & 1 and slot not in occupied]
+
+
+class RingClient(Client):
+    """
+    Ring ORAM (Ren et al.) access engine with the API of Client, selectable in its place.
+    Every bucket holds real_slots + dummy_slots encrypted blocks in a random permutation. Its metadata (the slot of
+    every real block and the slots already read) is kept encrypted in a separate metadata server, one block per bucket.
+    An access reads the metadata of a path and a single block of every bucket on it: the requested block where it is,
+    an unread dummy elsewhere. Every eviction_rate accesses the next path in reverse-lexicographic order is evicted,
+    and a bucket read dummy_slots times since it was written is reshuffled early.
+    """
+
+    def __init__(self, num_of_files: int, server: Server, secret_key: bytes = None, data_size: int = DATA_SIZE,
+                 position_map_budget: int = None, server_factory=Server, real_slots: int = REAL_SLOTS,
+                 dummy_slots: int = DUMMY_SLOTS, eviction_rate: int = EVICTION_RATE, stats: Stats = None,
+                 metadata_server: Server = None, crypto_workers: int = 0, crypto_pool: str = THREAD_POOL,
+                 lazy_init: bool = False, written_buckets: bytes = None):
+        """
+        :param num_of_files: Number of files that the server needs to support
+        :param server: Server object, with buckets of get_ring_bucket_size(real_slots, dummy_slots) blocks of
+        get_block_size(data_size) bytes
+        :param secret_key: Key the server tree was encrypted with, when reopening an already initialized tree
+        :param data_size: Maximal number of bytes of every data item
+        :param position_map_budget: See Client
+        :param server_factory: Called with (tree_size, bucket_size, block_size) to create the metadata server (if not
+        given) and the servers of the position map ORAMs
+        :param real_slots: Z, number of real blocks a bucket can hold
+        :param dummy_slots: S, number of reads a bucket supports before it is reshuffled
+        :param eviction_rate: A, number of accesses between two evictions
+        :param stats: See Client
+        :param metadata_server: Server holding the bucket metadata, with buckets of one block of
+        get_metadata_block_size(real_slots) bytes, e.g. to reopen a persistent tree
+        :param crypto_workers: See Client
+        :param crypto_pool: See Client
+        :param lazy_init: See Client. An all-zero metadata block is the metadata of a never written bucket.
+        :param written_buckets: See Client. A bucket is marked written with its metadata.
+        """
+        if real_slots + dummy_slots > MAX_SLOTS:
+            raise ValueError(f"A bucket can have at most {MAX_SLOTS} slots")
+        if not 0 < eviction_rate <= dummy_slots:
+            raise ValueError("The eviction rate must be between 1 and the number of dummy slots")
+        self.real_slots = real_slots
+        self.dummy_slots = dummy_slots
+        self.eviction_rate = eviction_rate
+        self.accesses_since_eviction = 0
+        self.evictions = 0
+        self.all_slots = (1 << get_ring_bucket_size(real_slots, dummy_slots)) - 1
+        if metadata_server is None:
+            metadata_server = server_factory(get_tree_size(num_of_files), 1, get_metadata_block_size(real_slots))
+        self.metadata_server = metadata_server
+        super().__init__(num_of_files, server, secret_key, eviction=PATH_EVICTION, data_size=data_size,
+                         position_map_budget=position_map_budget, server_factory=server_factory,
+                         bucket_size=get_ring_bucket_size(real_slots, dummy_slots), stats=stats,
+                         crypto_workers=crypto_workers, crypto_pool=crypto_pool, lazy_init=lazy_init,
+                         written_buckets=written_buckets)
+
+    def init_tree(self, server: Server) -> None:
+        """
+        Write buckets of dummy blocks to the server and their metadata to the metadata server.
+        :param server: Instance of the Server class where data will be written.
+        """
+        super().init_tree(server)
+        if not self.lazy_init:
+            empty = self.encode_metadata(BucketMetadata(0, self.all_slots, {}))
+            for first in range(0, self.tree_size, INIT_CHUNK):
+                bucket_ids = range(first, min(first + INIT_CHUNK, self.tree_size))
+                encrypted = self.cipher.encrypt_blocks([empty] * len(bucket_ids))
+                self.metadata_server.write_buckets_by_ids(bucket_ids, [[block] for block in encrypted])
+        self.metadata_server.mark_initialized()
+
+    ############ Metadata ##############
+
+    def encode_metadata(self, metadata: BucketMetadata) -> bytes:
+        entries = [METADATA_ENTRY.pack(slot + 1, data_id) for data_id, slot in metadata.blocks.items()]
+        entries.append(bytes(METADATA_ENTRY.size * (self.real_slots - len(metadata.blocks))))
+        return METADATA_HEADER.pack(metadata.count, metadata.valid) + b''.join(entries)
+
+    def decode_metadata(self, plaintext) -> BucketMetadata:
+        count, valid = METADATA_HEADER.unpack_from(plaintext)
+        entries = METADATA_ENTRY.iter_unpack(plaintext[METADATA_HEADER.size:])
+        return BucketMetadata(count, valid, {data_id: slot - 1 for slot, data_id in entries if slot})
+
+    def load_metadata(self, bucket_ids: List[int], metadata: Dict[int, BucketMetadata]) -> None:
+        """
+        Read and decrypt, in one call each, the metadata of the given buckets that is not loaded yet.
+        :param bucket_ids: Indices of the buckets.
+        :param metadata: Metadata loaded so far during the access, by bucket index; updated in place.
+        """
+        missing = [bucket_id for bucket_id in bucket_ids if bucket_id not in metadata]
+        if not missing:
+            return
+        blocks = [bucket[0] for bucket in self.metadata_server.get_buckets_by_ids(missing)]
+        if self.lazy_init:
+            unwritten = bytes(len(blocks[0]))
+            written = []
+            for bucket_id, block in zip(missing, blocks):
+                # The metadata of a bucket marked written is decrypted, and an all-zero block fails authentication
+                if block == unwritten and not self.written_buckets[bucket_id >> 3] & 1 << (bucket_id & 7):
+                    metadata[bucket_id] = BucketMetadata(0, self.all_slots, {})
+                else:
+                    written.append((bucket_id, block))
+            missing = [bucket_id for bucket_id, _ in written]
+            blocks = [block for _, block in written]
+        for bucket_id, plaintext in zip(missing, self.cipher.decrypt_blocks(blocks)):
+            metadata[bucket_id] = self.decode_metadata(plaintext)
+
+    def write_metadata(self, metadata: Dict[int, BucketMetadata]) -> None:
+        """
+        Encrypt and write back, in one call each, the metadata loaded during an access.
+        """
+        bucket_ids = sorted(metadata)
+        encrypted = self.cipher.encrypt_blocks([self.encode_metadata(metadata[bucket_id]) for bucket_id in bucket_ids])
+        self.metadata_server.write_buckets_by_ids(bucket_ids, [[block] for block in encrypted])
+        self.mark_written(bucket_ids)
+
+    ############ Ring ORAM ##############
+
+    def read_path_blocks(self, leaf_index: int, data_id: int, server: Server,
+                         metadata: Dict[int, BucketMetadata]) -> List[int]:
+        """
+        Read one block of every bucket on the path to the given leaf: the block of the data id in the bucket holding
+        it, an unread dummy in the others. The block of the data id, if found, is moved into the stash.
+        :return: Indices of the buckets along the path, from the root to the leaf.
+        """
+        path_ids = BinaryTree.get_path_to_leaf(leaf_index, self.tree_height)
+        self.load_metadata(path_ids, metadata)
+        positions = []
+        target = None
+        for bucket_id in path_ids:
+            bucket_metadata = metadata[bucket_id]
+            slot = bucket_metadata.blocks.pop(data_id, None)
+            if slot is None:
+                slot = random.choice(bucket_metadata.dummy_slots())
+            else:
+                target = len(positions)
+            bucket_metadata.valid &= ~(1 << slot)
+            bucket_metadata.count += 1
+            positions.append((bucket_id, slot))
+        blocks = server.get_blocks(positions)
+        if target is not None:
+            self.check_written([positions[target][0]], [[blocks[target]]])
+            block_id, data, leaf = self.decrypt_bucket([blocks[target]])[0]
+            self.stash[block_id] = data
+            self.stash_leaves[block_id] = leaf
+        return path_ids
+
+    def read_buckets_to_stash(self, bucket_ids: List[int], server: Server,
+                              metadata: Dict[int, BucketMetadata]) -> None:
+        """
+        Move the unread real blocks of the given buckets into the stash. Exactly real_slots blocks are read from every
+        bucket, padded with unread dummies, so the server does not learn how many of them are real.
+        """
+        positions = []
+        real_positions = []
+        for bucket_id in bucket_ids:
+            bucket_metadata = metadata[bucket_id]
+            slots = list(bucket_metadata.blocks.values())
+            real_positions.extend(range(len(positions), len(positions) + len(slots)))
+            slots.extend(random.sample(bucket_metadata.dummy_slots(), self.real_slots - len(slots)))
+            positions.extend((bucket_id, slot) for slot in slots)
+        blocks = server.get_blocks(positions)
+        self.check_written([positions[position][0] for position in real_positions],
+                           [[blocks[position]] for position in real_positions])
+        for data_id, data, leaf in self.decrypt_bucket([blocks[position] for position in real_positions]):
+            self.stash[data_id] = data
+            self.stash_leaves[data_id] = leaf
+
+    def shuffle_bucket(self, blocks: List[Tuple[int, bytes, int]]) -> Tuple[list, BucketMetadata]:
+        """
+        Place the given real blocks in random slots of a bucket padded with dummies.
+        :return: The bucket, and its metadata.
+        """
+        bucket = [self.dummy_block] * self.bucket_size
+        slots = random.sample(range(self.bucket_size), len(blocks))
+        for slot, block in zip(slots, blocks):
+            bucket[slot] = block
+        return bucket, BucketMetadata(0, self.all_slots, {block[0]: slot for slot, block in zip(slots, blocks)})
+
+    def next_eviction_leaf(self) -> int:
+        """
+        Leaves are evicted in reverse-lexicographic order: the bits of the eviction counter, reversed, select the
+        leaf, so consecutive evictions share as few buckets as possible.
+        """
+        position = self.evictions % len(self.leaves_ids)
+        self.evictions += 1
+        return self.leaves_ids[int(format(position, f'0{self.tree_height}b')[::-1], 2)]
+
+    def evict_next_path(self, server: Server, metadata: Dict[int, BucketMetadata]) -> None:
+        """
+        Read the unread real blocks of the next eviction path into the stash and write the path back, greedily
+        filling every bucket with up to real_slots stash blocks, in a fresh permutation.
+        """
+        leaf_index = self.next_eviction_leaf()
+        path_ids = BinaryTree.get_path_to_leaf(leaf_index, self.tree_height)
+        self.load_metadata(path_ids, metadata)
+        self.read_buckets_to_stash(path_ids, server, metadata)
+        buckets = []
+        for bucket_id, blocks in zip(path_ids, self.take_path_blocks(leaf_index, self.real_slots)):
+            bucket, metadata[bucket_id] = self.shuffle_bucket(blocks)
+            buckets.append(bucket)
+        server.write_buckets_by_ids(path_ids, self.encrypt_buckets(buckets))
+        self.stats.count('evictions')
+
+    def early_reshuffle(self, path_ids: List[int], server: Server, metadata: Dict[int, BucketMetadata]) -> None:
+        """
+        Rewrite, with the same real blocks in a fresh permutation, every bucket of the path that has no unread dummy
+        left for the next access.
+        """
+        bucket_ids = [bucket_id for bucket_id in path_ids if metadata[bucket_id].count >= self.dummy_slots]
+        if not bucket_ids:
+            return
+        contents = [list(metadata[bucket_id].blocks) for bucket_id in bucket_ids]
+        self.read_buckets_to_stash(bucket_ids, server, metadata)
+        buckets = []
+        for bucket_id, data_ids in zip(bucket_ids, contents):
+            blocks = [(data_id, self.stash.pop(data_id), self.stash_leaves.pop(data_id)) for data_id in data_ids]
+            bucket, metadata[bucket_id] = self.shuffle_bucket(blocks)
+            buckets.append(bucket)
+        server.write_buckets_by_ids(bucket_ids, self.encrypt_buckets(buckets))
+        self.stats.count('early_reshuffles', len(bucket_ids))
+
+    def access(self, server: Server, operation: str, data_id: int, data: bytes = None,
+               update: Callable[[bytes | None], bytes] = None) -> bytes | None:
+        """
+        A single Ring ORAM access: remap the block to a new random leaf, read one block of every bucket on its old
+        path, apply the operation in the stash, evict a path if it is due and reshuffle the exhausted buckets of the
+        path read. The metadata of all the buckets involved is read and written once.
+        :param server: Server object
+        :param operation: STORE, RETRIEVE or DELETE
+        :param data_id: ID of the data to access
+        :param data: New data, for STORE
+        :param update: For STORE instead of data, called with the current data (or None) to compute the new data
+        :return: The data stored under data_id before the access, or None.
+        """
+        leaf, new_leaf = self.begin_access(operation, data_id)
+        metadata = {}
+        with self.stats.timer('read_path'):
+            path_ids = self.read_path_blocks(leaf, data_id, server, metadata)
+        result = self.apply_to_stash(operation, data_id, new_leaf, data, update)
+        self.finish_ring_access(path_ids, server, metadata)
+        return result
+
+    def dummy_access(self, server: Server) -> None:
+        """
+        An access indistinguishable from access() for the server, reading only dummies from a random path and leaving
+        the position map and the stash contents as they are.
+        """
+        self.stats.count('accesses.dummy')
+        with self.stats.timer('position_map'):
+            self.position_map.dummy_access()
+        metadata = {}
+        with self.stats.timer('read_path'):
+            path_ids = self.read_path_blocks(self.random_leaf(), None, server, metadata)
+        self.finish_ring_access(path_ids, server, metadata)
+
+    def background_access(self, server: Server) -> int:
+        """
+        A dummy access for the idle slots of a client padding its timing channel. Ring ORAM already evicts on a fixed
+        schedule of accesses, so every dummy access brings the next eviction closer.
+        :return: Number of stash blocks moved to the tree.
+        """
+        stash_size = len(self.stash)
+        self.dummy_access(server)
+        evicted = max(0, stash_size - len(self.stash))
+        self.stats.count('background_blocks_evicted', evicted)
+        return evicted
+
+    def finish_ring_access(self, path_ids: List[int], server: Server, metadata: Dict[int, BucketMetadata]) -> None:
+        """
+        End of every access: evict a path if it is due, reshuffle the exhausted buckets of the path read and write
+        back the metadata of all the buckets involved.
+        """
+        self.accesses_since_eviction += 1
+        if self.accesses_since_eviction == self.eviction_rate:
+            self.accesses_since_eviction = 0
+            with self.stats.timer('evict'):
+                self.evict_next_path(server, metadata)
+        with self.stats.timer('reshuffle'):
+            self.early_reshuffle(path_ids, server, metadata)
+        self.write_metadata(metadata)
+        with self.stats.timer('flush'):
+            server.flush()
+            self.metadata_server.flush()
+        self.record_stash_size()
+
+    def access_many(self, server: Server, requests: List[Tuple[str, int, bytes | None]]) -> List[bytes | None]:
+        """
+        Serve several requests, one Ring ORAM access each.
+        :param server: Server object
+        :param requests: List of (operation, data_id, data) with operation STORE, RETRIEVE or DELETE.
+        :return: For every request, the data stored under its id before it was served, or None.
+        """
+        return [self.access(server, operation, data_id, data) for operation, data_id, data in requests]
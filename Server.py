@@ -1,5 +1,16 @@
-from typing import List
+import mmap
+import os
+import struct
+import zlib
+from typing import List, Tuple
 from BinaryTree import BinaryTree
+from Stats import Stats
+
+FILE_MAGIC = b'PATHORAM'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('>8sIQIIB')  # magic, version, tree_size, bucket_size, block_size, initialized
+FILE_DATA_OFFSET = mmap.PAGESIZE  # buckets start on a page boundary, after the header
+JOURNAL_RECORD = struct.Struct('>QI')  # bucket index, crc32 of the saved bucket
 
 
 class Server:
@@ -7,34 +18,31 @@ class Server:
     Manages storage operations, including adding and retrieving data buckets.
     """
 
-    def __init__(self, tree_size: int):
-        self.tree = BinaryTree()
-        self.tree.initialize_tree(tree_size)
-
-    def get_node_by_index(self, index: int) -> BinaryTree.TreeNode:
+    def __init__(self, tree_size: int, bucket_size: int, block_size: int):
         """
-        Retrieve a node from the tree structure by its index.
-        :param index: Index of the node to retrieve.
-        :return: The node found at the specified index.
+        :param tree_size: Number of buckets in the tree.
+        :param bucket_size: Number of blocks in every bucket.
+        :param block_size: Size in bytes of every (encrypted) block.
         """
-        try:
-            return self.tree.find_node(index)
-        except IndexError as e:
-            print(f"Error: {e}")
+        self.tree = BinaryTree(tree_size, bucket_size, block_size)
+        self.tree_height = (tree_size + 1).bit_length() - 2
+        self.initialized = False  # set once the client has written the initial dummy buckets
+        self.stats = Stats(enabled=False)  # may be replaced by the Stats object of the client
 
-    def get_bucket_by_index(self, index: int) -> List[str]:
+    def get_bucket_by_index(self, index: int) -> List[bytes]:
         """
         Retrieve the data (bucket) associated with a node from the tree structure by its index.
 
         :param index: Index of the node whose data (bucket) is to be retrieved.
         :return: The data (bucket) found at the specified node index.
         """
+        self.stats.count('buckets_read')
         try:
-            return self.get_node_by_index(index).data
+            return self.tree.read_bucket(index)
         except IndexError as e:
             print(f"Error: {e}")
 
-    def get_buckets_by_ids(self, ids_list: List[int]) -> List[List[str]]:
+    def get_buckets_by_ids(self, ids_list: List[int]) -> List[List[bytes]]:
         """
         Retrieve the data (buckets) associated with nodes from the tree structure based on a list of indices.
 
@@ -43,12 +51,225 @@ class Server:
         """
         return [self.get_bucket_by_index(index) for index in ids_list]
 
-    def write_bucket_by_index(self, index: int, bucket: List[str]) -> None:
+    def get_blocks(self, positions: List[Tuple[int, int]]) -> List[bytes]:
+        """
+        Retrieve single blocks instead of whole buckets.
+
+        :param positions: List of (bucket index, slot in the bucket) of the blocks to retrieve.
+        :return: List of the blocks, in the same order.
+        """
+        self.stats.count('blocks_read', len(positions))
+        return [self.tree.read_block(index, slot) for index, slot in positions]
+
+    def write_bucket_by_index(self, index: int, bucket: List[bytes]) -> None:
         """
         Write a data (bucket) to a node in the tree structure based on the provided index.
 
         :param index: Index of the node where the data (bucket) will be written.
         :param bucket: Data (bucket) to be written to the node.
         """
-        node = self.tree.find_node(index)
-        node.data = bucket
+        self.stats.count('buckets_written')
+        self.tree.write_bucket(index, bucket)
+
+    def write_buckets_by_ids(self, ids_list: List[int], buckets: List[List[bytes]]) -> None:
+        """
+        Write several data (buckets) to the nodes with the given indices.
+
+        :param ids_list: Indices of the nodes to write.
+        :param buckets: Data (buckets) to be written, in the same order as ids_list.
+        """
+        for index, bucket in zip(ids_list, buckets):
+            self.write_bucket_by_index(index, bucket)
+
+    def read_path(self, leaf_index: int) -> List[List[bytes]]:
+        """
+        Retrieve the data (buckets) along the path from the root to the given leaf.
+
+        :param leaf_index: Index of the leaf node at the end of the path.
+        :return: List of data (buckets) along the path, from the root to the leaf.
+        """
+        return self.get_buckets_by_ids(BinaryTree.get_path_to_leaf(leaf_index, self.tree_height))
+
+    def write_path(self, leaf_index: int, buckets: List[List[bytes]]) -> None:
+        """
+        Write the data (buckets) along the path from the root to the given leaf.
+
+        :param leaf_index: Index of the leaf node at the end of the path.
+        :param buckets: Data (buckets) to be written, from the root to the leaf.
+        """
+        self.write_buckets_by_ids(BinaryTree.get_path_to_leaf(leaf_index, self.tree_height), buckets)
+
+    def mark_initialized(self) -> None:
+        """
+        Record that the tree holds valid encrypted buckets, so it does not have to be initialized again.
+        """
+        self.initialized = True
+
+    def flush(self) -> None:
+        """
+        Make all writes so far durable. Called by the client after each access; nothing to do in memory.
+        """
+
+
+class FileServer(Server):
+    """
+    Server that keeps the buckets in a memory mapped file instead of in Python memory.
+    Reads return zero-copy views of the mapping and writes go straight to it. Every write is preceded by saving the
+    old bucket to an undo journal, which is discarded on flush(), so a crash in the middle of an access rolls the tree
+    back to its state after the previous access.
+    """
+
+    def __init__(self, path: str, tree_size: int, bucket_size: int, block_size: int):
+        """
+        Open the tree stored at the given path, creating the file if it does not exist.
+        Opening an existing file only maps it and replays a leftover journal; the buckets are not read.
+        :param path: Path of the file holding the tree.
+        :param tree_size: Number of buckets in the tree.
+        :param bucket_size: Number of blocks in every bucket.
+        :param block_size: Size in bytes of every (encrypted) block.
+        """
+        self.path = path
+        self.journal_path = path + '.journal'
+        data_size = tree_size * bucket_size * block_size
+        exists = os.path.exists(path)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if exists:
+            header = os.pread(self.fd, FILE_HEADER.size, 0)
+            magic, version, *geometry, initialized = FILE_HEADER.unpack(header)
+            if magic != FILE_MAGIC or version != FILE_VERSION:
+                os.close(self.fd)
+                raise ValueError(f"{path} is not a Path ORAM tree file.")
+            if geometry != [tree_size, bucket_size, block_size]:
+                os.close(self.fd)
+                raise ValueError(f"{path} holds a tree of different dimensions: {geometry}.")
+        else:
+            initialized = False
+            os.ftruncate(self.fd, FILE_DATA_OFFSET + data_size)
+            os.pwrite(self.fd, FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, tree_size, bucket_size, block_size, 0), 0)
+            os.fsync(self.fd)
+        self.mapping = mmap.mmap(self.fd, FILE_DATA_OFFSET + data_size)
+        self.view = memoryview(self.mapping)[FILE_DATA_OFFSET:]
+        self.tree = BinaryTree(tree_size, bucket_size, block_size, self.view)
+        self.tree_height = (tree_size + 1).bit_length() - 2
+        self.initialized = bool(initialized)
+        self.stats = Stats(enabled=False)
+        self.journal = open(self.journal_path, 'a+b')
+        self.journaled = set()
+        self.dirty = False
+        self.recover()
+
+    def recover(self) -> None:
+        """
+        Restore the buckets saved in the undo journal, if the previous process crashed in the middle of an access.
+        Records torn by the crash are ignored, since a bucket is only overwritten after its record is on disk.
+        """
+        self.journal.seek(0)
+        journal = self.journal.read()
+        record_size = JOURNAL_RECORD.size + self.tree.bucket_bytes
+        restored = 0
+        for offset in range(0, len(journal) - record_size + 1, record_size):
+            index, checksum = JOURNAL_RECORD.unpack_from(journal, offset)
+            saved = journal[offset + JOURNAL_RECORD.size:offset + record_size]
+            if index >= self.tree.tree_size or zlib.crc32(saved) != checksum:
+                break
+            start = index * self.tree.bucket_bytes
+            self.view[start:start + self.tree.bucket_bytes] = saved
+            restored += 1
+        if restored:
+            self.mapping.flush()
+        self.clear_journal()
+
+    def clear_journal(self) -> None:
+        self.journal.truncate(0)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journaled.clear()
+
+    def save_to_journal(self, ids_list: List[int]) -> None:
+        """
+        Append the current content of the given buckets to the undo journal and make it durable.
+        Buckets already saved since the last flush are skipped.
+        """
+        if not self.initialized:  # a crash during initialization means initializing again, nothing to undo
+            return
+        records = []
+        bucket_bytes = self.tree.bucket_bytes
+        for index in ids_list:
+            if index in self.journaled or not 0 <= index < self.tree.tree_size:
+                continue
+            saved = self.view[index * bucket_bytes:(index + 1) * bucket_bytes]
+            records.append(JOURNAL_RECORD.pack(index, zlib.crc32(saved)))
+            records.append(saved)
+            self.journaled.add(index)
+        if records:
+            self.journal.write(b''.join(records))
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def get_bucket_by_index(self, index: int) -> List[memoryview]:
+        """
+        Retrieve zero-copy views of the data (bucket) of a node. The views are only valid until the bucket is written.
+
+        :param index: Index of the node whose data (bucket) is to be retrieved.
+        :return: The data (bucket) found at the specified node index.
+        """
+        self.stats.count('buckets_read')
+        try:
+            return self.tree.read_bucket_view(index)
+        except IndexError as e:
+            print(f"Error: {e}")
+
+    def get_blocks(self, positions: List[Tuple[int, int]]) -> List[memoryview]:
+        """
+        Retrieve zero-copy views of single blocks, valid until their buckets are written.
+
+        :param positions: List of (bucket index, slot in the bucket) of the blocks to retrieve.
+        :return: List of views of the blocks, in the same order.
+        """
+        self.stats.count('blocks_read', len(positions))
+        return [self.tree.read_block_view(index, slot) for index, slot in positions]
+
+    def write_bucket_by_index(self, index: int, bucket: List[bytes]) -> None:
+        self.write_buckets_by_ids([index], [bucket])
+
+    def write_buckets_by_ids(self, ids_list: List[int], buckets: List[List[bytes]]) -> None:
+        """
+        Write several data (buckets), saving the old content of all of them to the journal with a single fsync.
+
+        :param ids_list: Indices of the nodes to write.
+        :param buckets: Data (buckets) to be written, in the same order as ids_list.
+        """
+        self.stats.count('buckets_written', len(ids_list))
+        with self.stats.timer('journal'):
+            self.save_to_journal(ids_list)
+        for index, bucket in zip(ids_list, buckets):
+            self.tree.write_bucket(index, bucket)
+        self.dirty = True
+
+    def mark_initialized(self) -> None:
+        self.mapping.flush()
+        self.mapping[FILE_HEADER.size - 1] = 1  # the initialized flag is the last header field
+        self.mapping.flush()
+        self.initialized = True
+
+    def flush(self) -> None:
+        """
+        Sync the mapping to disk and then discard the undo journal, making the last access durable.
+        """
+        if not self.dirty:
+            return
+        with self.stats.timer('sync'):
+            self.mapping.flush()
+            self.clear_journal()
+        self.dirty = False
+
+    def close(self) -> None:
+        """
+        Flush and unmap the file. Views returned by get_bucket_by_index must be released before calling this.
+        """
+        self.flush()
+        self.view.release()
+        self.tree.buffer = None
+        self.mapping.close()
+        self.journal.close()
+        os.close(self.fd)
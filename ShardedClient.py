@@ -0,0 +1,177 @@
+import multiprocessing
+import random
+from math import ceil
+from typing import List, Tuple
+from Client import Client, PATH_EVICTION, STORE, RETRIEVE, DELETE, DATA_SIZE, MAX_ID, as_payload, get_block_size, \
+    get_tree_size, BUCKET_SIZE
+from Server import Server
+
+PARTITION_SLACK = 1.5  # partitions are sized for this many times their expected share of the blocks
+TAKE = 'take'  # remove a block from its partition and return its data
+PUT = 'put'  # store a block in a partition
+DUMMY = 'dummy'  # an access that looks like the others to the partition's server
+
+
+def partition_worker(connection, num_of_files: int, data_size: int) -> None:
+    """
+    Process serving one partition: a Path ORAM client with its own server, stash and position map.
+    Receives lists of (operation, data_id, data) with operation TAKE, PUT or DUMMY, and answers every list with the
+    list of its results. Stops on None.
+    """
+    server = Server(get_tree_size(num_of_files), BUCKET_SIZE, get_block_size(data_size))
+    client = Client(num_of_files, server, eviction=PATH_EVICTION, data_size=data_size)
+    while True:
+        requests = connection.recv()
+        if requests is None:
+            break
+        results = []
+        for operation, data_id, data in requests:
+            if operation == TAKE:
+                results.append(client.access(server, DELETE, data_id))
+            elif operation == PUT:
+                results.append(client.access(server, STORE, data_id, data))
+            else:
+                client.dummy_access(server)
+                results.append(None)
+        connection.send(results)
+    connection.close()
+
+
+class ShardedClient:
+    """
+    ORAM front end that splits the blocks across independent Path ORAM partitions, each served by its own worker
+    process, so that accesses to different partitions run on different cores.
+    The front end only keeps the partition of every stored id. Every request takes its block out of its partition and
+    puts it back into a fresh random one, so the partition touched by a request is independent of the earlier ones:
+    the servers see, per request, one access to a uniformly random partition followed by one access to another.
+    Requests for ids that are not stored, and repeated ids in a batch, use dummy accesses to keep this shape.
+    """
+
+    def __init__(self, num_of_files: int, num_of_shards: int, data_size: int = DATA_SIZE):
+        """
+        :param num_of_files: Number of files the ORAM needs to support
+        :param num_of_shards: Number of partitions, each with its own tree, stash, position map and worker process
+        :param data_size: Maximal number of bytes of every data item
+        """
+        self.num_of_files = num_of_files
+        self.num_of_shards = num_of_shards
+        self.data_size = data_size
+        self.partition_map = dict()
+        partition_size = max(1, ceil(num_of_files / num_of_shards * PARTITION_SLACK))
+        self.connections = []
+        self.workers = []
+        for _ in range(num_of_shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=partition_worker,
+                                             args=(worker_connection, partition_size, data_size), daemon=True)
+            worker.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.workers.append(worker)
+
+    def random_partition(self) -> int:
+        return random.randrange(self.num_of_shards)
+
+    def run_on_partitions(self, requests: List[Tuple[int, str, int | None, bytes | None]]) -> list:
+        """
+        Send every partition its share of the requests at once, so that the partitions serve them concurrently.
+        :param requests: List of (partition, operation, data_id, data).
+        :return: The result of every request, in the same order.
+        """
+        by_partition = [[] for _ in range(self.num_of_shards)]
+        for index, (partition, operation, data_id, data) in enumerate(requests):
+            by_partition[partition].append((index, (operation, data_id, data)))
+        for connection, partition_requests in zip(self.connections, by_partition):
+            if partition_requests:
+                connection.send([request for _, request in partition_requests])
+        results = [None] * len(requests)
+        for connection, partition_requests in zip(self.connections, by_partition):
+            if partition_requests:
+                for (index, _), result in zip(partition_requests, connection.recv()):
+                    results[index] = result
+        return results
+
+    def access_many(self, requests: List[Tuple[str, int, bytes | str | None]]) -> List[bytes | None]:
+        """
+        Serve several requests in two concurrent rounds: take every block out of its partition, then put every block
+        into a fresh random partition.
+        :param requests: List of (operation, data_id, data) with operation STORE, RETRIEVE or DELETE.
+        :return: For every request, the data stored under its id before it was served, or None.
+        """
+        takes = []
+        seen = set()
+        for _, data_id, _ in requests:
+            partition = self.partition_map.pop(data_id, None)
+            if partition is None or data_id in seen:
+                takes.append((self.random_partition(), DUMMY, None, None))
+            else:
+                takes.append((partition, TAKE, data_id, None))
+            seen.add(data_id)
+        taken = self.run_on_partitions(takes)
+
+        # Apply the requests in order to the taken blocks; the last request of every id puts it back
+        blocks = {}
+        results = []
+        for (operation, data_id, data), block in zip(requests, taken):
+            if block is not None:
+                blocks[data_id] = block
+            results.append(blocks.get(data_id))
+            if operation == STORE:
+                blocks[data_id] = as_payload(data)
+            elif operation == DELETE:
+                blocks.pop(data_id, None)
+        last = {data_id: index for index, (_, data_id, _) in enumerate(requests)}
+        puts = []
+        for index, (_, data_id, _) in enumerate(requests):
+            partition = self.random_partition()
+            if last[data_id] == index and data_id in blocks:
+                self.partition_map[data_id] = partition
+                puts.append((partition, PUT, data_id, blocks[data_id]))
+            else:
+                puts.append((partition, DUMMY, None, None))
+        self.run_on_partitions(puts)
+        return results
+
+    def is_valid_block(self, data_id: int, data: bytes | str) -> bool:
+        if data is None or not 0 < len(as_payload(data)) <= self.data_size:
+            print(f'Error: data must be 1 to {self.data_size} bytes')
+            return False
+        if not isinstance(data_id, int) or not 0 <= data_id <= MAX_ID:
+            print('Error: data_id must be a non-negative 64 bit integer')
+            return False
+        return True
+
+    ################ API  ##############
+
+    def store_data(self, data_id: int, data: bytes | str) -> bool:
+        if not self.is_valid_block(data_id, data):
+            return False
+        self.access_many([(STORE, data_id, data)])
+        return True
+
+    def retrieve_data(self, data_id: int) -> bytes | None:
+        return self.access_many([(RETRIEVE, data_id, None)])[0]
+
+    def delete_data(self, data_id: int) -> None:
+        if self.access_many([(DELETE, data_id, None)])[0] is None:
+            print('Error: given data_id does not exist in server')
+
+    def store_many(self, items: List[Tuple[int, bytes | str]]) -> List[bool]:
+        valid = [self.is_valid_block(data_id, data) for data_id, data in items]
+        requests = [(STORE, data_id, data) for (data_id, data), is_valid in zip(items, valid) if is_valid]
+        if requests:
+            self.access_many(requests)
+        return valid
+
+    def retrieve_many(self, data_ids: List[int]) -> List[bytes | None]:
+        return self.access_many([(RETRIEVE, data_id, None) for data_id in data_ids]) if data_ids else []
+
+    def close(self) -> None:
+        """
+        Stop the worker processes.
+        """
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for worker in self.workers:
+            worker.join()
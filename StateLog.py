@@ -0,0 +1,251 @@
+import os
+import struct
+from BucketCipher import BucketCipher
+from Client import Client, PATH_EVICTION, KEY_SIZE, TAG_SIZE
+from PositionMap import PositionMap
+from RingClient import RingClient
+from Server import Server
+
+STATE_MAGIC = b'ORAMSTAT'
+STATE_VERSION = 3
+# magic, version, sequence number, num_of_files, data_size, bucket_size, flags, tree key, bytes of the written buckets
+# bitmap (lazy_init only), position map entries, stash blocks; followed by the bitmap
+SNAPSHOT_HEADER = struct.Struct(f'>8sIQQIIB{KEY_SIZE}sQQQ')
+# sequence number, last bucket written + 1 (0 if none), tag of its first block, position map changes, stash blocks,
+# buckets written for the first time (lazy_init only)
+RECORD_HEADER = struct.Struct(f'>QQ{TAG_SIZE}sQQQ')
+POSITION_ENTRY = struct.Struct('>QI')  # data id, leaf + 1 (0 if removed)
+STASH_ENTRY = struct.Struct('>QII')  # data id, leaf + 1, data length; followed by the data
+WRITTEN_ENTRY = struct.Struct('>Q')  # bucket written for the first time
+RECORD_LENGTH = struct.Struct('>I')  # length of every encrypted log record, before it
+COMPACT_EVERY = 1000  # log records between two snapshots
+LAZY_INIT = 1  # snapshot flag of a client with lazy_init
+BUCKET_SEALING = 2  # snapshot flag of a client with bucket_sealing
+
+
+class StateLog:
+    """
+    Encrypted, durable copy of the state of a Path ORAM client (tree key, position map and stash), so that a client
+    over a persistent server (e.g. a FileServer) can be restarted without reloading the data.
+    The state is kept as a snapshot plus an append-only log with one record per access: the position map entries that
+    changed, the stash after the access and, with lazy_init, the buckets it wrote for the first time. Every
+    compact_every records, the state is compacted into a new snapshot and the log is emptied. Snapshot and records are
+    encrypted and authenticated with the state key, and numbered, so records already included in the snapshot are
+    skipped on restore.
+    A record is appended before the server writes of its access are flushed. If the process crashes in between, the
+    server rolls the access back, and restore() finds that the tree does not hold the last bucket written by the
+    recorded access and drops the record.
+    Supports Client with PATH_EVICTION, a flat position map, no tree-top cache and no Merkle tree.
+    """
+
+    def __init__(self, path: str, state_key: bytes, compact_every: int = COMPACT_EVERY, sync: bool = True):
+        """
+        :param path: Path of the snapshot; the log is kept at path + '.log'.
+        :param state_key: Key encrypting the snapshot and the log, KEY_SIZE bytes. It protects the tree key.
+        :param compact_every: Number of log records between two snapshots.
+        :param sync: Whether to fsync every record, so that it survives a power loss and not just a process crash.
+        """
+        self.path = path
+        self.log_path = path + '.log'
+        self.cipher = BucketCipher(state_key)
+        self.compact_every = compact_every
+        self.sync = sync
+        self.seq = 0
+        self.records = 0
+        self.log = None
+
+    @staticmethod
+    def check_client(client: Client) -> None:
+        if isinstance(client, RingClient) or client.eviction != PATH_EVICTION:
+            raise ValueError("The state log supports Path ORAM clients with PATH_EVICTION")
+        if not isinstance(client.position_map, PositionMap):
+            raise ValueError("The state log requires a flat position map")
+        if client.tree_top_levels:
+            raise ValueError("The state log does not support a tree-top cache")
+        if client.merkle:
+            raise ValueError("The state log does not support a Merkle tree")
+
+    def attach(self, client: Client) -> None:
+        """
+        Start recording the state of the client: write a snapshot of its current state and log every access after it.
+        """
+        self.check_client(client)
+        client.position_map.track_changes()
+        if client.written_buckets is not None:
+            client.new_written_buckets = []
+        client.state_log = self
+        self.compact(client)
+
+    def restore(self, server: Server, **client_args) -> Client:
+        """
+        Recreate a client from the snapshot and the log, over the persistent server it was using, and attach to it.
+        :param server: The server of the client, reopened.
+        :param client_args: Other arguments of Client, e.g. stats or crypto_workers.
+        :return: The client, with the state of its last access whose server writes were flushed.
+        """
+        with open(self.path, 'rb') as snapshot_file:
+            snapshot = self.decrypt(snapshot_file.read())
+        magic, version, seq, num_of_files, data_size, bucket_size, flags, secret_key, bitmap_size, num_of_positions, \
+            num_of_blocks = SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            raise ValueError(f"{self.path} is not a client state snapshot.")
+        offset = SNAPSHOT_HEADER.size
+        written_buckets = bytes(snapshot[offset:offset + bitmap_size]) if flags & LAZY_INIT else None
+        offset += bitmap_size
+        client = Client(num_of_files, server, secret_key, eviction=PATH_EVICTION, data_size=data_size,
+                        bucket_size=bucket_size, lazy_init=bool(flags & LAZY_INIT),
+                        bucket_sealing=bool(flags & BUCKET_SEALING), written_buckets=written_buckets, **client_args)
+        for data_id, label in POSITION_ENTRY.iter_unpack(snapshot[offset:offset + num_of_positions *
+                                                                  POSITION_ENTRY.size]):
+            client.position_map[data_id] = label - 1
+        offset = self.read_stash(client, snapshot, offset + num_of_positions * POSITION_ENTRY.size, num_of_blocks)
+
+        records = [record for record in self.read_log() if RECORD_HEADER.unpack_from(record)[0] > seq]
+        if records and not self.is_flushed(records[-1], client, server):
+            records.pop()
+        for record in records:
+            seq, _, _, num_of_changes, num_of_blocks, num_of_written = RECORD_HEADER.unpack_from(record)
+            offset = RECORD_HEADER.size
+            for data_id, label in POSITION_ENTRY.iter_unpack(record[offset:offset + num_of_changes *
+                                                                    POSITION_ENTRY.size]):
+                if label:
+                    client.position_map[data_id] = label - 1
+                else:
+                    client.position_map.pop(data_id, None)
+            client.stash.clear()
+            client.stash_leaves.clear()
+            offset = self.read_stash(client, record, offset + num_of_changes * POSITION_ENTRY.size, num_of_blocks)
+            client.mark_written(bucket_id for bucket_id, in WRITTEN_ENTRY.iter_unpack(
+                record[offset:offset + num_of_written * WRITTEN_ENTRY.size]))
+        self.seq = seq
+        self.attach(client)
+        return client
+
+    @staticmethod
+    def is_flushed(record, client: Client, server: Server) -> bool:
+        """
+        Whether the server holds the last bucket written by the access of the record, i.e. the access was flushed.
+        """
+        _, bucket_label, tag, _, _, _ = RECORD_HEADER.unpack_from(record)
+        if not bucket_label:
+            return True
+        return client.bucket_tag(server.get_bucket_by_index(bucket_label - 1)) == tag
+
+    ############ Encoding ##############
+
+    @staticmethod
+    def flags(client: Client) -> int:
+        return (LAZY_INIT if client.lazy_init else 0) | (BUCKET_SEALING if client.bucket_sealing else 0)
+
+    @staticmethod
+    def encode_stash(client: Client) -> list:
+        parts = []
+        for data_id, data in client.stash.items():
+            leaf = client.stash_leaves.get(data_id)
+            parts.append(STASH_ENTRY.pack(data_id, 0 if leaf is None else leaf + 1, len(data)))
+            parts.append(data)
+        return parts
+
+    @staticmethod
+    def read_stash(client: Client, plaintext, offset: int, num_of_blocks: int) -> int:
+        """
+        Decode num_of_blocks stash blocks starting at the offset into the stash of the client.
+        :return: The offset after the blocks.
+        """
+        for _ in range(num_of_blocks):
+            data_id, label, length = STASH_ENTRY.unpack_from(plaintext, offset)
+            offset += STASH_ENTRY.size
+            client.stash[data_id] = bytes(plaintext[offset:offset + length])
+            if label:
+                client.stash_leaves[data_id] = label - 1
+            offset += length
+        return offset
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        return self.cipher.encrypt_blocks([plaintext])[0]
+
+    def decrypt(self, blob: bytes):
+        return self.cipher.decrypt_blocks([blob])[0]
+
+    ############ Writing ##############
+
+    def record(self, client: Client) -> None:
+        """
+        Append the changes of the access that just ended to the log. Called by Client.commit() before the server is
+        flushed.
+        """
+        self.seq += 1
+        changes = client.position_map.track_changes()
+        bucket_id, tag = client.last_write or (-1, bytes(TAG_SIZE))
+        written = client.new_written_buckets or []
+        if written:
+            client.new_written_buckets = []
+        parts = [RECORD_HEADER.pack(self.seq, bucket_id + 1, tag, len(changes), len(client.stash), len(written))]
+        parts.extend(POSITION_ENTRY.pack(data_id, 0 if leaf is None else leaf + 1) for data_id, leaf in changes.items())
+        parts.extend(self.encode_stash(client))
+        parts.extend(WRITTEN_ENTRY.pack(bucket_id) for bucket_id in written)
+        record = self.encrypt(b''.join(parts))
+        self.log.write(RECORD_LENGTH.pack(len(record)) + record)
+        self.log.flush()
+        if self.sync:
+            os.fsync(self.log.fileno())
+        self.records += 1
+
+    def flushed(self, client: Client) -> None:
+        """
+        Compact the log if it is due. Called by Client.commit() after the server is flushed: until then the last
+        record may still be dropped on restore, so the snapshot must not include it.
+        """
+        if self.records >= self.compact_every:
+            self.compact(client)
+
+    def compact(self, client: Client) -> None:
+        """
+        Write a snapshot of the whole client state, replacing the previous one atomically, and empty the log.
+        """
+        position_map = client.position_map
+        written_buckets = client.written_buckets or b''
+        parts = [SNAPSHOT_HEADER.pack(STATE_MAGIC, STATE_VERSION, self.seq, client.max_files, client.data_size,
+                                      client.bucket_size, self.flags(client), client.secret_key, len(written_buckets),
+                                      len(position_map), len(client.stash)),
+                 bytes(written_buckets)]
+        parts.extend(POSITION_ENTRY.pack(data_id, leaf + 1) for data_id, leaf in position_map.items())
+        parts.extend(self.encode_stash(client))
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'wb') as snapshot_file:
+            snapshot_file.write(self.encrypt(b''.join(parts)))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self.path)
+        # The records of the old log are older than the snapshot, restore() skips them if the truncation is lost
+        if self.log is not None:
+            self.log.close()
+        self.log = open(self.log_path, 'wb')
+        self.records = 0
+
+    def read_log(self) -> list:
+        """
+        :return: The plaintext of every complete, authentic record of the log, in order.
+        """
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path, 'rb') as log_file:
+            log = log_file.read()
+        records = []
+        offset = 0
+        while offset + RECORD_LENGTH.size <= len(log):
+            length, = RECORD_LENGTH.unpack_from(log, offset)
+            offset += RECORD_LENGTH.size
+            if offset + length > len(log):
+                break  # torn by a crash while appending, its access was not flushed
+            try:
+                records.append(self.decrypt(log[offset:offset + length]))
+            except ValueError:
+                break
+            offset += length
+        return records
+
+    def close(self) -> None:
+        if self.log is not None:
+            self.log.close()
+            self.log = None
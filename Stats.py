@@ -0,0 +1,86 @@
+from collections import defaultdict
+from contextlib import nullcontext
+from time import perf_counter
+
+NULL_TIMER = nullcontext()  # returned by Stats.timer() while disabled, so a disabled timer allocates nothing
+
+
+class PhaseTimer:
+    """
+    Context manager adding the wall time of its block to one timer of a Stats object.
+    """
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter() - self.start
+        self.stats.timer_totals[self.name] += elapsed
+        self.stats.timer_calls[self.name] += 1
+
+
+class Stats:
+    """
+    Low-overhead counters, timers and high-water marks of the hot path of Client and Server.
+    Every recording method returns immediately while the stats are disabled. Timers are inclusive: a phase nested in
+    another one (e.g. a decrypt inside prevent_overflow) counts towards both.
+    A Client and its Server may share the same Stats object, to get a single snapshot of an access.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        :param enabled: Whether to record from the start; can be changed later with enable() and disable().
+        """
+        self.enabled = enabled
+        self.counters = defaultdict(int)
+        self.timer_totals = defaultdict(float)
+        self.timer_calls = defaultdict(int)
+        self.high_water_marks = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += amount
+
+    def timer(self, name: str):
+        """
+        :return: Context manager timing its block under the given name.
+        """
+        return PhaseTimer(self, name) if self.enabled else NULL_TIMER
+
+    def high_water(self, name: str, value: int) -> None:
+        """
+        Record value if it is the largest seen so far under the given name.
+        """
+        if self.enabled and value > self.high_water_marks.get(name, -1):
+            self.high_water_marks[name] = value
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.timer_totals.clear()
+        self.timer_calls.clear()
+        self.high_water_marks.clear()
+
+    def snapshot(self) -> dict:
+        """
+        :return: Plain dict of everything recorded so far, safe to serialize or to hand to a metrics pipeline.
+        """
+        return {
+            'enabled': self.enabled,
+            'counters': dict(self.counters),
+            'timers': {name: {'calls': self.timer_calls[name], 'total_s': total,
+                              'mean_s': total / self.timer_calls[name] if self.timer_calls[name] else 0.0}
+                       for name, total in self.timer_totals.items()},
+            'high_water': dict(self.high_water_marks),
+        }
@@ -0,0 +1,88 @@
+import queue
+import struct
+import threading
+import time
+from typing import List, Tuple
+from Client import STORE, RETRIEVE, DELETE
+from WrapperClasses.DefaultClient import STOP
+
+TRACE_MAGIC = b'ORAMTRCE'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('>8sIB')  # magic, version, flags
+TRACE_RECORD = struct.Struct('>QBQI')  # arrival in ns since the start of the trace, operation, data id, data length
+WITH_DATA = 1  # flag of traces holding the data of every store after its record
+OPERATION_CODES = {STORE: 1, RETRIEVE: 2, DELETE: 3}
+OPERATIONS = {code: operation for operation, code in OPERATION_CODES.items()}
+
+
+class TraceRecorder:
+    """
+    Writes the requests sent to a client wrapper to a compact binary trace: a header, then one fixed-size record per
+    request with its arrival time, operation, data id and data length. The data itself is only kept with record_data,
+    so a trace of production traffic holds the access pattern and not the content.
+    """
+
+    def __init__(self, path: str, record_data: bool = False):
+        """
+        :param path: Path of the trace file, overwritten.
+        :param record_data: Whether to keep the data of every store, instead of only its length.
+        """
+        self.file = open(path, 'wb')
+        self.record_data = record_data
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, WITH_DATA if record_data else 0))
+        self.lock = threading.Lock()
+        self.start = time.perf_counter_ns()
+
+    def record(self, operation: str, data_id: int, data: bytes | str | None) -> None:
+        arrival = time.perf_counter_ns() - self.start
+        if isinstance(data, str):
+            data = data.encode()
+        data = data or b''
+        record = TRACE_RECORD.pack(arrival, OPERATION_CODES[operation], data_id, len(data))
+        with self.lock:
+            self.file.write(record + data if self.record_data else record)
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+class TracedQueue(queue.Queue):
+    """
+    Request queue of a client wrapper that records every request put into it, at its arrival.
+    """
+
+    def __init__(self, recorder: TraceRecorder, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.recorder = recorder
+
+    def put(self, item, block=True, timeout=None):
+        if item is not STOP:
+            self.recorder.record(*item[:3])
+        super().put(item, block, timeout)
+
+
+def read_trace(path: str) -> Tuple[List[Tuple[str, int, bytes | None]], List[float], List[int]]:
+    """
+    Read a trace written by TraceRecorder.
+    :return: The requests as (operation, data_id, data), with data None if the trace does not hold it, their arrival
+    times in seconds since the start of the trace, and their data lengths.
+    """
+    with open(path, 'rb') as trace_file:
+        trace = trace_file.read()
+    magic, version, flags = TRACE_HEADER.unpack_from(trace)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError(f"{path} is not an ORAM trace.")
+    requests, arrivals, lengths = [], [], []
+    offset = TRACE_HEADER.size
+    while offset + TRACE_RECORD.size <= len(trace):
+        arrival, code, data_id, length = TRACE_RECORD.unpack_from(trace, offset)
+        offset += TRACE_RECORD.size
+        data = None
+        if flags & WITH_DATA:
+            data = trace[offset:offset + length] if OPERATIONS[code] == STORE else None
+            offset += length
+        requests.append((OPERATIONS[code], data_id, data))
+        arrivals.append(arrival / 1e9)
+        lengths.append(length)
+    return requests, arrivals, lengths
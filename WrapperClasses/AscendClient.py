@@ -1,69 +1,115 @@
-import threading
 import time
+from typing import Callable, List
 from Client import Client
 from Server import Server
 from queue import Queue, Empty
 
-from WrapperClasses.DefaultClient import DefaultClient
+from WrapperClasses.DefaultClient import DefaultClient, STOP
+from WrapperClasses.RateScheduler import RateScheduler
+
+GUI_UPDATE_INTERVAL = 1.0  # seconds between two updates of the dummy request count in the GUI
 
 
 class AscendClient(DefaultClient):
     def __init__(self, N: int, client: Client, server: Server, request_queue: Queue, result_queue: Queue, rate: float,
-                 gui_update_callback):
-        self.rate = rate  # Rate of requests per second
+                 gui_update_callback, periods: List[float] | None = None, first_epoch_slots: int = 64,
+                 max_epoch_slots: int | None = None, estimate: Callable[[], float] | None = None):
+        """
+        :param rate: Seconds between two ORAM accesses.
+        :param periods: Other periods the client may switch to at the end of an adaptive epoch, or None to keep the
+        rate fixed. See RateScheduler.
+        :param first_epoch_slots: Number of slots of the first adaptive epoch.
+        :param max_epoch_slots: Upper bound on the slots of an adaptive epoch, or None for no bound.
+        :param estimate: Called at the end of every adaptive epoch to compute the next rate, instead of choosing from
+        periods.
+        """
+        self.rate = rate  # Seconds between two requests
+        self.scheduler = RateScheduler(rate, periods, first_epoch_slots, max_epoch_slots, estimate)
         print(f'Running client with rate: {1 / self.rate} requests per second')
-        input('Press Enter to start client')
         self.dummy_request_count = 0
         self.last_dummy_count = 0  # Track dummy requests since the last real operation
+        self.last_gui_update = time.monotonic()
+        self.dummy_slots = 0
+        self.useful_dummy_slots = 0  # dummy slots that moved at least one stash block to the tree
+        self.background_blocks_evicted = 0
         super().__init__(N, client, server, request_queue, result_queue, gui_update_callback)
-        self.schedule_dummy_update()
 
     def run(self):
         while self.running:  # Check the flag to stop the loop
-            start_time = time.time()
+            self.scheduler.wait()
+            if not self.running:
+                break
             try:
-                operation, index, data = self.request_queue.get(timeout=self.rate)  # Wait for a request with a timeout
-                elapsed_time = time.time() - start_time
-                remaining_time = self.rate - elapsed_time
-                if remaining_time > 0:
-                    time.sleep(remaining_time)  # Wait for the remainder of the timeout
-                self.gui_print(f'{operation.capitalize()} Request')
-                if operation == 'store':
-                    self.store_data(index, data)
-                elif operation == 'retrieve':
-                    self.result_queue.put(self.retrieve_data(index))
-                elif operation == 'delete':
-                    self.delete_data(index)
-                # After a real operation, print the number of dummy requests made
-                self.last_dummy_count = self.dummy_request_count
-                self.dummy_request_count = 0  # Reset dummy count after printing
-                # self.print_dummy_count()
-                self.request_queue.task_done()
+                request = self.request_queue.get_nowait()
             except Empty:
-                self.dummy_request_count += 1
-                self.retrieve_data(0)
+                self.dummy_slot()
+                real = False
+            else:
+                if request is STOP:
+                    self.request_queue.task_done()
+                    break
+                self.real_slot(request)
+                real = True
+            overrun = self.scheduler.end_slot(real, self.request_queue.qsize())
+            if overrun:
+                self.client.stats.count('slot_overruns')
+            self.rate = self.scheduler.period
+            self.update_dummy_count()
+
+    def real_slot(self, request: tuple):
+        self.gui_print(f'{request[0].capitalize()} Request')
+        self.client.stats.count('real_accesses')
+        self.serve_request(request)
+        # After a real operation, reset the number of dummy requests made
+        self.last_dummy_count = self.dummy_request_count
+        self.dummy_request_count = 0
+        self.request_queue.task_done()
+
+    def dummy_slot(self):
+        self.dummy_request_count += 1
+        self.client.stats.count('dummy_accesses')
+        evicted = self.client.background_access(self.server)
+        self.dummy_slots += 1
+        self.useful_dummy_slots += evicted > 0
+        self.background_blocks_evicted += evicted
 
+    def slot_report(self) -> dict:
+        """
+        :return: Slots served, overruns, missed slots, largest overrun, adaptive epochs and current period.
+        """
+        return self.scheduler.report()
+
+    def background_work_report(self) -> dict:
+        """
+        :return: Dummy slots, dummy slots that drained the stash, stash blocks they moved to the tree and blocks moved
+        per dummy slot.
+        """
+        return {'dummy_slots': self.dummy_slots, 'useful_dummy_slots': self.useful_dummy_slots,
+                'blocks_evicted': self.background_blocks_evicted,
+                'blocks_per_dummy_slot': self.background_blocks_evicted / self.dummy_slots if self.dummy_slots else 0.0}
 
     def print_dummy_count(self):
         """Print the number of dummy requests since the last real operation."""
-        if self.dummy_request_count > 0:
+        if self.gui_update_callback and self.dummy_request_count > 0:
             self.gui_update_callback(f"Dummy requests made: {self.dummy_request_count}")
             self.last_dummy_count = self.dummy_request_count
             self.dummy_request_count = 0  # Reset dummy count after printing
 
     def gui_print(self, message):
-        """Print a message in the GUI."""
+        """Print a message in the GUI, if there is one."""
+        if not self.gui_update_callback:
+            return
         # Add the message and a new line for the next update
         self.gui_update_callback(f"{message}\n")  # Real operation message
         self.gui_update_callback(f'Dummy requests made: {self.dummy_request_count}\n')  # Initial dummy count
 
-    def schedule_dummy_update(self):
-        """Schedule the dummy request count to be updated every second in the GUI."""
-        if self.gui_update_callback:
-            # Only update the dummy request line if dummy requests are accumulating
-            if self.dummy_request_count != self.last_dummy_count:
-                self.gui_update_callback(f"Dummy requests made: {self.dummy_request_count}\n")
-        # Schedule this method to run again after 1000 ms (1 second)
-        threading.Timer(1.0, self.schedule_dummy_update).start()
-
-
+    def update_dummy_count(self):
+        """Update the dummy request count in the GUI, at most once every GUI_UPDATE_INTERVAL seconds."""
+        now = time.monotonic()
+        if not self.gui_update_callback or now - self.last_gui_update < GUI_UPDATE_INTERVAL:
+            return
+        self.last_gui_update = now
+        # Only update the dummy request line if dummy requests are accumulating
+        if self.dummy_request_count != self.last_dummy_count:
+            self.gui_update_callback(f"Dummy requests made: {self.dummy_request_count}\n")
+            self.last_dummy_count = self.dummy_request_count
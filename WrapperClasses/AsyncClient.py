@@ -0,0 +1,172 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from Client import Client, PATH_EVICTION, STORE, RETRIEVE, DELETE
+from BinaryTree import BinaryTree
+from RingClient import RingClient
+from Server import Server
+
+
+class AsyncClient:
+    """
+    asyncio front end of a Path ORAM client: `await oram.get(id)`, `await oram.put(id, data)`, `await oram.delete(id)`
+    each return the result of their own request.
+    Requests are served in order by a single worker task. While the client-side crypto of one request runs in a
+    worker thread, the path reads of the next queued requests are already in flight, so server latency overlaps with
+    computation. Those reads are issued before the current path is written back, so the buckets they share with it
+    are taken from the freshly written path instead of from the (stale) read. A request for the same block as an
+    access in flight waits until that access is done.
+    """
+
+    def __init__(self, client: Client, server: Server, pipeline_depth: int = 4):
+        """
+        :param client: Client in PATH_EVICTION mode.
+        :param server: Server, RemoteServer or any object with the same interface. If it has read_path_async(), paths
+        are read with it; otherwise read_path() runs in a thread.
+        :param pipeline_depth: Number of queued requests whose path reads may be in flight while a request is computed.
+        """
+        if client.eviction != PATH_EVICTION:
+            raise ValueError("AsyncClient requires a client with PATH_EVICTION")
+        if isinstance(client, RingClient):
+            raise ValueError("AsyncClient requires a Path ORAM client")
+        if client.tree_top_levels:
+            # the patching of in-flight reads assumes every written bucket goes to the server
+            raise ValueError("AsyncClient does not support a client with a tree-top cache")
+        self.client = client
+        self.server = server
+        self.requests = asyncio.Queue()
+        self.crypto_executor = ThreadPoolExecutor(max_workers=1)  # the client is used by one thread at a time
+        self.io_executor = ThreadPoolExecutor(max_workers=1)
+        self.pipeline_depth = pipeline_depth
+        self.worker = None
+        self.prefetched_reads = 0
+
+    async def start(self) -> None:
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        """
+        Serve all queued requests, then stop the worker.
+        """
+        if self.worker is not None:
+            await self.requests.put(None)
+            await self.worker
+            self.worker = None
+        self.crypto_executor.shutdown()
+        self.io_executor.shutdown()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    ################ API  ##############
+
+    async def get(self, data_id: int) -> bytes | None:
+        return await self.submit(RETRIEVE, data_id)
+
+    async def put(self, data_id: int, data: bytes | str) -> bool:
+        if not self.client.is_valid_block(data_id, data):
+            return False
+        await self.submit(STORE, data_id, data)
+        return True
+
+    async def delete(self, data_id: int) -> None:
+        await self.submit(DELETE, data_id)
+
+    async def submit(self, operation: str, data_id: int, data: bytes | str = None):
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.requests.put((operation, data_id, data, future))
+        return await future
+
+    ################ Pipeline  ##############
+
+    def read_path(self, leaf: int) -> asyncio.Future:
+        """
+        Start reading the path to the leaf and return a future of its buckets.
+        """
+        if hasattr(self.server, 'read_path_async'):
+            return asyncio.ensure_future(self.server.read_path_async(leaf))
+        return asyncio.get_running_loop().run_in_executor(self.io_executor, self.server.read_path, leaf)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        in_flight = deque()  # accesses whose path read was issued, in request order
+        held = None  # next request, held back while it accesses the same block as an access in flight
+        stopping = False
+        while True:
+            try:
+                # Issue the path reads of up to pipeline_depth requests ahead of the one being computed
+                while not stopping and len(in_flight) <= self.pipeline_depth:
+                    if held is None:
+                        if in_flight and self.requests.empty():
+                            break
+                        held = await self.requests.get()
+                        if held is None:
+                            stopping = True
+                            break
+                    if any(access.data_id == held[1] for access in in_flight):
+                        break
+                    in_flight.append(InFlightAccess(held, *self.client.begin_access(held[0], held[1])))
+                    in_flight[-1].path_read = self.read_path(in_flight[-1].leaf)
+                    self.prefetched_reads += len(in_flight) > 1
+                    held = None
+                if not in_flight:
+                    return
+
+                access = in_flight[0]
+                path_buckets = access.apply_patches(await access.path_read, self.client.tree_height)
+                self.client.verify_buckets(BinaryTree.get_path_to_leaf(access.leaf, self.client.tree_height),
+                                           path_buckets)
+                result, written_path = await loop.run_in_executor(
+                    self.crypto_executor, self.client.finish_access, self.server, access.operation,
+                    access.data_id, access.leaf, access.new_leaf, path_buckets, access.data)
+            except Exception as e:
+                # The client state cannot be trusted after a failed access, fail every request that is left
+                self.fail_requests(e, [access.request for access in in_flight] + [held])
+                raise
+            in_flight.popleft()
+            if not access.future.cancelled():
+                access.future.set_result(result)
+            # Reads issued before this write-back may have returned stale copies of the buckets it wrote
+            for later_access in in_flight:
+                later_access.patches.append((access.leaf, written_path))
+
+    def fail_requests(self, error: Exception, requests) -> None:
+        while not self.requests.empty():
+            requests.append(self.requests.get_nowait())
+        for request in requests:
+            if request is not None and not request[3].done():
+                request[3].set_exception(error)
+
+
+class InFlightAccess:
+    """
+    A request whose path read was issued, with the path write-backs that happened after the read was issued.
+    """
+
+    def __init__(self, request, leaf: int, new_leaf: int | None):
+        self.request = request
+        self.operation, self.data_id, self.data, self.future = request
+        self.leaf = leaf
+        self.new_leaf = new_leaf
+        self.path_read = None
+        self.patches = []  # (leaf, written path) of every write-back issued after path_read
+
+    def apply_patches(self, path_buckets, tree_height: int):
+        """
+        Replace the buckets the read path shares with a later written path (a common prefix from the root) with the
+        written ones, in write order.
+        """
+        path_buckets = list(path_buckets)
+        path_ids = BinaryTree.get_path_to_leaf(self.leaf, tree_height)
+        for written_leaf, written_path in self.patches:
+            for level, written_id in enumerate(BinaryTree.get_path_to_leaf(written_leaf, tree_height)):
+                if written_id != path_ids[level]:
+                    break
+                path_buckets[level] = written_path[level]
+        return path_buckets
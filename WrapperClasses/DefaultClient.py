@@ -1,45 +1,122 @@
 import queue
 import threading
+from concurrent.futures import Future
 from queue import Queue
 
-from Client import Client
+from Client import Client, as_payload
 from Server import Server
 
+STOP = None  # put on the request queue by stop() to wake up and end the dispatcher
+MAX_BATCH = 64  # most requests taken from the queue at once
+
 
 class DefaultClient:
     def __init__(self, N: int, client: Client, server: Server, request_queue: Queue, result_queue: Queue,
                  gui_update_callback):
+        """
+        :param gui_update_callback: Called with every log line, or None to run headless.
+        :param request_queue: Requests (operation, index, data), whose retrieve results are put on result_queue, or
+        (operation, index, data, future), whose results are set on the future, see submit().
+        """
         self.gui_update_callback = gui_update_callback
         self.server = server
         self.N = N
         self.client = client
         self.request_queue = request_queue
         self.result_queue = result_queue
+        self.coalesced_requests = 0  # retrieves answered without an ORAM access
         self.running = True  # Flag to control the thread
         self.thread = threading.Thread(target=self.run)
         self.thread.start()
 
     def run(self):
         while self.running:  # Check the flag to stop the loop
-            try:
-                operation, index, data = self.request_queue.get(timeout=0.000001)  # needed to avoid busy waiting
-                self.gui_print(f'{operation.capitalize()} Request')
-                if operation == 'store':
-                    self.store_data(index, data)
-                elif operation == 'retrieve':
-                    self.result_queue.put(self.retrieve_data(index))
-                elif operation == 'delete':
-                    self.delete_data(index)
+            batch = [self.request_queue.get()]  # Block until a request or STOP arrives
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.request_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if STOP in batch:
+                self.running = False
+                for request in batch[batch.index(STOP) + 1:]:
+                    if request is not STOP and len(request) == 4:
+                        request[3].cancel()
+                batch_requests = batch[:batch.index(STOP)]
+            else:
+                batch_requests = batch
+            self.serve_batch(batch_requests)
+            for _ in batch:
                 self.request_queue.task_done()
-            except queue.Empty:
+
+    def serve_batch(self, requests: list):
+        """
+        Serve a batch of requests in order, with one ORAM access per request except for retrieves of an id already
+        read or written earlier in the batch, which are answered from the batch (duplicate reads and read-after-write).
+        """
+        known = dict()  # data of every id accessed in the batch so far, None if deleted or not stored
+        for request in requests:
+            operation, index, data = request[:3]
+            self.gui_print(f'{operation.capitalize()} Request')
+            if operation == 'retrieve' and index in known:
+                self.coalesced_requests += 1
+                self.client.stats.count('coalesced_requests')
+                self.reply(request, known[index])
                 continue
+            result = self.serve_request(request)
+            if operation == 'retrieve':
+                known[index] = result
+            elif operation == 'store' and result:
+                known[index] = as_payload(data)
+            elif operation == 'delete':
+                known[index] = None
+
+    def serve_request(self, request: tuple):
+        """
+        Serve a single request with one ORAM access and answer it.
+        :return: The data for retrieve, whether the data was stored for store, None for delete.
+        """
+        operation, index, data = request[:3]
+        try:
+            if operation == 'store':
+                result = self.store_data(index, data)
+            elif operation == 'retrieve':
+                result = self.retrieve_data(index)
+            elif operation == 'delete':
+                result = self.delete_data(index)
+            else:
+                raise ValueError(f"Unknown operation: {operation}")
+        except Exception as error:
+            if len(request) < 4:
+                raise
+            request[3].set_exception(error)
+            return None
+        self.reply(request, result)
+        return result
+
+    def reply(self, request: tuple, result):
+        if len(request) == 4:
+            request[3].set_result(result)
+        elif request[0] == 'retrieve':
+            self.result_queue.put(result)
+
+    def submit(self, operation: str, index: int, data: bytes | str | None = None) -> Future:
+        """
+        Queue a request and return a future of its result, instead of sharing result_queue with other callers.
+        :param operation: 'store', 'retrieve' or 'delete'
+        :return: Future of the data for retrieve, of whether the data was stored for store, of None for delete.
+        """
+        future = Future()
+        self.request_queue.put((operation, index, data, future))
+        return future
 
     def stop(self):
         self.running = False  # Set the flag to stop the thread
+        self.request_queue.put(STOP)  # Wake up the thread if it is waiting for a request
         self.thread.join()  # Wait for the thread to finish
 
-    def store_data(self, index: int, data: str):
-        self.client.store_data(self.server, index, data)
+    def store_data(self, index: int, data: bytes | str) -> bool:
+        return self.client.store_data(self.server, index, data)
 
     def retrieve_data(self, index: int):
         return self.client.retrieve_data(self.server, index)
@@ -48,6 +125,8 @@ class DefaultClient:
         self.client.delete_data(self.server, index)
         
     def gui_print(self, message):
-        """Print a message in the GUI."""
+        """Print a message in the GUI, if there is one."""
+        if not self.gui_update_callback:
+            return
         # Add the message and a new line for the next update
         self.gui_update_callback(f"{message}\n")  # Real operation message
@@ -1,42 +1,84 @@
+from collections import deque
+from math import ceil
 from queue import Queue
-import random
 import string
+import time
+from typing import List
 from Client import Client
 from Server import Server
-from timeit import default_timer as timer
 from WrapperClasses.AscendClient import AscendClient
 
+CALIBRATION_ACCESSES = 32  # dummy accesses timed before the client starts
+LATENCY_WINDOW = 256  # most recent access times the rate is estimated from
+# (latency percentile, headroom factor) of every mode: the rate leaves this much room over the percentile latency
+MODES = {'power': (95, 5), 'performance': (95, 1.3)}
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of the samples.
+    """
+    ordered = sorted(samples)
+    return ordered[max(1, ceil(len(ordered) * percent / 100)) - 1]
+
 
 class LearningAscendClient(AscendClient):
     def __init__(self, N: int, client: Client, server: Server, request_queue: Queue, result_queue: Queue, mode: string,
-                 gui_update_callback):
+                 gui_update_callback, calibration_accesses: int = CALIBRATION_ACCESSES, window: int = LATENCY_WINDOW,
+                 first_epoch_slots: int = 64, max_epoch_slots: int | None = 1024):
+        """
+        :param mode: 'power' or 'performance', see MODES.
+        :param calibration_accesses: Number of dummy accesses timed to set the initial rate.
+        :param window: Number of most recent access times the rate is re-estimated from.
+        :param first_epoch_slots: Number of slots before the first re-estimation, see RateScheduler.
+        :param max_epoch_slots: Upper bound on the slots between two re-estimations.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        if calibration_accesses < 1 or window < 1:
+            raise ValueError("The rate needs at least one calibration access and a window of at least one access")
         self.server = server
         self.N = N
         self.client = client
-        self.rate = self.set_rate()
-        if mode == 'power':
-            self.mode = 'power'
-            self.rate *= 5
-        elif mode == 'performance':
-            self.mode = 'performance'
-            self.rate *= 1.3
-        super().__init__(N, client, server, request_queue, result_queue, self.rate, gui_update_callback)
-
-    def set_rate(self):
-        random_strings = [''.join(random.choices(string.ascii_uppercase + string.digits, k=4)) for _ in
-                          range(self.N)]
-        total_requests = 0
-        timer_start = timer()
-        for index in range(self.N):
-            self.client.store_data(self.server, index, random_strings[index])
-            total_requests += 1
-        for index in range(self.N):
-            self.client.retrieve_data(self.server, index)
-            total_requests += 1
-        for index in range(self.N):
-            self.client.delete_data(self.server, index)
-            total_requests += 1
-        timer_end = timer()
-        total_time = timer_end - timer_start
-        avg_request_time = total_time / total_requests
-        return avg_request_time
+        self.mode = mode
+        self.percentile, self.headroom = MODES[mode]
+        self.latencies = deque(maxlen=window)
+        self.rate = self.set_rate(calibration_accesses)
+        super().__init__(N, client, server, request_queue, result_queue, self.rate, gui_update_callback,
+                         first_epoch_slots=first_epoch_slots, max_epoch_slots=max_epoch_slots,
+                         estimate=self.estimate_rate)
+
+    def set_rate(self, calibration_accesses: int) -> float:
+        """
+        Time a bounded number of dummy accesses, which have the I/O of real ones but leave the stored data as it is.
+        :return: The initial rate, see estimate_rate().
+        """
+        for _ in range(calibration_accesses):
+            start = time.perf_counter()
+            self.client.background_access(self.server)
+            self.latencies.append(time.perf_counter() - start)
+        return self.estimate_rate()
+
+    def estimate_rate(self) -> float:
+        """
+        :return: Seconds between two accesses: the mode's percentile of the recent access times, times its headroom.
+        """
+        return percentile(self.latencies, self.percentile) * self.headroom
+
+    def real_slot(self, request: tuple):
+        start = time.perf_counter()
+        super().real_slot(request)
+        self.latencies.append(time.perf_counter() - start)
+
+    def dummy_slot(self):
+        start = time.perf_counter()
+        super().dummy_slot()
+        self.latencies.append(time.perf_counter() - start)
+
+    def latency_report(self) -> dict:
+        """
+        :return: Median, 95th and 99th percentile of the recent access times in seconds, their number and the rate.
+        """
+        samples = list(self.latencies)
+        return {'p50_s': percentile(samples, 50), 'p95_s': percentile(samples, 95), 'p99_s': percentile(samples, 99),
+                'samples': len(samples), 'rate_s': self.rate}
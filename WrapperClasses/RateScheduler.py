@@ -0,0 +1,104 @@
+import time
+from typing import Callable, List
+
+EPOCH_GROWTH = 2  # every epoch lasts this many times as many slots as the previous one
+
+
+class RateScheduler:
+    """
+    Deadline-based slot clock of AscendClient.
+    Slot k starts at start + k * period on the monotonic clock, independently of how long the accesses of the earlier
+    slots took, so the period does not drift with processing time. A slot whose access ends after the next deadline
+    is an overrun: the deadlines it covered are skipped, so the following slots stay on the same grid.
+    With a list of allowed periods, the scheduler follows Ascend's adaptive epochs: the period changes only at the end
+    of an epoch, every epoch is EPOCH_GROWTH times longer than the previous one, and the next period is the slowest
+    allowed one that keeps up with the real requests observed during the epoch. Alternatively, an estimate function
+    computes the period of every new epoch.
+    """
+
+    def __init__(self, period: float, periods: List[float] | None = None, first_epoch_slots: int = 64,
+                 max_epoch_slots: int | None = None, estimate: Callable[[], float] | None = None):
+        """
+        :param period: Seconds between the starts of two slots.
+        :param periods: Periods the scheduler may switch to at the end of an epoch, or None for a fixed period.
+        :param first_epoch_slots: Number of slots of the first epoch.
+        :param max_epoch_slots: Upper bound on the slots of an epoch, or None to let epochs grow without bound.
+        :param estimate: Called at the end of every epoch to compute the period of the next one, instead of choosing
+        from periods.
+        """
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.period = period
+        self.periods = sorted(set(periods) | {period}) if periods else None
+        self.epoch_slots = first_epoch_slots
+        self.max_epoch_slots = max_epoch_slots
+        self.estimate = estimate
+        self.slots = 0
+        self.overruns = 0
+        self.missed_slots = 0
+        self.max_overrun = 0.0
+        self.epochs = 0
+        self.epoch_slot = 0
+        self.epoch_real_slots = 0
+        self.next_deadline = time.monotonic()
+
+    def wait(self) -> None:
+        """
+        Sleep until the start of the next slot.
+        """
+        delay = self.next_deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def end_slot(self, real: bool, backlog: int = 0) -> float:
+        """
+        Close the current slot and compute the deadline of the next one.
+        :param real: Whether the slot served a real request.
+        :param backlog: Number of requests still waiting, counted as load when an epoch ends.
+        :return: Seconds by which the slot overran the next deadline, or 0.
+        """
+        self.slots += 1
+        self.epoch_slot += 1
+        self.epoch_real_slots += real
+        self.next_deadline += self.period
+        overrun = time.monotonic() - self.next_deadline
+        if overrun > 0:
+            skipped = int(overrun // self.period) + 1
+            self.overruns += 1
+            self.missed_slots += skipped
+            self.max_overrun = max(self.max_overrun, overrun)
+            self.next_deadline += skipped * self.period
+        if (self.periods or self.estimate) and self.epoch_slot >= self.epoch_slots:
+            self.end_epoch(backlog)
+        return max(overrun, 0.0)
+
+    def end_epoch(self, backlog: int) -> None:
+        """
+        Pick the period of the next epoch: the estimate if there is an estimate function, otherwise the slowest allowed
+        period with at least one slot per request observed in this epoch, or the fastest allowed period if none keeps
+        up.
+        :param backlog: Number of requests still waiting at the end of the epoch.
+        """
+        demand = self.epoch_real_slots + backlog
+        if self.estimate:
+            new_period = self.estimate()
+        elif demand == 0:
+            new_period = self.periods[-1]
+        else:
+            interval = self.epoch_slot * self.period / demand
+            fitting = [period for period in self.periods if period <= interval]
+            new_period = fitting[-1] if fitting else self.periods[0]
+        self.period = new_period
+        self.epochs += 1
+        self.epoch_slot = 0
+        self.epoch_real_slots = 0
+        self.epoch_slots *= EPOCH_GROWTH
+        if self.max_epoch_slots is not None:
+            self.epoch_slots = min(self.epoch_slots, self.max_epoch_slots)
+
+    def report(self) -> dict:
+        """
+        :return: Slots served, overruns, missed slots, largest overrun in seconds, epochs and current period.
+        """
+        return {'slots': self.slots, 'overruns': self.overruns, 'missed_slots': self.missed_slots,
+                'max_overrun_s': self.max_overrun, 'epochs': self.epochs, 'period_s': self.period}
@@ -0,0 +1,47 @@
+"""
+Stash occupancy of a Path ORAM client padding its accesses with dummy slots, with plain dummy accesses against
+background accesses that evict the stash along their random path.
+Every real random store is followed by --idle dummy slots, as in AscendClient under light load. Small buckets make the
+stash grow, so that the eviction work of the idle slots shows.
+
+Run from the repository root:
+    python -m benchmarks.bench_background_eviction [--num-of-files N] [--accesses A] [--idle K] [--bucket-size Z]
+"""
+import argparse
+import random
+from statistics import mean
+from Client import Client, PATH_EVICTION, BLOCK_SIZE, get_tree_size
+from Server import Server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=2 ** 10)
+    parser.add_argument('--accesses', type=int, default=2000)
+    parser.add_argument('--idle', type=int, default=1, help='dummy slots after every real access')
+    parser.add_argument('--bucket-size', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'dummy slots':>11} {'mean stash':>11} {'max stash':>10} {'blocks/dummy slot':>18} {'useful slots':>13}")
+    for kind in ('dummy', 'background'):
+        random.seed(0)
+        server = Server(get_tree_size(args.num_of_files), args.bucket_size, BLOCK_SIZE)
+        client = Client(args.num_of_files, server, eviction=PATH_EVICTION, bucket_size=args.bucket_size)
+        stash_sizes = []
+        evicted = []
+        for _ in range(args.accesses):
+            client.store_data(server, random.randrange(args.num_of_files), 'data')
+            for _ in range(args.idle):
+                if kind == 'dummy':
+                    client.dummy_access(server)
+                    evicted.append(0)
+                else:
+                    evicted.append(client.background_access(server))
+                stash_sizes.append(len(client.stash))
+        useful = sum(1 for blocks in evicted if blocks) / len(evicted)
+        print(f"{kind:>11} {mean(stash_sizes):>11.2f} {max(stash_sizes):>10} {mean(evicted):>18.3f} "
+              f"{useful:>12.1%}")
+
+
+if __name__ == '__main__':
+    main()
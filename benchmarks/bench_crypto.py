@@ -0,0 +1,68 @@
+"""
+Compare the cost of the crypto done by one access when every block is encrypted on its own (as Client did before
+BucketCipher) with encrypting the whole path in one BucketCipher call.
+
+Run from the repository root:
+    python -m benchmarks.bench_crypto
+"""
+import hashlib
+from math import ceil, log2
+from timeit import default_timer as timer
+from Crypto import Random
+from Crypto.Cipher import AES
+from Crypto.Hash import HMAC, SHA256
+from Crypto.Util import Counter
+from BucketCipher import BucketCipher, NONCE_SIZE, TAG_SIZE
+from Client import BLOCK_HEADER, BUCKET_SIZE, DATA_SIZE, KEY_SIZE
+
+REPEATS = 200
+
+
+def encrypt_block(secret_key: bytes, plaintext: bytes) -> bytes:
+    nonce = Random.get_random_bytes(NONCE_SIZE)
+    cipher = AES.new(secret_key, AES.MODE_CTR, counter=Counter.new(64, nonce))
+    ciphertext = cipher.encrypt(plaintext)
+    hmac = HMAC.new(hashlib.sha256(secret_key).digest(), digestmod=SHA256)
+    hmac.update(nonce + ciphertext)
+    return nonce + ciphertext + hmac.digest()
+
+
+def decrypt_block(secret_key: bytes, block: bytes) -> bytes:
+    nonce, ciphertext, tag = block[:NONCE_SIZE], block[NONCE_SIZE:-TAG_SIZE], block[-TAG_SIZE:]
+    hmac = HMAC.new(hashlib.sha256(secret_key).digest(), digestmod=SHA256)
+    hmac.update(nonce + ciphertext)
+    hmac.verify(tag)
+    return AES.new(secret_key, AES.MODE_CTR, counter=Counter.new(64, nonce)).decrypt(ciphertext)
+
+
+def time_per_path(function, path_blocks) -> float:
+    start = timer()
+    for _ in range(REPEATS):
+        function(path_blocks)
+    return (timer() - start) / REPEATS
+
+
+def main():
+    secret_key = Random.get_random_bytes(KEY_SIZE)
+    cipher = BucketCipher(secret_key)
+    plaintext = bytes(BLOCK_HEADER.size + DATA_SIZE)
+    print(f"{'N':>10} {'blocks/path':>12} {'per-block ms':>13} {'batched ms':>11} {'speedup':>8}")
+    for num_of_files in (2 ** 6, 2 ** 10, 2 ** 14, 2 ** 20):
+        path_length = max(0, ceil(log2(num_of_files)) - 1) + 1
+        blocks = cipher.encrypt_blocks([plaintext] * (path_length * BUCKET_SIZE))
+
+        def per_block(path_blocks):
+            decrypted = [decrypt_block(secret_key, block) for block in path_blocks]
+            return [encrypt_block(secret_key, block) for block in decrypted]
+
+        def batched(path_blocks):
+            return cipher.encrypt_blocks(cipher.decrypt_blocks(path_blocks))
+
+        per_block_time = time_per_path(per_block, blocks)
+        batched_time = time_per_path(batched, blocks)
+        print(f"{num_of_files:>10} {len(blocks):>12} {per_block_time * 1000:>13.3f} {batched_time * 1000:>11.3f} "
+              f"{per_block_time / batched_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Client CPU time of a dummy access against a real retrieve, over a range of block sizes.
+Both read and write one path of the same tree; the table shows the process CPU time per access and the buckets read
+and written per access, which must be equal for the dummy to look like a real access.
+
+Run from the repository root:
+    python -m benchmarks.bench_dummy_access [--num-of-files N] [--accesses A] [--data-sizes 4 64 1024 4096]
+"""
+import argparse
+import random
+import time
+from Client import Client, PATH_EVICTION, BUCKET_SIZE, get_block_size, get_tree_size
+from Server import Server
+from Stats import Stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=2 ** 12)
+    parser.add_argument('--accesses', type=int, default=1000)
+    parser.add_argument('--data-sizes', type=int, nargs='+', default=[4, 64, 1024, 4096])
+    args = parser.parse_args()
+
+    print(f"{'data B':>7} {'access':>9} {'CPU ms':>8} {'buckets r/w':>12} {'speedup':>8}")
+    for data_size in args.data_sizes:
+        random.seed(0)
+        server = Server(get_tree_size(args.num_of_files), BUCKET_SIZE, get_block_size(data_size))
+        server.stats = Stats()
+        client = Client(args.num_of_files, server, eviction=PATH_EVICTION, data_size=data_size)
+        client.store_many(server, [(data_id, bytes(data_size)) for data_id in range(args.num_of_files // 2)])
+        baseline = None
+        for name in ('retrieve', 'dummy'):
+            server.stats.reset()
+            start = time.process_time()
+            for _ in range(args.accesses):
+                if name == 'retrieve':
+                    client.retrieve_data(server, random.randrange(args.num_of_files // 2))
+                else:
+                    client.dummy_access(server)
+            elapsed = (time.process_time() - start) / args.accesses
+            baseline = baseline or elapsed
+            counters = server.stats.counters
+            buckets = f"{counters['buckets_read'] / args.accesses:.0f}/{counters['buckets_written'] / args.accesses:.0f}"
+            print(f"{data_size:>7} {name:>9} {elapsed * 1000:>8.3f} {buckets:>12} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Time to first access of a new Path ORAM, with the tree initialized bucket by bucket, in bulk (INIT_CHUNK buckets per
+encryption and write) and lazily (nothing written until an access writes it).
+The time covers the server and client construction and one store followed by one retrieve. With --path the tree is
+kept in a FileServer.
+
+Run from the repository root:
+    python -m benchmarks.bench_init [--sizes 1024 16384 262144] [--path FILE]
+"""
+import argparse
+import os
+from timeit import default_timer as timer
+import Client as client_module
+from Client import Client, PATH_EVICTION, BUCKET_SIZE, BLOCK_SIZE, get_tree_size
+from Server import Server, FileServer
+
+
+def create_server(num_of_files: int, path: str | None) -> Server:
+    if path is None:
+        return Server(get_tree_size(num_of_files), BUCKET_SIZE, BLOCK_SIZE)
+    for stale in (path, path + '.journal'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    return FileServer(path, get_tree_size(num_of_files), BUCKET_SIZE, BLOCK_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2 ** 10, 2 ** 14, 2 ** 18])
+    parser.add_argument('--path', help='keep the tree in this file instead of in memory')
+    args = parser.parse_args()
+
+    bulk_chunk = client_module.INIT_CHUNK
+    print(f"{'N':>8} {'init':>11} {'first access ms':>16}")
+    for num_of_files in args.sizes:
+        for name, chunk, lazy in (('per-bucket', 1, False), ('bulk', bulk_chunk, False), ('lazy', bulk_chunk, True)):
+            client_module.INIT_CHUNK = chunk
+            start = timer()
+            server = create_server(num_of_files, args.path)
+            client = Client(num_of_files, server, eviction=PATH_EVICTION, lazy_init=lazy)
+            client.store_data(server, 0, 'data')
+            client.retrieve_data(server, 0)
+            elapsed = timer() - start
+            print(f"{num_of_files:>8} {name:>11} {elapsed * 1000:>16.1f}")
+    client_module.INIT_CHUNK = bulk_chunk
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Round trips and latency per access of a Client talking to an OramServer on localhost through RemoteServer.
+The server runs in a background thread of this process and can emulate a remote storage host with --latency-ms.
+
+Run from the repository root:
+    python -m benchmarks.bench_network [--num-of-files N] [--accesses A] [--latency-ms MS]
+"""
+import argparse
+import asyncio
+import random
+import threading
+from statistics import median
+from timeit import default_timer as timer
+from Client import Client, PATH_EVICTION, OVERFLOW_EVICTION, BUCKET_SIZE, BLOCK_SIZE, get_tree_size
+from NetworkServer import OramServer, RemoteServer
+from Server import Server
+
+
+def start_localhost_server(num_of_files: int, latency: float) -> int:
+    """
+    Start an OramServer for a fresh in-memory tree on localhost, in a background thread.
+    :return: The port it listens on.
+    """
+    loop = asyncio.new_event_loop()
+    oram_server = OramServer(Server(get_tree_size(num_of_files), BUCKET_SIZE, BLOCK_SIZE), latency)
+    tcp_server = loop.run_until_complete(oram_server.start('127.0.0.1', 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return tcp_server.sockets[0].getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=1024)
+    parser.add_argument('--accesses', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='emulated one-way server latency')
+    args = parser.parse_args()
+
+    print(f"{'eviction':>10} {'round trips/access':>19} {'requests/access':>16} {'median ms':>10}")
+    for eviction in (PATH_EVICTION, OVERFLOW_EVICTION):
+        port = start_localhost_server(args.num_of_files, args.latency_ms / 1000)
+        server = RemoteServer('127.0.0.1', port)
+        client = Client(args.num_of_files, server, eviction=eviction)
+        for data_id in range(args.num_of_files // 2):
+            client.store_data(server, data_id, 'data')
+
+        round_trips, requests_sent = server.round_trips, server.requests_sent
+        latencies = []
+        for _ in range(args.accesses):
+            data_id = random.randrange(args.num_of_files // 2)
+            start = timer()
+            client.retrieve_data(server, data_id)
+            latencies.append(timer() - start)
+        round_trips = (server.round_trips - round_trips) / args.accesses
+        requests_sent = (server.requests_sent - requests_sent) / args.accesses
+        server.close()
+        print(f"{eviction:>10} {round_trips:>19.2f} {requests_sent:>16.2f} {median(latencies) * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
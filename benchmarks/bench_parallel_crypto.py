@@ -0,0 +1,51 @@
+"""
+Scaling of path decryption and re-encryption with the number of crypto workers.
+For every block size, a path of a deep tree is decrypted and re-encrypted with a single BucketCipher and with
+ParallelBucketCipher on thread and process pools of 1/2/4/8 workers. The speedup is relative to the single cipher.
+
+Run from the repository root:
+    python -m benchmarks.bench_parallel_crypto [--tree-height H] [--data-sizes 64 1024 4096] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+from timeit import default_timer as timer
+from BucketCipher import BucketCipher, ParallelBucketCipher, THREAD_POOL, PROCESS_POOL
+from Client import BLOCK_HEADER, BUCKET_SIZE, KEY_SIZE
+
+REPEATS = 20
+
+
+def time_per_path(cipher, path_blocks) -> float:
+    cipher.encrypt_blocks(cipher.decrypt_blocks(path_blocks))  # warm up the pool
+    start = timer()
+    for _ in range(REPEATS):
+        cipher.encrypt_blocks(cipher.decrypt_blocks(path_blocks))
+    return (timer() - start) / REPEATS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tree-height', type=int, default=20)
+    parser.add_argument('--data-sizes', type=int, nargs='+', default=[64, 1024, 4096])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    secret_key = os.urandom(KEY_SIZE)
+    num_of_blocks = (args.tree_height + 1) * BUCKET_SIZE
+    print(f'{os.cpu_count()} CPUs, {num_of_blocks} blocks per path')
+    print(f"{'data B':>7} {'pool':>8} {'workers':>8} {'ms/path':>8} {'speedup':>8}")
+    for data_size in args.data_sizes:
+        single = BucketCipher(secret_key)
+        path_blocks = single.encrypt_blocks([os.urandom(BLOCK_HEADER.size + data_size)] * num_of_blocks)
+        baseline = time_per_path(single, path_blocks)
+        print(f"{data_size:>7} {'none':>8} {1:>8} {baseline * 1000:>8.3f} {1:>7.2f}x")
+        for pool in (THREAD_POOL, PROCESS_POOL):
+            for workers in args.workers:
+                cipher = ParallelBucketCipher(secret_key, workers, pool)
+                elapsed = time_per_path(cipher, path_blocks)
+                cipher.close()
+                print(f"{data_size:>7} {pool:>8} {workers:>8} {elapsed * 1000:>8.3f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Client memory against N for the flat position map and for the recursive position map, next to access latency.
+Every configuration runs in a fresh process so its peak RSS can be measured. The server buffers live in the same
+process, so their size and the RSS of the idle interpreter are subtracted to estimate the client's share.
+
+Run from the repository root:
+    python -m benchmarks.bench_position_map [--budget ENTRIES] [--max-exponent E]
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+from statistics import median
+from timeit import default_timer as timer
+from Client import Client, PATH_EVICTION, BUCKET_SIZE, BLOCK_SIZE, get_tree_size
+from Server import Server
+
+LATENCY_SAMPLES = 200
+
+
+def max_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # ru_maxrss is in KiB on Linux
+
+
+def measure(num_of_files: int, budget: int | None) -> dict:
+    baseline_rss = max_rss()  # the interpreter and imported modules
+    servers = []
+
+    def server_factory(tree_size: int, bucket_size: int, block_size: int) -> Server:
+        servers.append(Server(tree_size, bucket_size, block_size))
+        return servers[-1]
+
+    server = server_factory(get_tree_size(num_of_files), BUCKET_SIZE, BLOCK_SIZE)
+    client = Client(num_of_files, server, eviction=PATH_EVICTION, position_map_budget=budget,
+                    server_factory=server_factory)
+    for data_id in range(num_of_files):
+        client.store_data(server, data_id, 'data')
+
+    latencies = []
+    for _ in range(LATENCY_SAMPLES):
+        start = timer()
+        client.retrieve_data(server, random.randrange(num_of_files))
+        latencies.append(timer() - start)
+
+    rss = max_rss()
+    server_bytes = sum(len(server.tree.buffer) for server in servers)
+    return {'N': num_of_files, 'budget': budget, 'oram_levels': len(servers), 'max_rss': rss,
+            'server_bytes': server_bytes, 'client_rss_estimate': rss - baseline_rss - server_bytes,
+            'median_access_ms': median(latencies) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=int, default=256, help='position map entries kept in client memory')
+    parser.add_argument('--max-exponent', type=int, default=14, help='largest N is 2 ** max-exponent')
+    parser.add_argument('--worker', nargs=2, type=int, metavar=('N', 'BUDGET'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        num_of_files, budget = args.worker
+        print(json.dumps(measure(num_of_files, budget if budget > 0 else None)))
+        return
+
+    print(f"{'N':>8} {'position map':>14} {'levels':>7} {'max RSS MiB':>12} {'server MiB':>11} "
+          f"{'client MiB':>11} {'access ms':>10}")
+    for exponent in range(10, args.max_exponent + 1, 2):
+        for budget in (0, args.budget):
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_position_map',
+                                     '--worker', str(2 ** exponent), str(budget)],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output)
+            kind = 'flat' if result['budget'] is None else f"budget {result['budget']}"
+            print(f"{result['N']:>8} {kind:>14} {result['oram_levels']:>7} {result['max_rss'] / 2 ** 20:>12.1f} "
+                  f"{result['server_bytes'] / 2 ** 20:>11.1f} {result['client_rss_estimate'] / 2 ** 20:>11.1f} "
+                  f"{result['median_access_ms']:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
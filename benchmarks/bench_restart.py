@@ -0,0 +1,64 @@
+"""
+Restart time of a Path ORAM client over a FileServer: reloading all the data into a new tree, against reopening the
+tree and restoring the client state from a StateLog snapshot and log.
+The log holds --log-records accesses after the last snapshot.
+
+Run from the repository root:
+    python -m benchmarks.bench_restart [--num-of-files N] [--log-records R] [--path FILE]
+"""
+import argparse
+import os
+from timeit import default_timer as timer
+from Client import Client, PATH_EVICTION, BUCKET_SIZE, BLOCK_SIZE, KEY_SIZE, get_tree_size
+from Server import FileServer
+from StateLog import StateLog
+
+BATCH = 256  # items per store_many() call of the reload
+
+
+def remove_files(path: str) -> None:
+    for stale in (path, path + '.journal', path + '.state', path + '.state.log'):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=2 ** 14)
+    parser.add_argument('--log-records', type=int, default=500)
+    parser.add_argument('--path', default='bench_restart.tree')
+    args = parser.parse_args()
+
+    tree_size = get_tree_size(args.num_of_files)
+    items = [(data_id, 'data') for data_id in range(args.num_of_files)]
+    remove_files(args.path)
+    start = timer()
+    server = FileServer(args.path, tree_size, BUCKET_SIZE, BLOCK_SIZE)
+    client = Client(args.num_of_files, server, eviction=PATH_EVICTION)
+    for offset in range(0, len(items), BATCH):
+        client.store_many(server, items[offset:offset + BATCH])
+    reload_time = timer() - start
+
+    state_key = os.urandom(KEY_SIZE)
+    state_log = StateLog(args.path + '.state', state_key, compact_every=args.log_records + 1)
+    state_log.attach(client)
+    for data_id in range(args.log_records):
+        client.retrieve_data(server, data_id)
+    state_log.close()
+    server.close()
+
+    start = timer()
+    server = FileServer(args.path, tree_size, BUCKET_SIZE, BLOCK_SIZE)
+    client = StateLog(args.path + '.state', state_key).restore(server)
+    client.retrieve_data(server, 0)
+    restore_time = timer() - start
+    server.close()
+    remove_files(args.path)
+
+    print(f'N = {args.num_of_files}, {args.log_records} log records')
+    print(f"{'reload all data':<22} {reload_time:8.2f} s")
+    print(f"{'restore client state':<22} {restore_time:8.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Bandwidth per access of the Path ORAM Client and the Ring ORAM RingClient, over a range of block sizes.
+Bytes are counted at the server interface, amortized over all accesses: path reads, evictions, early reshuffles and,
+for Ring ORAM, the reads and writes of the bucket metadata.
+
+Run from the repository root:
+    python -m benchmarks.bench_ring [--num-of-files N] [--accesses A] [--data-sizes 64 1024 4096]
+"""
+import argparse
+import random
+from statistics import median
+from timeit import default_timer as timer
+from Client import Client, PATH_EVICTION, BUCKET_SIZE, get_block_size, get_tree_size
+from RingClient import RingClient, get_ring_bucket_size
+from Server import Server
+from Stats import Stats
+
+
+def bytes_moved(server: Server) -> tuple:
+    """
+    :return: Bytes read from and written to the server since its stats were reset.
+    """
+    counters = server.stats.counters
+    read = counters['buckets_read'] * server.tree.bucket_bytes + counters['blocks_read'] * server.tree.block_size
+    return read, counters['buckets_written'] * server.tree.bucket_bytes
+
+
+def metered_server_factory(tree_size: int, bucket_size: int, block_size: int) -> Server:
+    server = Server(tree_size, bucket_size, block_size)
+    server.stats = Stats()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=2 ** 12)
+    parser.add_argument('--accesses', type=int, default=1000)
+    parser.add_argument('--data-sizes', type=int, nargs='+', default=[64, 1024, 4096])
+    args = parser.parse_args()
+
+    print(f"{'engine':>6} {'data B':>7} {'KiB read/access':>16} {'KiB written/access':>19} {'KiB total':>10} "
+          f"{'median ms':>10}")
+    for data_size in args.data_sizes:
+        payload = bytes(data_size)
+        for engine in ('path', 'ring'):
+            random.seed(0)
+            tree_size, block_size = get_tree_size(args.num_of_files), get_block_size(data_size)
+            if engine == 'path':
+                server = metered_server_factory(tree_size, BUCKET_SIZE, block_size)
+                client = Client(args.num_of_files, server, eviction=PATH_EVICTION, data_size=data_size)
+                servers = [server]
+            else:
+                server = metered_server_factory(tree_size, get_ring_bucket_size(), block_size)
+                client = RingClient(args.num_of_files, server, data_size=data_size,
+                                    server_factory=metered_server_factory)
+                servers = [server, client.metadata_server]
+            for data_id in range(args.num_of_files // 2):
+                client.store_data(server, data_id, payload)
+
+            for metered in servers:
+                metered.stats.reset()
+            latencies = []
+            for _ in range(args.accesses):
+                data_id = random.randrange(args.num_of_files)
+                start = timer()
+                client.retrieve_data(server, data_id)
+                latencies.append(timer() - start)
+            read = sum(bytes_moved(metered)[0] for metered in servers) / args.accesses / 1024
+            written = sum(bytes_moved(metered)[1] for metered in servers) / args.accesses / 1024
+            print(f"{engine:>6} {data_size:>7} {read:>16.2f} {written:>19.2f} {read + written:>10.2f} "
+                  f"{median(latencies) * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Per-block encryption against sealed buckets, with and without the Merkle freshness tree, over a range of block sizes.
+The table shows the bytes stored per bucket, the bytes moved per access (a path read and written) and the client CPU
+time per retrieve.
+
+Run from the repository root:
+    python -m benchmarks.bench_sealing [--num-of-files N] [--accesses A] [--data-sizes 4 64 1024 4096]
+"""
+import argparse
+import random
+import time
+from Client import Client, PATH_EVICTION, BUCKET_SIZE, get_block_size, get_tree_size
+from Server import Server
+
+FORMATS = {'block': (False, False), 'bucket': (True, False), 'merkle': (True, True)}  # bucket_sealing, merkle
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=2 ** 12)
+    parser.add_argument('--accesses', type=int, default=1000)
+    parser.add_argument('--data-sizes', type=int, nargs='+', default=[4, 64, 1024, 4096])
+    args = parser.parse_args()
+
+    print(f"{'data B':>7} {'format':>7} {'bucket B':>9} {'KiB/access':>11} {'CPU ms':>8}")
+    for data_size in args.data_sizes:
+        for name, (bucket_sealing, merkle) in FORMATS.items():
+            random.seed(0)
+            block_size = get_block_size(data_size, bucket_sealing, BUCKET_SIZE, merkle)
+            server = Server(get_tree_size(args.num_of_files), BUCKET_SIZE, block_size)
+            client = Client(args.num_of_files, server, eviction=PATH_EVICTION, data_size=data_size,
+                            bucket_sealing=bucket_sealing, merkle=merkle)
+            client.store_many(server, [(data_id, bytes(data_size)) for data_id in range(args.num_of_files // 2)])
+            start = time.process_time()
+            for _ in range(args.accesses):
+                client.retrieve_data(server, random.randrange(args.num_of_files // 2))
+            elapsed = (time.process_time() - start) / args.accesses
+            bucket_bytes = BUCKET_SIZE * block_size
+            moved = 2 * (client.tree_height + 1) * bucket_bytes / 1024
+            print(f"{data_size:>7} {name:>7} {bucket_bytes:>9} {moved:>11.2f} {elapsed * 1000:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
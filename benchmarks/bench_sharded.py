@@ -0,0 +1,57 @@
+"""
+Throughput of ShardedClient against the number of partitions S.
+Batches of random retrievals are served by S worker processes; with S = 1 the whole ORAM is a single partition. The
+table also shows the time of the same workload on a single in-process Client, for reference.
+
+Run from the repository root:
+    python -m benchmarks.bench_sharded [--num-of-files N] [--batch B] [--batches K] [--shards 1 2 4 8]
+"""
+import argparse
+import os
+import random
+from timeit import default_timer as timer
+from Client import Client, PATH_EVICTION, RETRIEVE, BUCKET_SIZE, BLOCK_SIZE, get_tree_size
+from Server import Server
+from ShardedClient import ShardedClient
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=2 ** 12)
+    parser.add_argument('--batch', type=int, default=64, help='requests per access_many() call')
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    random.seed(0)
+    workload = [[(RETRIEVE, random.randrange(args.num_of_files), None) for _ in range(args.batch)]
+                for _ in range(args.batches)]
+    num_of_requests = args.batch * args.batches
+    print(f'{os.cpu_count()} CPUs, {num_of_requests} requests in batches of {args.batch}')
+    print(f"{'S':>4} {'requests/s':>11} {'speedup':>8}")
+
+    server = Server(get_tree_size(args.num_of_files), BUCKET_SIZE, BLOCK_SIZE)
+    client = Client(args.num_of_files, server, eviction=PATH_EVICTION)
+    client.store_many(server, [(data_id, 'data') for data_id in range(args.num_of_files)])
+    start = timer()
+    for requests in workload:
+        for _, data_id, _ in requests:
+            client.retrieve_data(server, data_id)
+    baseline = num_of_requests / (timer() - start)
+    print(f"{'none':>4} {baseline:>11.1f} {1:>7.2f}x")
+
+    for num_of_shards in args.shards:
+        sharded = ShardedClient(args.num_of_files, num_of_shards)
+        for offset in range(0, args.num_of_files, args.batch):
+            last = min(offset + args.batch, args.num_of_files)
+            sharded.store_many([(data_id, 'data') for data_id in range(offset, last)])
+        start = timer()
+        for requests in workload:
+            sharded.access_many(requests)
+        throughput = num_of_requests / (timer() - start)
+        sharded.close()
+        print(f"{num_of_shards:>4} {throughput:>11.1f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
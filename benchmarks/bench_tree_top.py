@@ -0,0 +1,68 @@
+"""
+Server I/O and latency per access of a Path ORAM client as the tree-top cache grows.
+For every number of cached levels k, the client gets the memory budget of exactly k levels and the benchmark reports
+the buckets and bytes read from and written to the server per access, and the access latency. With --path the tree
+is kept in a FileServer, so that the saved I/O hits the disk.
+
+Run from the repository root:
+    python -m benchmarks.bench_tree_top [--num-of-files N] [--accesses A] [--path FILE]
+"""
+import argparse
+import os
+import random
+from statistics import mean, median
+from timeit import default_timer as timer
+from Client import Client, PATH_EVICTION, BLOCK_HEADER, BUCKET_SIZE, BLOCK_SIZE, DATA_SIZE, get_tree_size
+from Server import Server, FileServer
+from Stats import Stats
+
+
+def create_server(num_of_files: int, path: str | None) -> Server:
+    if path is None:
+        return Server(get_tree_size(num_of_files), BUCKET_SIZE, BLOCK_SIZE)
+    for stale in (path, path + '.journal'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    return FileServer(path, get_tree_size(num_of_files), BUCKET_SIZE, BLOCK_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-of-files', type=int, default=2 ** 14)
+    parser.add_argument('--accesses', type=int, default=1000)
+    parser.add_argument('--path', help='keep the tree in this file instead of in memory')
+    args = parser.parse_args()
+
+    bucket_bytes = BUCKET_SIZE * (BLOCK_HEADER.size + DATA_SIZE)
+    tree_height = max(0, (args.num_of_files - 1).bit_length() - 1)
+    print(f"{'k':>3} {'budget B':>10} {'buckets r/w per access':>23} {'KiB r/w per access':>19} "
+          f"{'mean ms':>8} {'median ms':>10}")
+    for levels in range(tree_height + 1):
+        random.seed(levels)
+        server = create_server(args.num_of_files, args.path)
+        server.stats = Stats()
+        budget = (2 ** levels - 1) * bucket_bytes
+        client = Client(args.num_of_files, server, eviction=PATH_EVICTION, tree_top_budget=budget)
+        assert client.tree_top_levels == levels
+        for data_id in range(args.num_of_files // 2):
+            client.store_data(server, data_id, 'data')
+
+        server.stats.reset()
+        latencies = []
+        for _ in range(args.accesses):
+            data_id = random.randrange(args.num_of_files)
+            start = timer()
+            client.retrieve_data(server, data_id)
+            latencies.append(timer() - start)
+        buckets_read = server.stats.counters['buckets_read'] / args.accesses
+        buckets_written = server.stats.counters['buckets_written'] / args.accesses
+        kib = server.tree.bucket_bytes / 1024
+        print(f"{levels:>3} {budget:>10} {buckets_read:>11.1f}/{buckets_written:<11.1f} "
+              f"{buckets_read * kib:>9.2f}/{buckets_written * kib:<9.2f} "
+              f"{mean(latencies) * 1000:>8.3f} {median(latencies) * 1000:>10.3f}")
+        if args.path:
+            server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Reproducible benchmark suite: runs Client against an in-memory Server over a sweep of N, bucket size and eviction
+strategy and reports, per configuration:
+    - startup cost, Server.__init__ and Client.init_tree measured separately
+    - p50/p95/p99 latency of store, retrieve and delete
+    - operations per second
+    - encrypt/decrypt calls and blocks per operation
+    - bytes read from and written to the server per operation
+Results are printed as a table and can be written as JSON, to diff runs between releases with --compare.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks [--quick] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+from datetime import datetime, timezone
+from timeit import default_timer as timer
+from typing import List
+from Client import Client, OVERFLOW_EVICTION, PATH_EVICTION, STORE, RETRIEVE, DELETE, BLOCK_SIZE, get_tree_size
+from Server import Server
+
+OPERATIONS = (STORE, RETRIEVE, DELETE)
+PERCENTILES = (50, 95, 99)
+
+
+class MeteredServer(Server):
+    """
+    Server that counts the buckets and bytes read and written.
+    """
+
+    def __init__(self, tree_size: int, bucket_size: int, block_size: int):
+        super().__init__(tree_size, bucket_size, block_size)
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def get_bucket_by_index(self, index: int):
+        bucket = super().get_bucket_by_index(index)
+        self.bytes_read += sum(len(block) for block in bucket)
+        return bucket
+
+    def write_bucket_by_index(self, index: int, bucket) -> None:
+        self.bytes_written += sum(len(block) for block in bucket)
+        super().write_bucket_by_index(index, bucket)
+
+
+class MeteredCipher:
+    """
+    Wraps a BucketCipher and counts its calls and the blocks they process.
+    """
+
+    def __init__(self, cipher):
+        self.cipher = cipher
+        self.encrypt_calls = self.decrypt_calls = self.blocks_encrypted = self.blocks_decrypted = 0
+
+    def encrypt_blocks(self, plaintexts):
+        self.encrypt_calls += 1
+        self.blocks_encrypted += len(plaintexts)
+        return self.cipher.encrypt_blocks(plaintexts)
+
+    def decrypt_blocks(self, blocks):
+        self.decrypt_calls += 1
+        self.blocks_decrypted += len(blocks)
+        return self.cipher.decrypt_blocks(blocks)
+
+    def counters(self) -> tuple:
+        return self.encrypt_calls, self.decrypt_calls, self.blocks_encrypted, self.blocks_decrypted
+
+
+def percentile(sorted_values: List[float], percent: int) -> float:
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    rank = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def run_configuration(num_of_files: int, bucket_size: int, eviction: str, num_of_ops: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    random.seed(seed)  # the client draws its leaves from the random module
+
+    start = timer()
+    server = MeteredServer(get_tree_size(num_of_files), bucket_size, BLOCK_SIZE)
+    server_init = timer() - start
+    start = timer()
+    client = Client(num_of_files, server, eviction=eviction, bucket_size=bucket_size)
+    client_init = timer() - start
+    cipher = client.cipher = MeteredCipher(client.cipher)
+
+    # Fill half of the ORAM so that retrievals and deletions hit real data
+    for data_id in range(num_of_files // 2):
+        client.store_data(server, data_id, f'{data_id % 10000:04d}')
+
+    stored = set(range(num_of_files // 2))
+    workload = []
+    for _ in range(num_of_ops):
+        operation = rng.choice(OPERATIONS)
+        if operation == DELETE and stored:
+            data_id = rng.choice(sorted(stored))
+            stored.discard(data_id)
+        else:
+            data_id = rng.randrange(num_of_files)
+            operation = RETRIEVE if operation == DELETE else operation
+            if operation == STORE:
+                stored.add(data_id)
+        workload.append((operation, data_id))
+
+    latencies = {operation: [] for operation in OPERATIONS}
+    counters_before = cipher.counters()
+    bytes_before = server.bytes_read, server.bytes_written
+    total_start = timer()
+    for operation, data_id in workload:
+        start = timer()
+        if operation == STORE:
+            client.store_data(server, data_id, 'data')
+        elif operation == RETRIEVE:
+            client.retrieve_data(server, data_id)
+        else:
+            client.delete_data(server, data_id)
+        latencies[operation].append(timer() - start)
+    total_time = timer() - total_start
+    encrypt_calls, decrypt_calls, blocks_encrypted, blocks_decrypted = (
+        after - before for after, before in zip(cipher.counters(), counters_before))
+
+    operations = {}
+    for operation, values in latencies.items():
+        values.sort()
+        operations[operation] = {'count': len(values)}
+        if values:
+            operations[operation].update(
+                {f'p{percent}_ms': percentile(values, percent) * 1000 for percent in PERCENTILES})
+    return {
+        'config': {'N': num_of_files, 'bucket_size': bucket_size, 'eviction': eviction, 'ops': num_of_ops,
+                   'seed': seed},
+        'startup': {'server_init_s': server_init, 'client_init_s': client_init},
+        'operations': operations,
+        'ops_per_sec': num_of_ops / total_time,
+        'encrypt_calls_per_op': encrypt_calls / num_of_ops,
+        'decrypt_calls_per_op': decrypt_calls / num_of_ops,
+        'blocks_encrypted_per_op': blocks_encrypted / num_of_ops,
+        'blocks_decrypted_per_op': blocks_decrypted / num_of_ops,
+        'bytes_read_per_op': (server.bytes_read - bytes_before[0]) / num_of_ops,
+        'bytes_written_per_op': (server.bytes_written - bytes_before[1]) / num_of_ops,
+        'max_stash_size': client.max_stash_size,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def config_key(result: dict) -> tuple:
+    config = result['config']
+    return config['N'], config['bucket_size'], config['eviction']
+
+
+def print_results(results: List[dict], baseline: dict | None) -> None:
+    baseline_results = {config_key(result): result for result in baseline['results']} if baseline else {}
+    print(f"{'N':>7} {'Z':>3} {'eviction':>9} {'init s':>8} {'ops/s':>9} {'store p50/p99 ms':>17} "
+          f"{'retrieve p50/p99 ms':>20} {'delete p50/p99 ms':>18} {'enc+dec/op':>11} {'KiB r/w per op':>15}")
+    for result in results:
+        config, operations = result['config'], result['operations']
+
+        def latency(operation: str) -> str:
+            measured = operations[operation]
+            return f"{measured['p50_ms']:.2f}/{measured['p99_ms']:.2f}" if measured['count'] else '-'
+
+        line = (f"{config['N']:>7} {config['bucket_size']:>3} {config['eviction']:>9} "
+                f"{result['startup']['server_init_s'] + result['startup']['client_init_s']:>8.3f} "
+                f"{result['ops_per_sec']:>9.1f} {latency(STORE):>17} {latency(RETRIEVE):>20} {latency(DELETE):>18} "
+                f"{result['encrypt_calls_per_op'] + result['decrypt_calls_per_op']:>11.1f} "
+                f"{result['bytes_read_per_op'] / 1024:>7.1f}/{result['bytes_written_per_op'] / 1024:<7.1f}")
+        previous = baseline_results.get(config_key(result))
+        if previous:
+            line += f"  ops/s {result['ops_per_sec'] / previous['ops_per_sec'] - 1:+.1%} vs baseline"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2 ** 8, 2 ** 10, 2 ** 12], help='values of N')
+    parser.add_argument('--bucket-sizes', type=int, nargs='+', default=[4, 6])
+    parser.add_argument('--evictions', nargs='+', default=[OVERFLOW_EVICTION, PATH_EVICTION],
+                        choices=[OVERFLOW_EVICTION, PATH_EVICTION])
+    parser.add_argument('--ops', type=int, default=500, help='measured operations per configuration')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='small sweep for a smoke run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare ops/sec with')
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes, args.bucket_sizes, args.ops = [2 ** 6, 2 ** 8], [4], 100
+
+    results = [run_configuration(num_of_files, bucket_size, eviction, args.ops, args.seed)
+               for num_of_files in args.sizes for bucket_size in args.bucket_sizes for eviction in args.evictions]
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            'meta': {'date': datetime.now(timezone.utc).isoformat(), 'git_revision': git_revision(),
+                     'python': platform.python_version(), 'platform': platform.platform()},
+            'results': results,
+        }
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
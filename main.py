@@ -1,13 +1,18 @@
 import sys
-from Demo import *
 
 if __name__ == '__main__':
+    if '--headless' in sys.argv[1:]:
+        # The load generator never imports the Tk demo, so it starts fast and runs without a display
+        from LoadGenerator import main
+        main([arg for arg in sys.argv[1:] if arg != '--headless'])
+        sys.exit(0)
     if len(sys.argv) != 2:
-        print("Usage: main.py <mode>")
+        print("Usage: main.py <mode> | main.py <mode> --headless [workload options, see --help]")
         sys.exit(1)
     mode = sys.argv[1]
     if mode not in ['1', '2', '3']:
         print('Invalid mode')
         sys.exit(1)
+    from Demo import Demo
     demo = Demo(int(mode))
     demo.run()
@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from Client import BUCKET_SIZE, BLOCK_SIZE, get_tree_size
+from NetworkServer import OramServer, REQUEST_HEADER, RESPONSE_HEADER, BUCKET_ID, BLOCK_POSITION, OP_INFO, \
+    OP_WRITE_PATH, OP_GET_BUCKETS, OP_WRITE_BUCKETS, OP_GET_BLOCKS, STATUS_OK, STATUS_ERROR
+from Server import Server
+
+TREE_SIZE = get_tree_size(64)
+BUCKET_BYTES = BUCKET_SIZE * BLOCK_SIZE
+
+
+async def exchange(requests):
+    """
+    Send raw requests over one connection to an OramServer and collect the status of every response.
+    """
+    server = Server(TREE_SIZE, BUCKET_SIZE, BLOCK_SIZE)
+    tcp_server = await OramServer(server).start('127.0.0.1', 0)
+    reader, writer = await asyncio.open_connection(*tcp_server.sockets[0].getsockname()[:2])
+    statuses = []
+    for request_id, (opcode, argument, payload) in enumerate(requests):
+        writer.write(REQUEST_HEADER.pack(opcode, request_id, argument, len(payload)) + payload)
+        status, _, length = RESPONSE_HEADER.unpack(await reader.readexactly(RESPONSE_HEADER.size))
+        await reader.readexactly(length)
+        statuses.append(status)
+    writer.close()
+    tcp_server.close()
+    await tcp_server.wait_closed()
+    return statuses, server
+
+
+@pytest.mark.parametrize('opcode, argument, payload', [
+    (OP_GET_BUCKETS, 0, BUCKET_ID.pack(1)[:-1]),
+    (OP_GET_BLOCKS, 0, BLOCK_POSITION.pack(1, 0)[:-1]),
+    (OP_WRITE_BUCKETS, 2, BUCKET_ID.pack(1)),
+    (OP_WRITE_BUCKETS, 2, BUCKET_ID.pack(1) + BUCKET_ID.pack(2) + bytes(BUCKET_BYTES)),
+    (OP_WRITE_BUCKETS, 1, BUCKET_ID.pack(1) + bytes(BUCKET_BYTES - 1)),
+    (OP_WRITE_PATH, TREE_SIZE - 1, bytes(BUCKET_BYTES)),
+], ids=['get-buckets', 'get-blocks', 'write-buckets-ids', 'write-buckets-count', 'write-buckets-bytes',
+        'write-path'])
+def test_truncated_payload_gets_an_error_reply(opcode, argument, payload):
+    # The connection survives the malformed request, and nothing is written
+    statuses, server = asyncio.run(exchange([(opcode, argument, payload), (OP_INFO, 0, b'')]))
+    assert statuses == [STATUS_ERROR, STATUS_OK]
+    assert all(block == bytes(BLOCK_SIZE) for bucket in server.get_buckets_by_ids(range(TREE_SIZE))
+               for block in bucket)
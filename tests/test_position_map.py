@@ -0,0 +1,57 @@
+import random
+import pytest
+from Client import Client, OVERFLOW_EVICTION, PATH_EVICTION, BUCKET_SIZE, BLOCK_SIZE, get_tree_size
+from PositionMap import RecursivePositionMap
+from RingClient import RingClient, get_ring_bucket_size
+from Server import Server
+
+
+def test_position_map_budget_requires_path_eviction():
+    # The overflow engine looks the position map up a data-dependent number of times per access
+    server = Server(get_tree_size(256), BUCKET_SIZE, BLOCK_SIZE)
+    with pytest.raises(ValueError):
+        Client(256, server, eviction=OVERFLOW_EVICTION, position_map_budget=32)
+
+
+def count_inner_accesses(client):
+    """
+    Count the accesses the client makes to its recursive position map.
+    """
+    position_map = client.position_map
+    counter = [0]
+    access, dummy_access = position_map.access, position_map.dummy_access
+
+    def counted_access(*args):
+        counter[0] += 1
+        return access(*args)
+
+    def counted_dummy_access():
+        counter[0] += 1
+        dummy_access()
+
+    position_map.access = counted_access
+    position_map.dummy_access = counted_dummy_access
+    return counter
+
+
+@pytest.mark.parametrize('client_class, bucket_size, client_args', [
+    (Client, BUCKET_SIZE, dict(eviction=PATH_EVICTION)),
+    (Client, BUCKET_SIZE, dict(eviction=PATH_EVICTION, tree_top_budget=4000)),
+    (RingClient, get_ring_bucket_size(), dict()),
+], ids=['path', 'path-tree-top', 'ring'])
+def test_one_inner_access_per_slot(client_class, bucket_size, client_args):
+    # Real and dummy slots must look alike: whatever the operation and the data, one inner access each
+    random.seed(0)
+    server = Server(get_tree_size(256), bucket_size, BLOCK_SIZE)
+    client = client_class(256, server, position_map_budget=32, **client_args)
+    assert isinstance(client.position_map, RecursivePositionMap)
+    counter = count_inner_accesses(client)
+    slots = [lambda data_id: client.store_data(server, data_id, b'data'),
+             lambda data_id: client.retrieve_data(server, data_id),
+             lambda data_id: client.delete_data(server, data_id),
+             lambda data_id: client.dummy_access(server),
+             lambda data_id: client.background_access(server)]
+    for _ in range(200):
+        counter[0] = 0
+        random.choice(slots)(random.randrange(256))
+        assert counter[0] == 1